@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from pathlib import Path
+
+from dotenv import dotenv_values, set_key
+
+# =====================================================
+# 🔐 РЕЕСТР РОЛЕЙ (ADMIN_IDS / ADMIN_DOP из .env)
+# =====================================================
+# Списки админов читаются из .env один раз и держатся в памяти (frozenset,
+# проверка роли — O(1)). Файл перечитывается, только если изменился его
+# mtime (проверка не чаще раза в секунду) или после assign/remove через
+# этот же реестр (invalidate). Правка .env руками подхватывается сама.
+# Если файла нет (локальный запуск) — берутся переменные окружения.
+
+ENV_PATH = Path(os.getenv("ENV_PATH", "/opt/ndloadouts/.env"))
+ROLES_CHECK_INTERVAL = 1.0   # сек: как часто сверять mtime
+
+
+def _parse_ids(value) -> frozenset:
+    return frozenset(x.strip() for x in (value or "").split(",") if x.strip())
+
+
+class RoleRegistry:
+    def __init__(self, path: Path = ENV_PATH, check_interval: float = ROLES_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self._admin_ids = frozenset()
+        self._admin_dop = frozenset()
+
+    def _file_mtime(self):
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        mtime = self._file_mtime()
+        if mtime is None:
+            values = os.environ
+        else:
+            values = dotenv_values(self.path)
+        self._admin_ids = _parse_ids(values.get("ADMIN_IDS"))
+        self._admin_dop = _parse_ids(values.get("ADMIN_DOP"))
+        self._mtime = mtime
+        self._loaded = True
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.check_interval:
+                return
+            if not self._loaded or self._file_mtime() != self._mtime:
+                self._load()
+            self._checked_at = now
+
+    def invalidate(self):
+        """Сбросить кэш: следующий запрос перечитает .env."""
+        with self._lock:
+            self._loaded = False
+
+    # ---------- чтение ----------
+    @property
+    def admin_ids(self) -> frozenset:
+        """Главные админы."""
+        self._refresh()
+        return self._admin_ids
+
+    @property
+    def admin_dop(self) -> frozenset:
+        """Дополнительные админы."""
+        self._refresh()
+        return self._admin_dop
+
+    def roles(self, user_id) -> tuple:
+        """(is_admin, is_super_admin) для user_id."""
+        self._refresh()
+        user_id = str(user_id or "").strip()
+        is_super_admin = user_id in self._admin_ids
+        return is_super_admin or user_id in self._admin_dop, is_super_admin
+
+    def is_admin(self, user_id) -> bool:
+        return self.roles(user_id)[0]
+
+    def is_super_admin(self, user_id) -> bool:
+        return self.roles(user_id)[1]
+
+    # ---------- запись ----------
+    def _save_dop(self, admin_dop):
+        set_key(self.path, "ADMIN_DOP", ",".join(sorted(admin_dop)))
+        os.environ["ADMIN_DOP"] = ",".join(sorted(admin_dop))
+
+    def add_dop(self, user_id: str) -> bool:
+        """Добавить доп. админа; False — уже админ."""
+        user_id = str(user_id).strip()
+        with self._lock:
+            self._load()
+            if user_id in self._admin_ids or user_id in self._admin_dop:
+                return False
+            self._save_dop(self._admin_dop | {user_id})
+            self._loaded = False
+        return True
+
+    def remove_dop(self, user_id: str) -> bool:
+        """Убрать доп. админа; False — не был доп. админом."""
+        user_id = str(user_id).strip()
+        with self._lock:
+            self._load()
+            if user_id not in self._admin_dop:
+                return False
+            self._save_dop(self._admin_dop - {user_id})
+            self._loaded = False
+        return True
+
+
+roles = RoleRegistry()
@@ -0,0 +1,57 @@
+import os
+import json
+import asyncio
+
+# =====================================================
+# 📡 ЖИВОЙ ПОТОК АНАЛИТИКИ (SSE pub/sub)
+# =====================================================
+# Запись аналитики (сброс очереди / batch-эндпоинт) публикует сюда
+# новые события и дельты счётчиков; /api/analytics/stream раздаёт их
+# подписчикам-дашбордам. Сообщение сериализуется один раз на публикацию,
+# а не на подписчика. Очередь подписчика ограничена: медленный клиент
+# теряет самые старые сообщения, а не тормозит запись.
+# Всё работает в event loop своего воркера: подписчики видят события,
+# принятые этим же процессом.
+
+ANALYTICS_STREAM_QUEUE = int(os.getenv("ANALYTICS_STREAM_QUEUE", "100"))
+ANALYTICS_STREAM_PING = float(os.getenv("ANALYTICS_STREAM_PING", "15"))   # сек
+
+
+def sse_message(kind: str, data: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class AnalyticsHub:
+    def __init__(self, max_queue: int = ANALYTICS_STREAM_QUEUE):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._stats = {"published": 0, "dropped": 0}
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, kind: str, data: dict):
+        """Разослать сообщение всем подписчикам (вызывать из event loop)."""
+        if not self._subscribers:
+            return
+        message = sse_message(kind, data)
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()   # вытесняем самое старое
+                self._stats["dropped"] += 1
+            queue.put_nowait(message)
+        self._stats["published"] += 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "subscribers": len(self._subscribers)}
+
+
+analytics_hub = AnalyticsHub()
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+
+from database import get_users
+from database_async import run_db
+from database_analytics import save_events_batch
+
+# =====================================================
+# 📥 WRITE-BEHIND ОЧЕРЕДЬ АНАЛИТИКИ
+# =====================================================
+# POST /api/analytics кладёт событие в очередь и сразу отвечает.
+# Фоновая задача сбрасывает очередь пачками (по размеру или по таймеру):
+# один executemany + слитые UPSERT'ы профилей = один commit на пачку.
+# Очередь ограничена: при переполнении событие отбрасывается и считается в dropped.
+
+ANALYTICS_QUEUE_MAX = int(os.getenv("ANALYTICS_QUEUE_MAX", "10000"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "1.0"))
+
+
+def write_events_batch(events):
+    """Синхронная запись пачки (в пуле потоков БД): имена из users (LRU-кеш) + одна транзакция."""
+    user_infos = get_users({e["user_id"] for e in events})
+    save_events_batch(events, user_infos)
+    return user_infos
+
+
+_STOP = object()  # маркер остановки в очереди
+
+
+class AnalyticsWriter:
+    def __init__(self, max_queue: int = ANALYTICS_QUEUE_MAX, batch_size: int = ANALYTICS_BATCH_SIZE,
+                 flush_interval: float = ANALYTICS_FLUSH_INTERVAL):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._task = None
+        self._closing = False
+        self._listeners = []   # listener(events, user_infos) после успешной записи пачки
+        self._stats = {"accepted": 0, "dropped": 0, "written": 0, "failed": 0, "batches": 0,
+                       "last_flush_ms": 0.0}
+
+    def submit(self, event: dict) -> bool:
+        """Положить событие в очередь. False — очередь полна, событие отброшено."""
+        if self._queue is None or self._closing:
+            self._stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["accepted"] += 1
+        return True
+
+    async def start(self):
+        if self._task is None:
+            self._closing = False
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу, дописав всё, что осталось в очереди."""
+        if self._task is None:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    def add_listener(self, listener):
+        """Подписка на записанные пачки (вызывается в event loop, должна быть быстрой)."""
+        self._listeners.append(listener)
+
+    def notify(self, events, user_infos):
+        for listener in self._listeners:
+            try:
+                listener(events, user_infos)
+            except Exception as e:
+                print(f"❌ Analytics listener error: {e}")
+
+    def stats(self) -> dict:
+        return {**self._stats, "queued": self._queue.qsize() if self._queue else 0,
+                "max_queue": self.max_queue}
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            user_infos = await run_db(write_events_batch, batch)
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+        except Exception as e:
+            self._stats["failed"] += len(batch)
+            print(f"❌ Analytics flush error: {e}")
+            return
+        finally:
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self.notify(batch, user_infos)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            # Копим пачку до batch_size или до истечения интервала
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._flush(batch)
+
+        # Shutdown: дописываем хвост очереди (submit уже не принимает новые)
+        tail = []
+        while not self._queue.empty():
+            event = self._queue.get_nowait()
+            if event is not _STOP:
+                tail.append(event)
+        for i in range(0, len(tail), self.batch_size):
+            await self._flush(tail[i:i + self.batch_size])
+
+
+analytics_writer = AnalyticsWriter()
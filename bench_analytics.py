@@ -0,0 +1,168 @@
+# =====================================================
+# ⏱ БЕНЧМАРК ЗАПРОСОВ ДАШБОРДА АНАЛИТИКИ
+# =====================================================
+# Генерирует синтетическую analytics.db на N событий (по умолчанию 1M и 10M),
+# замеряет запросы дашборда на старой схеме (без индексов), затем
+# прогоняет init_analytics_db() (миграции + роллапы) и замеряет снова.
+#
+#   python bench_analytics.py                 # 1M и 10M
+#   python bench_analytics.py 200000          # свой размер
+#   python bench_analytics.py 1000000 --keep  # не удалять временную БД
+#
+# Медианы, мс (до -> после миграций; одно ядро, SQLite 3.40):
+#                            1M события            10M событий
+#   recent_activity          3080   -> 0.09        31976  -> 0.19
+#   online_users             4.1    -> 0.00        6.7    -> 0.01
+#   users_page               5.3    -> 0.11        9.6    -> 0.19
+#   user_history             60     -> 0.02        919    -> 0.12
+#   action_last_day          79     -> 0.07        1378   -> 1.14
+#   popular_actions_legacy   468    -> 189         5991   -> 2633   (полный GROUP BY —
+#                                                  дашборд вместо него читает роллап)
+#   get_dashboard_data()             0.35                   0.41
+# Генерация 10M — ~85 с, миграция + роллапы — ~70 с.
+
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import database_analytics
+
+USERS = 50_000
+ACTIONS = ("session_start", "session_end", "view_build", "search", "open_screen",
+           "click_button", "switch_category")
+PLATFORMS = ("ios", "android", "tdesktop", "web")
+RUNS = 5
+
+# Запросы, которые дашборд выполняет по сырым таблицам
+QUERIES = {
+    "recent_activity": ("""
+        SELECT a.user_id, a.action, a.details, a.timestamp,
+               u.first_name, u.username, u.platform
+        FROM analytics a
+        LEFT JOIN user_profiles u ON a.user_id = u.user_id
+        WHERE a.user_id != 'anonymous'
+        ORDER BY a.timestamp DESC
+        LIMIT 30
+    """, ()),
+    "online_users": (
+        "SELECT COUNT(*) FROM user_profiles WHERE last_seen > ?",
+        lambda now: ((now - timedelta(minutes=2)).isoformat(),)
+    ),
+    "users_page": (
+        "SELECT * FROM user_profiles ORDER BY last_seen DESC LIMIT 50", ()
+    ),
+    "user_history": (
+        "SELECT action, timestamp FROM analytics WHERE user_id = ? ORDER BY timestamp DESC LIMIT 50",
+        ("777",)
+    ),
+    "action_last_day": (
+        "SELECT COUNT(*) FROM analytics WHERE action = 'search' AND timestamp > ?",
+        lambda now: ((now - timedelta(days=1)).isoformat(),)
+    ),
+    "popular_actions_legacy": ("""
+        SELECT action, COUNT(*) FROM analytics
+        WHERE action NOT IN ('session_start', 'session_end', 'click_button')
+        GROUP BY action ORDER BY 2 DESC LIMIT 8
+    """, ()),
+}
+
+
+def generate(path: Path, rows: int, now: datetime):
+    """Старая схема (как до миграций) + rows событий за ~90 дней."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE analytics (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+                 "action TEXT, details TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE errors (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+                 "error TEXT, details TEXT, timestamp TEXT)")
+    conn.execute("CREATE TABLE user_profiles (user_id TEXT PRIMARY KEY, first_name TEXT, username TEXT, "
+                 "last_seen TEXT, platform TEXT, total_actions INTEGER DEFAULT 0, first_seen TEXT, "
+                 "last_action TEXT)")
+
+    span = 90 * 24 * 3600
+    start = now - timedelta(seconds=span)
+    rnd = random.Random(42)
+
+    def events():
+        for i in range(rows):
+            ts = start + timedelta(seconds=span * i / rows)
+            yield (str(rnd.randrange(USERS)), rnd.choice(ACTIONS), "{}", ts.isoformat())
+
+    conn.executemany("INSERT INTO analytics (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)", events())
+    conn.executemany(
+        "INSERT INTO user_profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (str(u), f"User {u}", f"user{u}",
+             (now - timedelta(seconds=rnd.randrange(span))).isoformat(),
+             rnd.choice(PLATFORMS), rows // USERS, start.isoformat(), rnd.choice(ACTIONS))
+            for u in range(USERS)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(conn, now) -> dict:
+    result = {}
+    for name, (sql, params) in QUERIES.items():
+        args = params(now) if callable(params) else params
+        timings = []
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        result[name] = sorted(timings)[RUNS // 2]   # медиана
+    return result
+
+
+def dashboard_time() -> float:
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        database_analytics.get_dashboard_data()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[RUNS // 2]
+
+
+def bench(rows: int, keep: bool = False):
+    now = datetime.now(timezone.utc)
+    workdir = Path(tempfile.mkdtemp(prefix="bench_analytics_"))
+    path = workdir / "analytics.db"
+
+    print(f"\n=== {rows:,} событий ({path}) ===")
+    started = time.perf_counter()
+    generate(path, rows, now)
+    print(f"генерация: {time.perf_counter() - started:.1f} с")
+
+    conn = sqlite3.connect(path)
+    before = measure(conn, now)
+
+    database_analytics.ANALYTICS_DB = path
+    started = time.perf_counter()
+    database_analytics.init_analytics_db()   # миграции (индексы) + backfill роллапов
+    print(f"миграция + роллапы: {time.perf_counter() - started:.1f} с")
+
+    after = measure(conn, now)
+    conn.close()
+
+    print(f"{'запрос':<24}{'до, мс':>12}{'после, мс':>12}")
+    for name in QUERIES:
+        print(f"{name:<24}{before[name]:>12.2f}{after[name]:>12.2f}")
+    print(f"{'get_dashboard_data()':<24}{'':>12}{dashboard_time():>12.2f}")
+
+    if not keep:
+        for f in workdir.iterdir():
+            f.unlink()
+        workdir.rmdir()
+
+
+if __name__ == "__main__":
+    keep = "--keep" in sys.argv
+    sizes = [int(a) for a in sys.argv[1:] if a != "--keep"] or [1_000_000, 10_000_000]
+    for size in sizes:
+        bench(size, keep)
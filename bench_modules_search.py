@@ -0,0 +1,125 @@
+# =====================================================
+# ⏱ БЕНЧМАРК ПОИСКА МОДУЛЕЙ: LIKE '%q%' против FTS5 trigram
+# =====================================================
+# Генерирует временную builds.db с N синтетическими модулями (по умолчанию
+# 1k, 10k и 100k), прогоняет init_db() (FTS-таблица + триггеры) и сравнивает
+# прежний запрос modules_search (LIKE по en/ru, полный проход) с новым
+# database.modules_search (FTS5 + ранжирование + нечёткий добор).
+#
+#   python bench_modules_search.py               # 1k, 10k, 100k
+#   python bench_modules_search.py 50000 --keep  # свой размер, не удалять БД
+
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import database
+import database_pool
+
+RUNS = 7
+TYPES = ("assault", "battle", "pp", "drobovik", "pulemet", "pehotnye", "snayperki", "pistol", "special")
+CATEGORIES = ("Дульный срез", "Ствол", "Лазер", "Прицел", "Приклад", "Подствольник", "Магазин", "Рукоять")
+EN_WORDS = ("flash", "hider", "suppressor", "long", "short", "barrel", "tactical", "laser", "red", "dot",
+            "sight", "stock", "grip", "vertical", "angled", "extended", "mag", "drum", "compensator", "heavy")
+RU_WORDS = ("пламегаситель", "глушитель", "длинный", "короткий", "ствол", "тактический", "лазер", "красный",
+            "прицел", "приклад", "рукоять", "вертикальная", "угловая", "увеличенный", "магазин", "барабанный",
+            "компенсатор", "тяжёлый", "облегчённый", "штурмовой")
+
+# Уникальная часть названия (производитель/модель), как у реальных модулей:
+# частые слова выше встречаются в тысячах строк, «бренд» — в единицах.
+SYLLABLES = ("ka", "ro", "vex", "tor", "lin", "mar", "zen", "dri", "ost", "bel", "qua", "sy", "nor", "gal", "te")
+RU_SYLLABLES = ("ка", "ро", "век", "тор", "лин", "мар", "зен", "дри", "ост", "бел", "ква", "си", "нор", "гал", "те")
+
+
+def brand(rnd: random.Random, syllables) -> str:
+    return "".join(rnd.choice(syllables) for _ in range(3))
+
+
+# (запрос, weapon_type): частое слово, редкий бренд, ru с середины слова,
+# опечатки, короткий префикс
+CASES = (
+    ("suppressor", None),
+    ("vextorlin", None),
+    ("векторлин", None),
+    ("глушит", None),
+    ("гаситель", "assault"),
+    ("supresor", None),
+    ("vextorlen", None),
+    ("пламегоситель", None),
+    ("ст", "pp"),
+)
+
+LIKE_SQL = """
+    SELECT id, weapon_type, category, en, ru, pos
+    FROM weapon_modules
+    WHERE (en LIKE ? OR ru LIKE ?) {type_filter}
+    ORDER BY category, pos, ru
+    LIMIT 50
+"""
+
+
+def generate(rows: int):
+    rnd = random.Random(42)
+    seen = set()
+    with database.get_conn() as conn:
+        batch = []
+        while len(batch) < rows:
+            weapon_type = rnd.choice(TYPES)
+            category = rnd.choice(CATEGORIES)
+            en = f"{brand(rnd, SYLLABLES).capitalize()} " + " ".join(rnd.sample(EN_WORDS, 2)) + f" {rnd.randrange(1000)}"
+            if (weapon_type, category, en) in seen:
+                continue
+            seen.add((weapon_type, category, en))
+            ru = (brand(rnd, RU_SYLLABLES) + " " + " ".join(rnd.sample(RU_WORDS, 2))).capitalize()
+            batch.append((weapon_type, category, en, ru, rnd.randrange(20)))
+        conn.executemany(
+            "INSERT INTO weapon_modules (weapon_type, category, en, ru, pos) VALUES (?, ?, ?, ?, ?)", batch
+        )
+
+
+def median_ms(fn) -> tuple[float, int]:
+    timings, count = [], 0
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        count = len(fn())
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[RUNS // 2], count
+
+
+def bench(rows: int, keep: bool = False):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_modules_"))
+    database.DB_PATH = workdir / "builds.db"
+    print(f"\n=== {rows:,} модулей ({database.DB_PATH}) ===")
+
+    database.init_db()
+    started = time.perf_counter()
+    generate(rows)   # FTS-индекс заполняют триггеры
+    print(f"генерация (с триггерами FTS): {time.perf_counter() - started:.1f} с")
+
+    conn = sqlite3.connect(database.DB_PATH)
+    print(f"{'запрос':<28}{'LIKE, мс':>10}{'найдено':>9}{'FTS, мс':>10}{'найдено':>9}")
+    for query, weapon_type in CASES:
+        like = f"%{query}%"
+        sql = LIKE_SQL.format(type_filter="AND weapon_type = ?" if weapon_type else "")
+        params = (like, like, weapon_type) if weapon_type else (like, like)
+        like_ms, like_count = median_ms(lambda: conn.execute(sql, params).fetchall())
+        fts_ms, fts_count = median_ms(lambda: database.modules_search(query, weapon_type, 50))
+        label = f"{query}" + (f" [{weapon_type}]" if weapon_type else "")
+        print(f"{label:<28}{like_ms:>10.2f}{like_count:>9}{fts_ms:>10.2f}{fts_count:>9}")
+    conn.close()
+
+    database_pool.close_all()   # перед удалением временной БД
+    if not keep:
+        for f in workdir.iterdir():
+            f.unlink()
+        workdir.rmdir()
+
+
+if __name__ == "__main__":
+    keep = "--keep" in sys.argv
+    sizes = [int(a) for a in sys.argv[1:] if a != "--keep"] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        bench(size, keep)
@@ -1,5 +1,4 @@
 import os
-import sqlite3
 import asyncio
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, F
@@ -13,14 +12,14 @@ from aiogram.types import (
 from aiogram import BaseMiddleware, Router
 from aiogram.exceptions import TelegramBadRequest
 from typing import Callable, Awaitable, Dict, Any
-from database import save_user, init_db
+from database import save_user, init_db, get_user, set_user_verified
+from admin_roles import roles, ENV_PATH
 
 # --- env ---
-load_dotenv("/opt/ndloadouts/.env")
+load_dotenv(ENV_PATH)
 BOT_TOKEN = os.getenv("TOKEN")
 WEBAPP_URL = os.getenv("WEBAPP_URL")
 CHANNEL_ID = int(os.getenv("CHANNEL_ID", "-1001990222164"))  # обязательно со знаком минус
-DB_PATH = "/opt/ndloadouts_storage/builds.db"
 
 if not BOT_TOKEN or not WEBAPP_URL:
     raise ValueError("❌ BOT_TOKEN и WEBAPP_URL должны быть заданы в .env")
@@ -79,18 +78,15 @@ async def whoami(message: Message):
 async def check_my_rights(message: Message):
     user_id = str(message.from_user.id)
     
-    # Получаем оба списка админов
-    admin_ids = os.getenv("ADMIN_IDS", "").split(",")
-    admin_dop = os.getenv("ADMIN_DOP", "").split(",")
-    
-    # Объединяем и очищаем от пустых значений
-    all_admins = [admin.strip() for admin in admin_ids + admin_dop if admin.strip()]
-    
-    is_super_admin = user_id in [admin.strip() for admin in admin_ids if admin.strip()]
-    is_admin = user_id in all_admins
-    
+    # Реестр сам перечитает .env, если списки поменялись
+    is_admin, is_super_admin = roles.roles(user_id)
+    admin_ids, admin_dop = sorted(roles.admin_ids), sorted(roles.admin_dop)
+
+    profile = get_user(user_id)
+    name = profile["first_name"] if profile else "нет в базе"
+
     rights_info = f"""
-👤 Ваш ID: {user_id}
+👤 Ваш ID: {user_id} ({name})
 🔐 Права администратора: {'✅ ДА' if is_admin else '❌ НЕТ'}
 🎯 Супер-админ: {'✅ ДА' if is_super_admin else '❌ НЕТ'}
 📊 Доступ к аналитике: {'✅ ДА' if is_admin else '❌ НЕТ'}
@@ -126,14 +122,7 @@ async def start_handler(message: Message):
     subscribed = await is_subscribed(user_id)
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT OR IGNORE INTO users(id, first_name, username, verified) VALUES(?, ?, ?, 0)",
-                (str(user_id), message.from_user.first_name or "", message.from_user.username or "")
-            )
-            cur.execute("UPDATE users SET verified = ? WHERE id = ?", (1 if subscribed else 0, str(user_id)))
-            conn.commit()
+        set_user_verified(str(user_id), message.from_user.first_name or "", message.from_user.username or "", subscribed)
     except Exception as e:
         print(f"[DB ERROR] {e}")
 
@@ -168,10 +157,7 @@ async def recheck_subscription(callback: CallbackQuery):
     print(f"[DEBUG] recheck | user_id={user_id} | subscribed={subscribed}")
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("UPDATE users SET verified = ? WHERE id = ?", (1 if subscribed else 0, str(user_id)))
-            conn.commit()
+        set_user_verified(str(user_id), callback.from_user.first_name or "", callback.from_user.username or "", subscribed)
     except Exception as e:
         print(f"[DB ERROR] {e}")
 
@@ -201,14 +187,7 @@ async def recheck_subscription(callback: CallbackQuery):
 
 @router.message(F.text == "/analytics")
 async def analytics_cmd(message: Message):
-    # Получаем оба списка админов
-    admin_ids = os.getenv("ADMIN_IDS", "").split(",")
-    admin_dop = os.getenv("ADMIN_DOP", "").split(",")
-    
-    # Объединяем и очищаем от пустых значений
-    all_admins = [admin.strip() for admin in admin_ids + admin_dop if admin.strip()]
-    
-    if str(message.from_user.id) not in all_admins:
+    if not roles.is_admin(message.from_user.id):
         await message.answer("🚫 У тебя нет доступа к аналитике.")
         return
 
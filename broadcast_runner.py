@@ -0,0 +1,110 @@
+import os
+import uuid
+import asyncio
+
+from database_async import run_db
+from database_broadcast import (
+    BROADCAST_HEARTBEAT_SECONDS, claim_next_job, claim_recipients, record_broadcast_result, release_job, renew_lease,
+)
+from telegram_sender import TelegramSender
+
+# =====================================================
+# 🏃 ФОНОВЫЙ ИСПОЛНИТЕЛЬ РАССЫЛОК
+# =====================================================
+# Берёт задания из broadcast_jobs и отправляет порциями через TelegramSender.
+# Каждый результат сразу пишется в БД, поэтому после рестарта/деплоя задание
+# продолжается с оставшихся pending-получателей (см. database_broadcast).
+# При остановке дожидается уже начатых отправок и снимает аренду задания.
+# Пока задание в работе, heartbeat продлевает аренду: ожидания 429 retry_after
+# и сетевой бэкофф внутри порции могут быть дольше BROADCAST_LEASE_SECONDS.
+
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", "20"))
+BROADCAST_IDLE_POLL = 5.0   # сек: проверка новых заданий (и заданий упавших воркеров)
+
+
+class BroadcastRunner:
+    def __init__(self, chunk: int = BROADCAST_CHUNK):
+        self.chunk = chunk
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._task = None
+        self._wake = None
+        self._stopping = False
+        self.current_job = None
+
+    def wake(self):
+        """Появилось новое задание — не ждать следующего опроса."""
+        if self._wake:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 15.0):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # Недописанные строки останутся в sending и будут помечены failed — не переотправятся
+            self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                job = await run_db(claim_next_job, self.owner)
+                if job:
+                    await self._process(job)
+                    continue
+            except Exception as e:
+                print(f"❌ Broadcast runner error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), BROADCAST_IDLE_POLL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _process(self, job: dict):
+        token = os.getenv("TOKEN")
+        if not token:
+            print("❌ Broadcast: токен бота не настроен")
+            await run_db(release_job, job["id"], self.owner)
+            await asyncio.sleep(BROADCAST_IDLE_POLL)
+            return
+
+        self.current_job = job["id"]
+
+        async def record(result):
+            await run_db(record_broadcast_result, job["id"], self.owner, result.chat_id, result.ok, result.error)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            async with TelegramSender(token) as sender:
+                while not self._stopping and not heartbeat.done():
+                    chat_ids = await run_db(claim_recipients, job["id"], self.owner, self.chunk)
+                    if not chat_ids:
+                        break
+                    await sender.send_many(chat_ids, job["message"], on_result=record)
+        finally:
+            heartbeat.cancel()
+            self.current_job = None
+            await run_db(release_job, job["id"], self.owner)
+
+    async def _heartbeat(self, job_id: int):
+        """Продлевать аренду, пока задание в работе; выход — аренда потеряна."""
+        while True:
+            await asyncio.sleep(BROADCAST_HEARTBEAT_SECONDS)
+            try:
+                if not await run_db(renew_lease, job_id, self.owner):
+                    print(f"⚠️ Broadcast {job_id}: аренда потеряна")
+                    return
+            except Exception as e:
+                print(f"❌ Broadcast heartbeat error: {e}")
+
+
+broadcast_runner = BroadcastRunner()
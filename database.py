@@ -1,8 +1,16 @@
+import ast
 import sqlite3
 import json
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from contextlib import contextmanager
+
+from database_pool import pooled_connection
+from search_fts import (
+    MIN_QUERY, FUZZY_MIN_SIMILARITY, normalize_query, fts_phrase, fts_fuzzy, similarity, prefix_hit,
+    build_module_names,
+)
 
 DB_PATH = Path("/opt/ndloadouts_storage/builds.db")
 DB_PATH.parent.mkdir(exist_ok=True)
@@ -11,22 +19,9 @@ DB_PATH.parent.mkdir(exist_ok=True)
 # Общие утилиты для SQLite
 # ========================
 
-@contextmanager
 def get_conn(row_mode: bool = False):
-    conn = sqlite3.connect(DB_PATH)
-    if row_mode:
-        conn.row_factory = sqlite3.Row
-    try:
-        # Включим внешние ключи и WAL (однократно; если уже стоит — ок)
-        conn.execute("PRAGMA foreign_keys = ON")
-        try:
-            conn.execute("PRAGMA journal_mode = WAL")
-        except sqlite3.DatabaseError:
-            pass
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+    # Соединение потока из общего пула (WAL/foreign_keys и прочие PRAGMA — один раз при открытии)
+    return pooled_connection(DB_PATH, row_mode)
 
 # ========================
 # ИНИЦИАЛИЗАЦИЯ БАЗЫ
@@ -48,16 +43,46 @@ def init_db():
                 tabs_json TEXT,
                 image TEXT,
                 date TEXT,
-                categories TEXT
+                categories TEXT,
+                sort_date TEXT DEFAULT '',   -- date в ISO (YYYY-MM-DD) для ORDER BY
+                top_rank INTEGER DEFAULT 999 -- 1/2/3 по top1/top2/top3, иначе 999
             )
         """)
 
+        # Категории сборок (нормализованно, для индексного фильтра)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS build_categories (
+                build_id INTEGER NOT NULL REFERENCES builds(id) ON DELETE CASCADE,
+                category TEXT NOT NULL,
+                PRIMARY KEY (category, build_id)
+            ) WITHOUT ROWID
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS bcat_build ON build_categories(build_id)")
+
+        # Журнал изменений сборок (ревизия каталога для ETag / ?since=)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS build_changes (
+                revision   INTEGER PRIMARY KEY AUTOINCREMENT,
+                build_id   INTEGER NOT NULL,
+                deleted    INTEGER NOT NULL DEFAULT 0,
+                changed_at TEXT
+            )
+        """)
+        # Базовая ревизия для уже существующих сборок (один раз, на пустом журнале)
+        c.execute("""
+            INSERT INTO build_changes (build_id, deleted, changed_at)
+            SELECT id, 0, ? FROM builds
+            WHERE NOT EXISTS (SELECT 1 FROM build_changes)
+            ORDER BY id
+        """, (datetime.now().isoformat(),))
+
         # Пользователи
         c.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id TEXT PRIMARY KEY,
                 first_name TEXT,
-                username TEXT
+                username TEXT,
+                verified INTEGER DEFAULT 0   -- подписка на канал (ставит бот)
             )
         """)
 
@@ -85,8 +110,29 @@ def init_db():
         c.execute("CREATE INDEX IF NOT EXISTS wm_idx ON weapon_modules(weapon_type, category)")
         # При желании можно сделать кейс-инсенситивность для en через COLLATE NOCASE на уровне таблицы.
 
+        init_modules_fts(conn)
+        init_modules_revisions(conn)
+        init_builds_fts(conn)
+
+    add_verified_column_if_not_exists()
+    migrate_build_sorting()
+
 # ====== СБОРКИ ======
 
+def _build_from_row(row_dict):
+    return {
+        "id": row_dict["id"],
+        "title": row_dict["title"],
+        "weapon_type": row_dict["weapon_type"],
+        "top1": row_dict["top1"],
+        "top2": row_dict["top2"],
+        "top3": row_dict["top3"],
+        "tabs": json.loads(row_dict.get("tabs_json") or "[]"),
+        "image": row_dict.get("image"),
+        "date": row_dict.get("date"),
+        "categories": json.loads(row_dict.get("categories") or "[]")
+    }
+
 def get_all_builds():
     with get_conn() as conn:
         c = conn.cursor()
@@ -94,22 +140,194 @@ def get_all_builds():
         rows = c.fetchall()
         columns = [desc[0] for desc in c.description]
 
-    builds = []
+    return [_build_from_row(dict(zip(columns, row))) for row in rows]
+
+# ====== РЕВИЗИЯ КАТАЛОГА / ДЕЛЬТА ======
+
+def record_build_change(conn, build_id, deleted: bool = False) -> int:
+    """
+    Пишет строку в журнал build_changes в рамках переданного соединения
+    (той же транзакции, что и само изменение). Возвращает новую ревизию.
+    """
+    cur = conn.execute(
+        "INSERT INTO build_changes (build_id, deleted, changed_at) VALUES (?, ?, ?)",
+        (int(build_id), 1 if deleted else 0, datetime.now().isoformat())
+    )
+    return cur.lastrowid
+
+def get_builds_revision() -> int:
+    with get_conn() as conn:
+        row = conn.execute("SELECT COALESCE(MAX(revision), 0) FROM build_changes").fetchone()
+    return int(row[0])
+
+def get_builds_changes(since: int, category: str = "all"):
+    """
+    Дельта каталога после ревизии since:
+    {revision, upserted: [сборки], deleted: [id]}.
+    Сборка, которая ушла из категории, тоже попадает в deleted.
+    """
+    with get_conn() as conn:
+        revision = conn.execute("SELECT COALESCE(MAX(revision), 0) FROM build_changes").fetchone()[0]
+        changed_ids = [r[0] for r in conn.execute(
+            "SELECT DISTINCT build_id FROM build_changes WHERE revision > ?", (int(since),)
+        )]
+        rows = []
+        columns = []
+        if changed_ids:
+            placeholders = ",".join("?" * len(changed_ids))
+            c = conn.execute(f"SELECT * FROM builds WHERE id IN ({placeholders})", changed_ids)
+            rows = c.fetchall()
+            columns = [desc[0] for desc in c.description]
+
+    upserted = []
     for row in rows:
-        row_dict = dict(zip(columns, row))
-        builds.append({
-            "id": row_dict["id"],
-            "title": row_dict["title"],
-            "weapon_type": row_dict["weapon_type"],
-            "top1": row_dict["top1"],
-            "top2": row_dict["top2"],
-            "top3": row_dict["top3"],
-            "tabs": json.loads(row_dict.get("tabs_json") or "[]"),
-            "image": row_dict.get("image"),
-            "date": row_dict.get("date"),
-            "categories": json.loads(row_dict.get("categories") or "[]")
-        })
-    return builds
+        b = _build_from_row(dict(zip(columns, row)))
+        if category == "all" or category in (b.get("categories") or []):
+            upserted.append(b)
+    alive = {b["id"] for b in upserted}
+    deleted = [b_id for b_id in changed_ids if b_id not in alive]
+    return {"revision": int(revision), "upserted": upserted, "deleted": deleted}
+
+# ====== СНАПШОТ СПИСКА СБОРОК (кеш для GET /api/builds) ======
+# Список собирается один раз: SELECT + json.loads + сортировка, затем
+# каждая категория сериализуется в готовые байты. Снапшот валиден, пока
+# не сдвинулась ревизия build_changes — журнал общий для всех воркеров
+# uvicorn, поэтому запись в соседнем процессе сбрасывает кеш и здесь.
+# Попадание в кеш стоит одного MAX(revision), без JSON-работы.
+
+_builds_lock = threading.Lock()
+_builds_generation = 0          # растёт при каждой записи в builds этого процесса
+_builds_json = {}               # category -> (ревизия, bytes)
+
+
+def _build_top_rank(data) -> int:
+    if data.get("top1"): return 1
+    if data.get("top2"): return 2
+    if data.get("top3"): return 3
+    return 999
+
+
+def _build_sort_date(date_str) -> str:
+    """Дата сборки (dd.mm.yyyy / yyyy-mm-dd / yyyy.mm.dd) -> ISO, '' если не распознана."""
+    s = (date_str or "").strip()
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d", "%Y.%m.%d"):
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
+        except Exception:
+            continue
+    return ""
+
+
+def _parse_categories(raw) -> list:
+    """categories из БД: JSON, либо старый формат str(list) из прежних версий."""
+    if isinstance(raw, list):
+        return raw
+    try:
+        cats = json.loads(raw or "[]")
+    except Exception:
+        try:
+            cats = ast.literal_eval(raw)
+        except Exception:
+            cats = []
+    return cats if isinstance(cats, list) else []
+
+
+def _sync_build_categories(conn, build_id, categories):
+    conn.execute("DELETE FROM build_categories WHERE build_id = ?", (build_id,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO build_categories (build_id, category) VALUES (?, ?)",
+        [(build_id, str(cat)) for cat in categories]
+    )
+
+
+# Категории, которые может носить только одна сборка одновременно
+UNIQUE_CATEGORIES = ("Новинки", "Популярное")
+
+
+def _release_unique_categories(conn, build_id, categories):
+    """
+    Снимает уникальные категории из categories со всех остальных сборок.
+    Работает через build_categories + json_each в той же транзакции, что и запись.
+    """
+    for cat in UNIQUE_CATEGORIES:
+        if cat not in categories:
+            continue
+        holders = [r[0] for r in conn.execute(
+            "SELECT build_id FROM build_categories WHERE category = ? AND build_id != ?",
+            (cat, build_id)
+        )]
+        if not holders:
+            continue
+        placeholders = ",".join("?" * len(holders))
+        conn.execute(f"""
+            UPDATE builds
+            SET categories = (
+                SELECT json_group_array(value) FROM json_each(builds.categories) WHERE value != ?
+            )
+            WHERE id IN ({placeholders})
+        """, (cat, *holders))
+        conn.execute(
+            "DELETE FROM build_categories WHERE category = ? AND build_id != ?",
+            (cat, build_id)
+        )
+        for holder_id in holders:
+            record_build_change(conn, holder_id)
+
+
+def get_builds(category: str = "all"):
+    """
+    Сборки категории одним индексным запросом:
+    1) top1/top2/top3 приоритет, 2) свежесть даты (по убыванию).
+    """
+    order = "ORDER BY b.top_rank, b.sort_date DESC, b.id DESC"
+    with get_conn() as conn:
+        if category == "all":
+            c = conn.execute(f"SELECT b.* FROM builds b {order}")
+        else:
+            c = conn.execute(f"""
+                SELECT b.* FROM build_categories bc
+                JOIN builds b ON b.id = bc.build_id
+                WHERE bc.category = ?
+                {order}
+            """, (category,))
+        rows = c.fetchall()
+        columns = [desc[0] for desc in c.description]
+    return [_build_from_row(dict(zip(columns, row))) for row in rows]
+
+
+def invalidate_builds_cache():
+    """Сбросить снапшот списка сборок (вызывается всеми записями в builds)."""
+    global _builds_generation
+    with _builds_lock:
+        _builds_generation += 1
+        _builds_json.clear()
+
+
+def get_builds_snapshot(category: str = "all") -> tuple[int, bytes]:
+    """
+    (ревизия каталога, готовый JSON в bytes) для списка сборок категории:
+    1) top1/top2/top3 приоритет, 2) свежесть даты (по убыванию).
+    """
+    # Ревизию читаем до строк: если запись проскочит между запросами,
+    # клиент просто получит её ещё раз в следующей дельте, а снапшот
+    # пересоберётся на следующем запросе.
+    revision = get_builds_revision()
+    with _builds_lock:
+        cached = _builds_json.get(category)
+        if cached is not None and cached[0] == revision:
+            return cached
+        generation = _builds_generation
+
+    builds = get_builds(category)
+    payload = json.dumps(builds, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    with _builds_lock:
+        # Пока считали, могла пройти запись — такой снапшот не сохраняем.
+        # category приходит из запроса: пустой результат (несуществующая
+        # категория) не кешируем, иначе любой ?category= занимал бы память.
+        if generation == _builds_generation and (builds or category == "all"):
+            _builds_json[category] = (revision, payload)
+    return revision, payload
 
 def add_build(data):
     tabs = data.get("tabs") or []
@@ -121,10 +339,13 @@ def add_build(data):
         categories = ["all"]
 
     with get_conn() as conn:
+        # IMMEDIATE: параллельные правки админов не перемешаются со снятием уникальных категорий
+        conn.execute("BEGIN IMMEDIATE")
         c = conn.cursor()
         c.execute("""
-            INSERT INTO builds (title, weapon_type, top1, top2, top3, tabs_json, image, date, categories)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO builds (title, weapon_type, top1, top2, top3, tabs_json, image, date, categories,
+                                sort_date, top_rank)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             data["title"],
             data["weapon_type"],
@@ -134,14 +355,25 @@ def add_build(data):
             json.dumps(tabs, ensure_ascii=False),
             data.get("image"),
             data.get("date"),
-            json.dumps(categories, ensure_ascii=False)
+            json.dumps(categories, ensure_ascii=False),
+            _build_sort_date(data.get("date")),
+            _build_top_rank(data)
         ))
+        _sync_build_categories(conn, c.lastrowid, categories)
+        _release_unique_categories(conn, c.lastrowid, categories)
+        record_build_change(conn, c.lastrowid)
+        _reindex_builds(conn, "id = ?", (c.lastrowid,))
+    invalidate_builds_cache()
 
 def delete_build_by_id(build_id: str):
     with get_conn() as conn:
         conn.execute("DELETE FROM builds WHERE id = ?", (build_id,))
+        record_build_change(conn, build_id, deleted=True)
+        _unindex_build(conn, build_id)
+    invalidate_builds_cache()
 
-def update_build_by_id(build_id, data):
+def update_build_by_id(build_id, data) -> int:
+    """Обновить сборку; возвращает число изменённых строк (0 — сборки нет)."""
     tabs = data.get("tabs") or []
     if not isinstance(tabs, list):
         tabs = []
@@ -151,9 +383,11 @@ def update_build_by_id(build_id, data):
         categories = ["all"]
 
     with get_conn() as conn:
-        conn.execute("""
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute("""
             UPDATE builds
-            SET title = ?, weapon_type = ?, top1 = ?, top2 = ?, top3 = ?, tabs_json = ?, date = ?, categories = ?
+            SET title = ?, weapon_type = ?, top1 = ?, top2 = ?, top3 = ?, tabs_json = ?, date = ?, categories = ?,
+                sort_date = ?, top_rank = ?
             WHERE id = ?
         """, (
             data["title"],
@@ -164,11 +398,184 @@ def update_build_by_id(build_id, data):
             json.dumps(tabs, ensure_ascii=False),
             data.get("date", ""),
             json.dumps(categories, ensure_ascii=False),
+            _build_sort_date(data.get("date", "")),
+            _build_top_rank(data),
             build_id
         ))
+        if not cur.rowcount:
+            return 0   # нет такой сборки: ни категорий, ни записи в журнале
+        _sync_build_categories(conn, build_id, categories)
+        _release_unique_categories(conn, int(build_id), categories)
+        record_build_change(conn, build_id)
+        _reindex_builds(conn, "id = ?", (build_id,))
+    invalidate_builds_cache()
+    return cur.rowcount
+
+# ====== ПОИСК СБОРОК (FTS5 trigram: название, тип, модули) ======
+# builds_fts — обычная FTS-таблица, rowid = builds.id. Текст модулей собирается
+# из top1..3 и tabs_json вместе с ru-названиями из weapon_modules, поэтому
+# триггер его не посчитает: индекс обновляют сами функции записи в той же
+# транзакции, а правки справочника модулей переиндексируют сборки своего типа.
+
+BUILDS_SEARCH_WEIGHTS = (10.0, 1.0, 2.0)   # bm25: title, weapon_type, modules
+
+
+def init_builds_fts(conn):
+    try:
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'builds_fts'"
+        ).fetchone() is None
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS builds_fts USING fts5(
+                title, weapon_type, modules, tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ builds_fts недоступна: {e}")
+        return
+    if created:
+        _reindex_builds(conn)
+
+
+def _reindex_builds(conn, where: str = "", params=()):
+    """Пересчитать строки builds_fts для сборок, подходящих под where (все — без where)."""
+    rows = conn.execute(
+        f"SELECT id, title, weapon_type, top1, top2, top3, tabs_json FROM builds {'WHERE ' + where if where else ''}",
+        params
+    ).fetchall()
+    ru_by_type = {}
+    docs = []
+    for build_id, title, weapon_type, top1, top2, top3, tabs_json in rows:
+        if weapon_type not in ru_by_type:
+            ru_by_type[weapon_type] = {
+                normalize_query(en): ru for en, ru in conn.execute(
+                    "SELECT en, ru FROM weapon_modules WHERE weapon_type = ?", (weapon_type,)
+                )
+            }
+        try:
+            tabs = json.loads(tabs_json or "[]")
+        except ValueError:
+            tabs = []
+        names = build_module_names({"top1": top1, "top2": top2, "top3": top3, "tabs": tabs})
+        ru_names = [ru_by_type[weapon_type][n] for n in names if ru_by_type[weapon_type].get(n)]
+        modules = "; ".join(names + [normalize_query(ru) for ru in ru_names])
+        docs.append((build_id, normalize_query(title), normalize_query(weapon_type), modules))
+    try:
+        conn.executemany("DELETE FROM builds_fts WHERE rowid = ?", [(d[0],) for d in docs])
+        conn.executemany("INSERT INTO builds_fts(rowid, title, weapon_type, modules) VALUES (?, ?, ?, ?)", docs)
+    except sqlite3.OperationalError:
+        pass   # без FTS5 поиск идёт LIKE по названию
+
+
+def _unindex_build(conn, build_id):
+    try:
+        conn.execute("DELETE FROM builds_fts WHERE rowid = ?", (build_id,))
+    except sqlite3.OperationalError:
+        pass
+
+
+def builds_search(query: str, category: str = "all", weapon_type: str | None = None,
+                  limit: int = 20, offset: int = 0) -> tuple[int, list]:
+    """
+    (всего найдено, страница сборок) по названию, типу и модулям (en и ru).
+    Ранжирование: bm25 с весом названия выше модулей, затем обычный порядок
+    каталога (top1/top2/top3, дата). Запросы < 3 символов — LIKE по началу слова.
+    """
+    query = normalize_query(query)
+    if not query:
+        return 0, []
+    joins, join_params, filters, filter_params = "", (), [], ()
+    if category != "all":
+        joins = "JOIN build_categories bc ON bc.build_id = b.id AND bc.category = ?"
+        join_params = (category,)
+    if weapon_type:
+        filters.append("b.weapon_type = ?")
+        filter_params = (weapon_type,)
+    catalog_order = "b.top_rank, b.sort_date DESC, b.id DESC"
+
+    if len(query) < MIN_QUERY:
+        match = "(f.title LIKE ? OR f.title LIKE ? OR f.modules LIKE ? OR f.modules LIKE ?)"
+        match_params = (f"{query}%", f"% {query}%", f"{query}%", f"% {query}%")
+        order = catalog_order
+    else:
+        match = "builds_fts MATCH ?"
+        match_params = (fts_phrase(query),)
+        order = f"bm25(builds_fts, {', '.join(map(str, BUILDS_SEARCH_WEIGHTS))}), {catalog_order}"
+
+    with get_conn(row_mode=True) as conn:
+        try:
+            base = f"FROM builds_fts f JOIN builds b ON b.id = f.rowid {joins} WHERE {' AND '.join([match] + filters)}"
+            params = (*join_params, *match_params, *filter_params)
+            total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        except sqlite3.OperationalError:
+            # SQLite без FTS5 — подстрока в названии
+            base = f"FROM builds b {joins} WHERE {' AND '.join(['b.title LIKE ?'] + filters)}"
+            params = (*join_params, f"%{query}%", *filter_params)
+            order = catalog_order
+            total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT b.* {base} ORDER BY {order} LIMIT ? OFFSET ?", (*params, limit, offset)
+        ).fetchall() if total > offset else []
+    return int(total), [_build_from_row(dict(r)) for r in rows]
 
 # ====== ПОЛЬЗОВАТЕЛИ ======
 
+# LRU-кеш профилей (id -> {id, first_name, username}); сбрасывается записью пользователя
+USER_CACHE_SIZE = 10000
+_users_cache = OrderedDict()
+_users_lock = threading.Lock()
+
+
+def invalidate_user(user_id):
+    with _users_lock:
+        _users_cache.pop(str(user_id), None)
+
+
+def _remember_users(users):
+    with _users_lock:
+        for user in users:
+            _users_cache[user["id"]] = user
+            _users_cache.move_to_end(user["id"])
+        while len(_users_cache) > USER_CACHE_SIZE:
+            _users_cache.popitem(last=False)
+
+
+def get_users(user_ids) -> dict:
+    """
+    Профили по списку id: {id: {id, first_name, username}} (неизвестные id отсутствуют).
+    Промахи кеша добираются одним запросом по первичному ключу.
+    """
+    ids = {str(u) for u in user_ids if u is not None}
+    found, missing = {}, []
+    with _users_lock:
+        for user_id in ids:
+            user = _users_cache.get(user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                _users_cache.move_to_end(user_id)
+                found[user_id] = user
+
+    if missing:
+        loaded = []
+        with get_conn() as conn:
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT id, first_name, username FROM users WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                loaded.extend({"id": r[0], "first_name": r[1], "username": r[2]} for r in rows)
+        _remember_users(loaded)
+        found.update((u["id"], u) for u in loaded)
+    return found
+
+
+def get_user(user_id):
+    """Профиль пользователя {id, first_name, username} или None."""
+    return get_users([user_id]).get(str(user_id))
+
+
 def save_user(user_id: str, first_name: str, username: str = ""):
     with get_conn() as conn:
         conn.execute("""
@@ -178,6 +585,20 @@ def save_user(user_id: str, first_name: str, username: str = ""):
                 first_name = excluded.first_name,
                 username = excluded.username
         """, (user_id, first_name, username))
+    invalidate_user(user_id)
+
+def set_user_verified(user_id: str, first_name: str, username: str, verified: bool):
+    """
+    Отметка подписки на канал из бота: создаёт пользователя, если его нет
+    (имя существующего не трогает), и выставляет verified.
+    """
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO users (id, first_name, username, verified) VALUES (?, ?, ?, 0)",
+            (user_id, first_name, username)
+        )
+        conn.execute("UPDATE users SET verified = ? WHERE id = ?", (1 if verified else 0, user_id))
+    invalidate_user(user_id)
 
 def get_all_users():
     with get_conn() as conn:
@@ -197,7 +618,19 @@ def add_date_column_if_not_exists():
 def fill_empty_dates():
     today = datetime.now().strftime('%Y-%m-%d')
     with get_conn() as conn:
-        conn.execute("UPDATE builds SET date = ? WHERE date IS NULL OR date = ''", (today,))
+        ids = [r[0] for r in conn.execute("SELECT id FROM builds WHERE date IS NULL OR date = ''")]
+        conn.execute("UPDATE builds SET date = ?, sort_date = ? WHERE date IS NULL OR date = ''", (today, today))
+        for build_id in ids:
+            record_build_change(conn, build_id)
+    invalidate_builds_cache()
+
+def add_verified_column_if_not_exists():
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("PRAGMA table_info(users)")
+        columns = [col[1] for col in c.fetchall()]
+        if "verified" not in columns:
+            c.execute("ALTER TABLE users ADD COLUMN verified INTEGER DEFAULT 0")
 
 def add_categories_column_if_not_exists():
     with get_conn() as conn:
@@ -207,6 +640,39 @@ def add_categories_column_if_not_exists():
         if "categories" not in columns:
             c.execute("ALTER TABLE builds ADD COLUMN categories TEXT DEFAULT '[]'")
 
+def migrate_build_sorting():
+    """
+    Колонки sort_date/top_rank, таблица build_categories и индексы сортировки.
+    Бэкфилл идёт по строкам со смешанными форматами date и старым str(list)
+    в categories (categories при этом переписываются в JSON).
+    """
+    with get_conn() as conn:
+        columns = [col[1] for col in conn.execute("PRAGMA table_info(builds)")]
+        fresh = "sort_date" not in columns or "top_rank" not in columns
+        if "sort_date" not in columns:
+            conn.execute("ALTER TABLE builds ADD COLUMN sort_date TEXT DEFAULT ''")
+        if "top_rank" not in columns:
+            conn.execute("ALTER TABLE builds ADD COLUMN top_rank INTEGER DEFAULT 999")
+        conn.execute("CREATE INDEX IF NOT EXISTS builds_order ON builds(top_rank, sort_date DESC, id DESC)")
+
+        if not fresh:
+            return
+
+        rows = conn.execute("SELECT id, top1, top2, top3, date, categories FROM builds").fetchall()
+        for build_id, top1, top2, top3, date, raw_categories in rows:
+            categories = _parse_categories(raw_categories)
+            conn.execute(
+                "UPDATE builds SET sort_date = ?, top_rank = ?, categories = ? WHERE id = ?",
+                (
+                    _build_sort_date(date),
+                    _build_top_rank({"top1": top1, "top2": top2, "top3": top3}),
+                    json.dumps(categories, ensure_ascii=False),
+                    build_id,
+                )
+            )
+            _sync_build_categories(conn, build_id, categories)
+    invalidate_builds_cache()
+
 # =========================
 # СПРАВОЧНИК МОДУЛЕЙ (CRUD)
 # =========================
@@ -240,6 +706,99 @@ def modules_grouped_by_category(weapon_type: str):
         })
     return grouped
 
+# ====== КЕШ СЛОВАРЕЙ МОДУЛЕЙ (GET /api/modules/{weapon_type}) ======
+# Сгруппированный словарь типа сериализуется один раз в готовые байты.
+# Валидность — по ревизии типа в weapon_modules_revisions: её поднимают
+# триггеры на weapon_modules, поэтому запись из любого воркера uvicorn
+# (или modules_io.py) видна всем процессам. Записи этого процесса вдобавок
+# сбрасывают кеш сразу; generation не даёт сохранить снапшот, собранный
+# параллельно с записью.
+
+_modules_lock = threading.Lock()
+_modules_generation = 0         # растёт при каждой записи в weapon_modules этого процесса
+_modules_json = {}              # weapon_type -> (ревизия типа, bytes)
+
+
+def init_modules_revisions(conn):
+    """Ревизии словаря по типу оружия (счётчик изменений строк weapon_modules)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weapon_modules_revisions (
+            weapon_type TEXT PRIMARY KEY,
+            revision    INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    bump = """INSERT INTO weapon_modules_revisions (weapon_type, revision) VALUES ({row}.weapon_type, 1)
+            ON CONFLICT(weapon_type) DO UPDATE SET revision = revision + 1;"""
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_rev_ai AFTER INSERT ON weapon_modules BEGIN
+            {bump.format(row="new")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_rev_ad AFTER DELETE ON weapon_modules BEGIN
+            {bump.format(row="old")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_rev_au AFTER UPDATE ON weapon_modules BEGIN
+            {bump.format(row="old")}
+            {bump.format(row="new")}
+        END
+    """)
+
+
+def _modules_revision(weapon_type: str) -> int:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT revision FROM weapon_modules_revisions WHERE weapon_type = ?", (weapon_type,)
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def invalidate_modules_cache(weapon_type: str | None = None):
+    """Сбросить кеш словаря типа (None — всех типов)."""
+    global _modules_generation
+    with _modules_lock:
+        _modules_generation += 1
+        if weapon_type is None:
+            _modules_json.clear()
+        else:
+            _modules_json.pop(weapon_type, None)
+
+
+def modules_generation() -> int:
+    """
+    Общая ревизия словаря модулей — сумма ревизий типов, растёт при любой
+    записи в weapon_modules из любого процесса (см. dictionary_bundle).
+    """
+    with get_conn() as conn:
+        return conn.execute("SELECT COALESCE(SUM(revision), 0) FROM weapon_modules_revisions").fetchone()[0]
+
+
+def get_modules_json(weapon_type: str) -> bytes:
+    """modules_grouped_by_category(weapon_type) в виде готового JSON (bytes)."""
+    # Ревизию читаем до строк: запись между запросами лишь пересоберёт кеш позже
+    revision = _modules_revision(weapon_type)
+    with _modules_lock:
+        cached = _modules_json.get(weapon_type)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        generation = _modules_generation
+
+    payload = json.dumps(
+        modules_grouped_by_category(weapon_type), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+    with _modules_lock:
+        if generation == _modules_generation:
+            _modules_json[weapon_type] = (revision, payload)
+    return payload
+
+
+def _module_weapon_type(conn, module_id: int):
+    row = conn.execute("SELECT weapon_type FROM weapon_modules WHERE id = ?", (module_id,)).fetchone()
+    return row[0] if row else None
+
 def modules_categories(weapon_type: str | None = None):
     """
     Список уникальных категорий. Если weapon_type=None — по всем типам.
@@ -254,29 +813,123 @@ def modules_categories(weapon_type: str | None = None):
         rows = conn.execute(q, params).fetchall()
     return [r[0] for r in rows]
 
-def modules_search(query: str, weapon_type: str | None = None, limit: int = 50):
+# ====== ПОИСК МОДУЛЕЙ (FTS5 trigram по en/ru, см. search_fts) ======
+# weapon_modules_fts — external content таблица поверх weapon_modules:
+# хранит только индекс, строки синхронизируют триггеры.
+
+def init_modules_fts(conn):
+    try:
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'weapon_modules_fts'"
+        ).fetchone() is None
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS weapon_modules_fts USING fts5(
+                en, ru, content='weapon_modules', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite без FTS5/trigram (< 3.34) — поиск останется на LIKE
+        print(f"⚠️ weapon_modules_fts недоступна: {e}")
+        return
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_fts_ai AFTER INSERT ON weapon_modules BEGIN
+            INSERT INTO weapon_modules_fts(rowid, en, ru) VALUES (new.id, new.en, new.ru);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_fts_ad AFTER DELETE ON weapon_modules BEGIN
+            INSERT INTO weapon_modules_fts(weapon_modules_fts, rowid, en, ru) VALUES ('delete', old.id, old.en, old.ru);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS weapon_modules_fts_au AFTER UPDATE OF en, ru ON weapon_modules BEGIN
+            INSERT INTO weapon_modules_fts(weapon_modules_fts, rowid, en, ru) VALUES ('delete', old.id, old.en, old.ru);
+            INSERT INTO weapon_modules_fts(rowid, en, ru) VALUES (new.id, new.en, new.ru);
+        END
+    """)
+    if created:
+        conn.execute("INSERT INTO weapon_modules_fts(weapon_modules_fts) VALUES ('rebuild')")
+
+
+def _modules_search_like(conn, query: str, weapon_type: str | None, limit: int, anywhere: bool = False):
     """
-    Поиск по en/ru (LIKE), опционально ограничить по weapon_type.
+    Короткие запросы (< 3 символов): LIKE по началу любого слова en/ru.
+    anywhere=True — подстрока (SQLite без FTS5).
+    LIKE не сворачивает регистр кириллицы, поэтому ru проверяется и с заглавной буквы.
     """
-    like = f"%{query.strip()}%"
-    if weapon_type:
-        q = """SELECT id, weapon_type, category, en, ru, pos
-               FROM weapon_modules
-               WHERE weapon_type = ? AND (en LIKE ? OR ru LIKE ?)
-               ORDER BY category, pos, ru
-               LIMIT ?"""
-        params = (weapon_type, like, like, limit)
+    capitalized = query[:1].upper() + query[1:]
+    if anywhere:
+        patterns = [("en", f"%{query}%"), ("ru", f"%{query}%"), ("ru", f"%{capitalized}%")]
     else:
-        q = """SELECT id, weapon_type, category, en, ru, pos
-               FROM weapon_modules
-               WHERE (en LIKE ? OR ru LIKE ?)
-               ORDER BY category, pos, ru
-               LIMIT ?"""
-        params = (like, like, limit)
+        patterns = [("en", f"{query}%"), ("en", f"% {query}%"),
+                    ("ru", f"{query}%"), ("ru", f"% {query}%"), ("ru", f"{capitalized}%")]
+    where = "(" + " OR ".join(f"{column} LIKE ?" for column, _ in patterns) + ")"
+    params = [pattern for _, pattern in patterns]
+    if weapon_type:
+        where = "weapon_type = ? AND " + where
+        params.insert(0, weapon_type)
+    rows = conn.execute(f"""
+        SELECT id, weapon_type, category, en, ru, pos FROM weapon_modules
+        WHERE {where}
+        ORDER BY category, pos, ru
+        LIMIT ?
+    """, (*params, limit)).fetchall()
+    return [{**dict(r), "match": "prefix" if not anywhere else "exact"} for r in rows]
+
+
+def modules_search(query: str, weapon_type: str | None = None, limit: int = 50):
+    """
+    Поиск модулей по en/ru, опционально в пределах weapon_type.
+    Ранжирование: совпадение с началом слова, затем bm25; если точных
+    совпадений нет — нечёткие (опечатки) по доле общих троек.
+    Каждая запись: {id, weapon_type, category, en, ru, pos, match: prefix|exact|fuzzy}.
+    """
+    query = normalize_query(query)
+    if not query:
+        return []
+    type_filter = "AND m.weapon_type = ?" if weapon_type else ""
+    type_params = (weapon_type,) if weapon_type else ()
 
     with get_conn(row_mode=True) as conn:
-        rows = conn.execute(q, params).fetchall()
-    return [dict(r) for r in rows]
+        if len(query) < MIN_QUERY:
+            return _modules_search_like(conn, query, weapon_type, limit)
+        try:
+            rows = conn.execute(f"""
+                SELECT m.id, m.weapon_type, m.category, m.en, m.ru, m.pos
+                FROM weapon_modules_fts f
+                JOIN weapon_modules m ON m.id = f.rowid
+                WHERE weapon_modules_fts MATCH ? {type_filter}
+                ORDER BY bm25(weapon_modules_fts)
+                LIMIT ?
+            """, (fts_phrase(query), *type_params, limit * 3)).fetchall()
+        except sqlite3.OperationalError:
+            return _modules_search_like(conn, query, weapon_type, limit, anywhere=True)
+
+        results = [dict(r) for r in rows]
+        for r in results:
+            r["match"] = "prefix" if prefix_hit(query, r["en"], r["ru"]) else "exact"
+        # sort стабилен: внутри групп остаётся порядок bm25
+        results.sort(key=lambda r: r["match"] != "prefix")
+        results = results[:limit]
+
+        if not results:
+            # Точных совпадений нет — вероятно опечатка: ищем по общим тройкам
+            candidates = conn.execute(f"""
+                SELECT m.id, m.weapon_type, m.category, m.en, m.ru, m.pos
+                FROM weapon_modules_fts f
+                JOIN weapon_modules m ON m.id = f.rowid
+                WHERE weapon_modules_fts MATCH ? {type_filter}
+                ORDER BY bm25(weapon_modules_fts)
+                LIMIT ?
+            """, (fts_fuzzy(query), *type_params, limit * 4)).fetchall()
+            fuzzy = []
+            for r in candidates:
+                score = similarity(query, r["en"], r["ru"])
+                if score >= FUZZY_MIN_SIMILARITY:
+                    fuzzy.append((score, {**dict(r), "match": "fuzzy"}))
+            fuzzy.sort(key=lambda item: -item[0])
+            results = [r for _, r in fuzzy[:limit]]
+    return results
 
 def module_add_or_update(weapon_type: str, category: str, en: str, ru: str, pos: int = 0) -> int:
     """
@@ -305,7 +958,9 @@ def module_add_or_update(weapon_type: str, category: str, en: str, ru: str, pos:
             SELECT id FROM weapon_modules
             WHERE weapon_type = ? AND category = ? AND en = ?
         """, (weapon_type, category, en_key)).fetchone()
-        return int(row[0])
+        _reindex_builds(conn, "weapon_type = ?", (weapon_type,))   # ru-названия в индексе сборок
+    invalidate_modules_cache(weapon_type)
+    return int(row[0])
 
 def module_update(module_id: int, *, category: str | None = None,
                   en: str | None = None, ru: str | None = None, pos: int | None = None) -> int:
@@ -319,13 +974,111 @@ def module_update(module_id: int, *, category: str | None = None,
     vals.append(module_id)
 
     with get_conn() as conn:
+        weapon_type = _module_weapon_type(conn, module_id)
         cur = conn.execute(f"UPDATE weapon_modules SET {', '.join(sets)} WHERE id = ?", vals)
-        return cur.rowcount
+        if cur.rowcount and (en is not None or ru is not None):
+            _reindex_builds(conn, "weapon_type = ?", (weapon_type,))
+    if cur.rowcount:
+        invalidate_modules_cache(weapon_type)
+    return cur.rowcount
 
 def module_delete(module_id: int) -> int:
     with get_conn() as conn:
+        weapon_type = _module_weapon_type(conn, module_id)
         cur = conn.execute("DELETE FROM weapon_modules WHERE id = ?", (module_id,))
-        return cur.rowcount
+        if cur.rowcount:
+            _reindex_builds(conn, "weapon_type = ?", (weapon_type,))
+    if cur.rowcount:
+        invalidate_modules_cache(weapon_type)
+    return cur.rowcount
+
+def modules_delete_category(weapon_type: str, category: str) -> int:
+    """
+    Удаляет все модули категории для weapon_type. Возвращает число удалённых.
+    """
+    with get_conn() as conn:
+        cur = conn.execute(
+            "DELETE FROM weapon_modules WHERE weapon_type = ? AND category = ?",
+            (weapon_type, category)
+        )
+        if cur.rowcount:
+            _reindex_builds(conn, "weapon_type = ?", (weapon_type,))
+    if cur.rowcount:
+        invalidate_modules_cache(weapon_type)
+    return cur.rowcount
+
+# ====== МАССОВЫЙ ИМПОРТ / ЭКСПОРТ МОДУЛЕЙ (см. modules_io) ======
+
+def modules_bulk_upsert(weapon_type: str, rows, replace: bool = False, dry_run: bool = False) -> dict:
+    """
+    Импорт модулей типа одной транзакцией: rows — [(category, en, ru, pos)].
+    UPSERT по (weapon_type, category, en) через executemany; replace=True —
+    удалить модули типа, которых нет в rows. dry_run=True — только diff.
+    Возвращает diff {added, updated, unchanged, removed} — списки [category, en]
+    (removed — только при replace).
+    """
+    weapon_type = (weapon_type or "").strip()
+    incoming = {}
+    for category, en, ru, pos in rows:
+        key = ((category or "").strip(), (en or "").strip().lower())
+        if key[0] and key[1]:
+            incoming[key] = ((ru or "").strip(), int(pos or 0))
+
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {
+            (category, en): (ru, pos) for category, en, ru, pos in conn.execute(
+                "SELECT category, en, ru, pos FROM weapon_modules WHERE weapon_type = ?", (weapon_type,)
+            )
+        }
+        diff = {"added": [], "updated": [], "unchanged": [], "removed": []}
+        for key, value in incoming.items():
+            if key not in existing:
+                diff["added"].append(key)
+            elif existing[key] != value:
+                diff["updated"].append(key)
+            else:
+                diff["unchanged"].append(key)
+        if replace:
+            diff["removed"] = [key for key in existing if key not in incoming]
+        changed = diff["added"] or diff["updated"] or diff["removed"]
+        if not dry_run and changed:
+            conn.executemany("""
+                INSERT INTO weapon_modules(weapon_type, category, en, ru, pos)
+                VALUES (?,?,?,?,?)
+                ON CONFLICT(weapon_type, category, en)
+                DO UPDATE SET
+                    ru = excluded.ru,
+                    pos = excluded.pos
+            """, [(weapon_type, *key, *incoming[key]) for key in diff["added"] + diff["updated"]])
+            conn.executemany(
+                "DELETE FROM weapon_modules WHERE weapon_type = ? AND category = ? AND en = ?",
+                [(weapon_type, *key) for key in diff["removed"]]
+            )
+            _reindex_builds(conn, "weapon_type = ?", (weapon_type,))
+    if not dry_run and changed:
+        invalidate_modules_cache(weapon_type)
+    return {name: [list(key) for key in keys] for name, keys in diff.items()}
+
+
+def modules_export(weapon_type: str) -> dict:
+    """
+    Модули типа в формате data/modules-*.json: {category: [{ru, en}]}.
+    Категории — в порядке добавления, модули — по pos.
+    """
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT category, en, ru FROM weapon_modules WHERE weapon_type = ? ORDER BY pos, id",
+            (weapon_type,)
+        ).fetchall()
+        order = [r[0] for r in conn.execute(
+            "SELECT category FROM weapon_modules WHERE weapon_type = ? GROUP BY category ORDER BY MIN(id)",
+            (weapon_type,)
+        )]
+    data = {category: [] for category in order}
+    for category, en, ru in rows:
+        data[category].append({"ru": ru, "en": en})
+    return data
 
 # ====== ВЕРСИИ ======
 
@@ -0,0 +1,817 @@
+import os
+import re
+import sys
+import gzip
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from database_pool import pooled_connection
+
+# =====================================================
+# 📊 БАЗА АНАЛИТИКИ (analytics.db)
+# =====================================================
+ANALYTICS_DB = Path("/opt/ndloadouts_storage/analytics.db")
+
+
+def get_analytics_conn(row_mode: bool = False):
+    return pooled_connection(ANALYTICS_DB, row_mode)
+
+
+# Миграции схемы: шаг i применяется, если PRAGMA user_version < i + 1
+MIGRATIONS = (
+    # 1: индексы под дашборд (последние события, онлайн, история пользователя)
+    (
+        "CREATE INDEX IF NOT EXISTS analytics_ts ON analytics(timestamp)",
+        "CREATE INDEX IF NOT EXISTS analytics_action_ts ON analytics(action, timestamp)",
+        "CREATE INDEX IF NOT EXISTS analytics_user_ts ON analytics(user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS errors_ts ON errors(timestamp)",
+        "CREATE INDEX IF NOT EXISTS user_profiles_last_seen ON user_profiles(last_seen)",
+    ),
+    # 2: реестр месячных партиций; старая таблица analytics — партиция без месяца
+    (
+        """CREATE TABLE IF NOT EXISTS analytics_partitions (
+            name TEXT PRIMARY KEY,
+            month TEXT,                     -- 'YYYY-MM'; NULL у legacy-таблицы analytics
+            status TEXT NOT NULL DEFAULT 'active',   -- active / archiving / archived
+            rows INTEGER,
+            archive_path TEXT,
+            created_at TEXT,
+            archived_at TEXT
+        )""",
+        "INSERT OR IGNORE INTO analytics_partitions (name, month, status) VALUES ('analytics', NULL, 'active')",
+    ),
+    # 3: keyset-пагинация профилей — (ключ сортировки, user_id); выражения как в USER_SORTS
+    (
+        "CREATE INDEX IF NOT EXISTS user_profiles_seen_id ON user_profiles(IFNULL(last_seen, ''), user_id)",
+        "CREATE INDEX IF NOT EXISTS user_profiles_first_id ON user_profiles(IFNULL(first_seen, ''), user_id)",
+        "CREATE INDEX IF NOT EXISTS user_profiles_actions_id ON user_profiles(IFNULL(total_actions, 0), user_id)",
+    ),
+)
+
+
+def migrate_analytics_db(conn) -> int:
+    """Применить недостающие миграции; возвращает итоговую версию схемы."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        for sql in statements:
+            conn.execute(sql)
+        conn.execute(f"PRAGMA user_version = {number}")
+        version = number
+    return version
+
+
+def init_analytics_db():
+    """
+    Создание таблиц аналитики/профилей пользователей.
+    """
+    ANALYTICS_DB.parent.mkdir(parents=True, exist_ok=True)
+    with get_analytics_conn() as conn:
+        cur = conn.cursor()
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            action TEXT,
+            details TEXT,
+            timestamp TEXT
+        )""")
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS errors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            error TEXT,
+            details TEXT,
+            timestamp TEXT
+        )""")
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id TEXT PRIMARY KEY,
+            first_name TEXT,
+            username TEXT,
+            last_seen TEXT,
+            platform TEXT,
+            total_actions INTEGER DEFAULT 0,
+            first_seen TEXT,
+            last_action TEXT
+        )""")
+
+        # --- Роллапы: дашборд читает их вместо COUNT/GROUP BY по всей истории ---
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_action_counts (
+            action TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""")
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            hour TEXT NOT NULL,             -- 'YYYY-MM-DDTHH' из timestamp события
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, action)
+        ) WITHOUT ROWID""")
+
+        # Счётчики заархивированных месяцев (пишет архивация, читает rebuild_rollups):
+        # роллапы остаются за всё время, даже когда сырых строк в БД уже нет
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_archived_counts (
+            action TEXT PRIMARY KEY,        -- '' — события без action
+            count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""")
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_archived_hourly (
+            hour TEXT NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, action)
+        ) WITHOUT ROWID""")
+
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_totals (
+            key TEXT PRIMARY KEY,           -- actions / errors / users
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""")
+
+        # errors и user_profiles пишутся редко — их счётчики ведут триггеры
+        # (UPSERT профиля, попавший в DO UPDATE, INSERT-триггер не вызывает)
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS errors_total_ai AFTER INSERT ON errors BEGIN
+            INSERT INTO analytics_totals (key, value) VALUES ('errors', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1;
+        END""")
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS errors_total_ad AFTER DELETE ON errors BEGIN
+            UPDATE analytics_totals SET value = value - 1 WHERE key = 'errors';
+        END""")
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_total_ai AFTER INSERT ON user_profiles BEGIN
+            INSERT INTO analytics_totals (key, value) VALUES ('users', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1;
+        END""")
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_total_ad AFTER DELETE ON user_profiles BEGIN
+            UPDATE analytics_totals SET value = value - 1 WHERE key = 'users';
+        END""")
+
+        migrate_analytics_db(conn)
+
+        # Первый запуск с роллапами: строим их по существующей истории
+        if not cur.execute("SELECT 1 FROM analytics_totals WHERE key = 'actions'").fetchone():
+            rebuild_rollups(conn)
+
+
+def rebuild_rollups(conn=None):
+    """
+    Пересобрать роллапы по сырым таблицам (backfill / сверка).
+    Одна транзакция: читатели видят либо старые, либо новые счётчики.
+    Живые партиции считаются заново, архивированные месяцы берутся из
+    analytics_archived_* — итоги остаются за всё время.
+    """
+    if conn is None:
+        with get_analytics_conn() as conn:
+            return rebuild_rollups(conn)
+
+    conn.execute("DELETE FROM analytics_action_counts")
+    conn.execute("DELETE FROM analytics_hourly")
+    conn.execute("DELETE FROM analytics_totals")
+    conn.execute("""
+        INSERT INTO analytics_action_counts (action, count)
+        SELECT action, count FROM analytics_archived_counts WHERE action != ''
+    """)
+    conn.execute("INSERT INTO analytics_hourly (hour, action, count) SELECT hour, action, count FROM analytics_archived_hourly")
+    total_actions = conn.execute("SELECT COALESCE(SUM(count), 0) FROM analytics_archived_counts").fetchone()[0]
+    for name in live_partitions(conn):
+        conn.execute(f"""
+            INSERT INTO analytics_action_counts (action, count)
+            SELECT action, COUNT(*) FROM {name} WHERE action IS NOT NULL GROUP BY action
+            ON CONFLICT(action) DO UPDATE SET count = count + excluded.count
+        """)
+        conn.execute(f"""
+            INSERT INTO analytics_hourly (hour, action, count)
+            SELECT substr(timestamp, 1, 13), action, COUNT(*)
+            FROM {name}
+            WHERE action IS NOT NULL AND timestamp IS NOT NULL
+            GROUP BY 1, 2
+            ON CONFLICT(hour, action) DO UPDATE SET count = count + excluded.count
+        """)
+        total_actions += conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    conn.execute("""
+        INSERT INTO analytics_totals (key, value)
+        SELECT 'actions', ?
+        UNION ALL SELECT 'errors', COUNT(*) FROM errors
+        UNION ALL SELECT 'users', COUNT(*) FROM user_profiles
+    """, (total_actions,))
+    return dict(conn.execute("SELECT key, value FROM analytics_totals").fetchall())
+
+
+# ---------------------- Месячные партиции ----------------------
+# События пишутся в таблицы analytics_pYYYYMM по месяцу timestamp события.
+# Старая таблица analytics — тоже партиция (legacy): в ней история до партиционирования
+# и опоздавшие события за месяцы старше ретеншна. Партиции старше
+# ANALYTICS_RETENTION_MONTHS выгружаются в gzip NDJSON и удаляются из БД.
+
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "6"))   # 0 — хранить всё
+ANALYTICS_ARCHIVE_DIR = Path(os.getenv("ANALYTICS_ARCHIVE_DIR", "/opt/ndloadouts_storage/analytics_archive"))
+LEGACY_PARTITION = "analytics"
+# timestamp приходит от клиента: будущие даты (дальше допуска на разброс часов)
+# заменяются временем приёма, а месяцы раньше нижней границы идут в legacy —
+# иначе любой запрос к /api/analytics создавал бы таблицу под выбранный месяц.
+ANALYTICS_FUTURE_SKEW = timedelta(days=1)
+ANALYTICS_BACKFILL_MONTHS = 12   # нижняя граница партиций при выключенном ретеншне
+ANALYTICS_ARCHIVE_CLAIM_TIMEOUT = timedelta(hours=1)   # захват архивации, брошенный упавшим воркером
+
+_MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+_partitions_lock = threading.Lock()
+_known_partitions = set()   # партиции, точно существующие (закоммиченные этим процессом)
+
+
+def _current_month(now=None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+
+def _shift_month(month: str, delta: int) -> str:
+    year, mon = map(int, month.split("-"))
+    index = year * 12 + (mon - 1) + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def retention_start(now=None):
+    """Первый хранимый месяц 'YYYY-MM' (None — ретеншн выключен)."""
+    if ANALYTICS_RETENTION_MONTHS <= 0:
+        return None
+    return _shift_month(_current_month(now), -(ANALYTICS_RETENTION_MONTHS - 1))
+
+
+def partition_name(month: str) -> str:
+    return "analytics_p" + month.replace("-", "")
+
+
+def partition_floor(now=None) -> str:
+    """Самый ранний месяц, под который создаётся партиция (раньше — legacy)."""
+    return retention_start(now) or _shift_month(_current_month(now), -(ANALYTICS_BACKFILL_MONTHS - 1))
+
+
+def _clamp_timestamp(timestamp, now_utc: datetime):
+    """timestamp из будущего (дальше ANALYTICS_FUTURE_SKEW) -> время приёма."""
+    limit = (now_utc + ANALYTICS_FUTURE_SKEW).strftime("%Y-%m-%dT%H:%M:%S")
+    if timestamp and timestamp[:19] > limit:
+        return now_utc.isoformat()
+    return timestamp
+
+
+def _event_partition(timestamp, floor) -> str:
+    """Партиция для события: месяц из timestamp, месяцы раньше floor — в legacy."""
+    month = (timestamp or "")[:7]
+    if not _MONTH_RE.match(month):
+        month = _current_month()
+    if month < floor:
+        return LEGACY_PARTITION
+    return partition_name(month)
+
+
+def _ensure_partition(conn, name: str):
+    if name == LEGACY_PARTITION or name in _known_partitions:
+        return
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT,
+            action TEXT,
+            details TEXT,
+            timestamp TEXT
+        )""")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_ts ON {name}(timestamp)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_action_ts ON {name}(action, timestamp)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_user_ts ON {name}(user_id, timestamp)")
+    month = f"{name[11:15]}-{name[15:17]}"
+    conn.execute("""
+        INSERT INTO analytics_partitions (name, month, status, created_at) VALUES (?, ?, 'active', ?)
+        ON CONFLICT(name) DO UPDATE SET status = 'active', archive_path = NULL, archived_at = NULL
+    """, (name, month, datetime.now(timezone.utc).isoformat()))
+
+
+def live_partitions(conn) -> list:
+    """Имена живых партиций, свежие месяцы первыми (legacy — последней); archiving ещё читается."""
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM analytics_partitions WHERE status IN ('active', 'archiving') ORDER BY month DESC"
+    ).fetchall()]
+
+
+def get_partitions():
+    """Реестр партиций для админки/CLI."""
+    with get_analytics_conn(row_mode=True) as conn:
+        rows = conn.execute("SELECT * FROM analytics_partitions ORDER BY month DESC").fetchall()
+        result = []
+        for r in rows:
+            item = dict(r)
+            if r["status"] in ("active", "archiving"):
+                item["rows"] = conn.execute(f"SELECT COUNT(*) FROM {r['name']}").fetchone()[0]
+            result.append(item)
+        return result
+
+
+def iter_events(since: str = None, until: str = None):
+    """
+    Все события живых партиций (для выгрузок): по партициям от старых к новым,
+    внутри партиции — по timestamp. since/until — ISO-строки, границы [since, until).
+    """
+    where, params = [], []
+    if since:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        where.append("timestamp < ?")
+        params.append(until)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+    with get_analytics_conn() as conn:
+        for name in reversed(live_partitions(conn)):
+            for row in conn.execute(
+                f"SELECT id, user_id, action, details, timestamp FROM {name} {where_sql} ORDER BY timestamp",
+                params
+            ):
+                yield {"id": row[0], "user_id": row[1], "action": row[2], "details": row[3],
+                       "timestamp": row[4]}
+
+
+def _archive_rollups(conn, source: str, where: str = "1", params=()):
+    """
+    Счётчики строк, которые сейчас уйдут в архив, -> analytics_archived_*.
+    Вызывается в одной транзакции с DROP/DELETE этих строк.
+    """
+    conn.execute(f"""
+        INSERT INTO analytics_archived_counts (action, count)
+        SELECT COALESCE(action, ''), COUNT(*) FROM {source} WHERE {where} GROUP BY 1
+        ON CONFLICT(action) DO UPDATE SET count = count + excluded.count
+    """, params)
+    conn.execute(f"""
+        INSERT INTO analytics_archived_hourly (hour, action, count)
+        SELECT substr(timestamp, 1, 13), action, COUNT(*) FROM {source}
+        WHERE ({where}) AND action IS NOT NULL AND timestamp IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT(hour, action) DO UPDATE SET count = count + excluded.count
+    """, params)
+
+
+def _write_ndjson_gz(cursor, path: Path) -> int:
+    """
+    Строки (id, user_id, action, details, timestamp) -> gzip NDJSON; атомарно через tmp-файл.
+    Пустая выгрузка существующий архив не затирает.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    count = 0
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for row in cursor:
+            f.write(json.dumps({"id": row[0], "user_id": row[1], "action": row[2], "details": row[3],
+                                "timestamp": row[4]}, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    if count == 0 and path.exists():
+        tmp.unlink()
+        return 0
+    os.replace(tmp, path)
+    return count
+
+
+def _claim_partition(name: str):
+    """
+    Захватить партицию под архивацию (active -> archiving) под BEGIN IMMEDIATE.
+    Захват, брошенный упавшим воркером дольше ANALYTICS_ARCHIVE_CLAIM_TIMEOUT, перехватывается.
+    Возвращает метку захвата (archived_at) или None, если партиция уже чужая/заархивирована.
+    """
+    now = datetime.now(timezone.utc)
+    claim = now.isoformat()
+    stale = (now - ANALYTICS_ARCHIVE_CLAIM_TIMEOUT).isoformat()
+    with get_analytics_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute("""
+            UPDATE analytics_partitions SET status = 'archiving', archived_at = ?
+            WHERE name = ? AND (status = 'active' OR (status = 'archiving' AND archived_at < ?))
+        """, (claim, name, stale))
+    return claim if cursor.rowcount else None
+
+
+def archive_expired_partitions(now=None) -> list:
+    """
+    Выгрузить месяцы старше ретеншна в ANALYTICS_ARCHIVE_DIR и удалить их из БД:
+    партиции целиком (DROP TABLE), legacy-таблицу — помесячными срезами.
+    Партицию сначала захватывает один воркер (status='archiving'), остальные её пропускают;
+    legacy-срез выгружается и удаляется в одной транзакции BEGIN IMMEDIATE.
+    """
+    keep_from = retention_start(now)
+    if keep_from is None:
+        return []
+    ANALYTICS_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    archived = []
+
+    with get_analytics_conn() as conn:
+        expired = conn.execute("""
+            SELECT name, month FROM analytics_partitions
+            WHERE status IN ('active', 'archiving') AND month IS NOT NULL AND month < ?
+            ORDER BY month
+        """, (keep_from,)).fetchall()
+
+    for name, month in expired:
+        claim = _claim_partition(name)
+        if claim is None:   # архивирует другой воркер
+            continue
+        path = ANALYTICS_ARCHIVE_DIR / f"analytics_{month}.ndjson.gz"
+        with get_analytics_conn() as conn:
+            try:
+                rows = _write_ndjson_gz(
+                    conn.execute(f"SELECT id, user_id, action, details, timestamp FROM {name} ORDER BY id"), path
+                )
+            except sqlite3.OperationalError as e:
+                if "no such table" not in str(e):
+                    raise
+                print(f"⚠️ Analytics archive: таблицы {name} нет, партиция пропущена")
+                conn.execute(
+                    "UPDATE analytics_partitions SET status = 'archived' WHERE name = ? AND archived_at = ?",
+                    (name, claim)
+                )
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            still_ours = conn.execute(
+                "SELECT 1 FROM analytics_partitions WHERE name = ? AND status = 'archiving' AND archived_at = ?",
+                (name, claim)
+            ).fetchone()
+            if not still_ours:   # захват просрочен и перехвачен
+                continue
+            _archive_rollups(conn, name)
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute("""
+                UPDATE analytics_partitions
+                SET status = 'archived', rows = ?, archive_path = ?, archived_at = ?
+                WHERE name = ?
+            """, (rows, str(path), datetime.now(timezone.utc).isoformat(), name))
+        with _partitions_lock:
+            _known_partitions.discard(name)
+        archived.append({"partition": name, "month": month, "rows": rows, "path": str(path)})
+
+    # Legacy: срезы по месяцам; max(id) в имени файла — чтобы повтор перезаписал тот же срез.
+    # max(id), выгрузка, роллапы и DELETE — под одной блокировкой записи.
+    with get_analytics_conn() as conn:
+        months = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT substr(timestamp, 1, 7) FROM {LEGACY_PARTITION} WHERE timestamp < ?", (keep_from,)
+        ).fetchall()]
+
+    for month in sorted(m for m in months if m and _MONTH_RE.match(m)):
+        bounds = (month, _shift_month(month, 1))
+        with get_analytics_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            max_id = conn.execute(
+                f"SELECT MAX(id) FROM {LEGACY_PARTITION} WHERE timestamp >= ? AND timestamp < ?", bounds
+            ).fetchone()[0]
+            if max_id is None:   # срез уже выгрузил другой воркер
+                continue
+            path = ANALYTICS_ARCHIVE_DIR / f"analytics_{month}.legacy-{max_id}.ndjson.gz"
+            rows = _write_ndjson_gz(conn.execute(f"""
+                SELECT id, user_id, action, details, timestamp FROM {LEGACY_PARTITION}
+                WHERE timestamp >= ? AND timestamp < ? AND id <= ?
+                ORDER BY id
+            """, (*bounds, max_id)), path)
+            if not rows:
+                continue
+            _archive_rollups(conn, LEGACY_PARTITION, "timestamp >= ? AND timestamp < ? AND id <= ?", (*bounds, max_id))
+            conn.execute(
+                f"DELETE FROM {LEGACY_PARTITION} WHERE timestamp >= ? AND timestamp < ? AND id <= ?",
+                (*bounds, max_id)
+            )
+        archived.append({"partition": LEGACY_PARTITION, "month": month, "rows": rows, "path": str(path)})
+
+    return archived
+
+
+# ---------------------- Запись событий ----------------------
+
+def save_events_batch(events: list[dict], user_infos: dict):
+    """
+    Пачка событий одной транзакцией: executemany в месячные партиции +
+    один UPSERT профиля на пользователя (счётчик += число его событий).
+    events: [{user_id, action, details_json, timestamp, platform}, ...] в порядке прихода.
+    user_infos: {user_id: {first_name, username}} для новых профилей.
+    """
+    if not events:
+        return
+    now_iso = datetime.now().isoformat()
+    now_utc = datetime.now(timezone.utc)
+    for e in events:
+        e["timestamp"] = _clamp_timestamp(e["timestamp"], now_utc)
+
+    # Сливаем события пользователя в один апдейт профиля: последнее событие побеждает
+    profiles = {}
+    action_counts, hourly_counts = {}, {}
+    for e in events:
+        p = profiles.setdefault(e["user_id"], {"count": 0})
+        p["count"] += 1
+        p["last_seen"] = e["timestamp"]
+        p["platform"] = e["platform"]
+        p["last_action"] = e["action"]
+
+        action_counts[e["action"]] = action_counts.get(e["action"], 0) + 1
+        if e["timestamp"]:
+            key = (e["timestamp"][:13], e["action"])
+            hourly_counts[key] = hourly_counts.get(key, 0) + 1
+
+    floor = partition_floor(now_utc)
+    by_partition = {}
+    for e in events:
+        by_partition.setdefault(_event_partition(e["timestamp"], floor), []).append(
+            (e["user_id"], e["action"], e["details_json"], e["timestamp"])
+        )
+
+    try:
+        _write_events(by_partition, profiles, action_counts, hourly_counts, len(events), user_infos, now_iso)
+    except sqlite3.OperationalError as e:
+        # Партицию из кеша удалили (clear/архивация в другом воркере) — пересоздаём и повторяем
+        if "no such table" not in str(e):
+            raise
+        with _partitions_lock:
+            _known_partitions.clear()
+        _write_events(by_partition, profiles, action_counts, hourly_counts, len(events), user_infos, now_iso)
+
+
+def _write_events(by_partition, profiles, action_counts, hourly_counts, total, user_infos, now_iso):
+    with get_analytics_conn() as conn:
+        for name, rows in by_partition.items():
+            _ensure_partition(conn, name)
+            conn.executemany(
+                f"INSERT INTO {name} (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)", rows
+            )
+        conn.executemany("""
+            INSERT INTO user_profiles (user_id, first_name, username, last_seen, platform, total_actions, first_seen, last_action)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                last_seen = excluded.last_seen,
+                platform = excluded.platform,
+                total_actions = total_actions + excluded.total_actions,
+                last_action = excluded.last_action
+        """, [
+            (
+                user_id,
+                user_infos.get(user_id, {}).get('first_name', ''),
+                user_infos.get(user_id, {}).get('username', ''),
+                p["last_seen"],
+                p["platform"],
+                p["count"],
+                now_iso,
+                p["last_action"]
+            )
+            for user_id, p in profiles.items()
+        ])
+
+        # Роллапы в той же транзакции — по одному UPSERT на действие/час
+        conn.executemany("""
+            INSERT INTO analytics_action_counts (action, count) VALUES (?, ?)
+            ON CONFLICT(action) DO UPDATE SET count = count + excluded.count
+        """, list(action_counts.items()))
+        conn.executemany("""
+            INSERT INTO analytics_hourly (hour, action, count) VALUES (?, ?, ?)
+            ON CONFLICT(hour, action) DO UPDATE SET count = count + excluded.count
+        """, [(hour, action, count) for (hour, action), count in hourly_counts.items()])
+        conn.execute("""
+            INSERT INTO analytics_totals (key, value) VALUES ('actions', ?)
+            ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+        """, (total,))
+
+    with _partitions_lock:
+        _known_partitions.update(by_partition)
+
+
+# ---------------------- Дашборд ----------------------
+
+DASHBOARD_USERS = 50
+
+# Сортировки списка профилей: выражение совпадает с индексами миграции 3
+USER_SORTS = {
+    "last_seen": "IFNULL(last_seen, '')",
+    "first_seen": "IFNULL(first_seen, '')",
+    "actions": "IFNULL(total_actions, 0)",
+}
+PLATFORM_GROUPS = {
+    "mobile": ("android", "ios"),
+    "desktop": ("tdesktop", "macos", "web", "weba", "webk"),
+}
+
+def get_dashboard_data():
+    """
+    Сырые данные для дашборда: счётчики, популярные действия, профили, 30 последних событий.
+    Онлайн считается не здесь, а трекером присутствия (presence.py).
+    """
+    with get_analytics_conn() as conn:
+        cur = conn.cursor()
+
+        totals = dict(cur.execute("SELECT key, value FROM analytics_totals").fetchall())
+
+        cur.execute("""
+            SELECT action, count
+            FROM analytics_action_counts
+            WHERE action NOT IN ('session_start', 'session_end', 'click_button')
+            ORDER BY count DESC
+            LIMIT 8
+        """)
+        popular_actions = cur.fetchall()
+
+        # timestamp событий — UTC ISO от клиента (toISOString)
+        day_ago = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()[:13]
+        cur.execute("""
+            SELECT hour, SUM(count)
+            FROM analytics_hourly
+            WHERE hour >= ?
+            GROUP BY hour
+            ORDER BY hour
+        """, (day_ago,))
+        hourly = cur.fetchall()
+
+        # Только последние активные — полный список постранично через get_user_profiles_page
+        cur.execute("""
+            SELECT
+                user_id, first_name, username, last_seen, platform,
+                total_actions, first_seen, last_action
+            FROM user_profiles
+            ORDER BY last_seen DESC
+            LIMIT ?
+        """, (DASHBOARD_USERS,))
+        users_data = cur.fetchall()
+
+        # last_seen — UTC от клиента, first_seen — локальное время сервера
+        active_today = cur.execute(
+            "SELECT COUNT(*) FROM user_profiles WHERE last_seen >= ?",
+            (datetime.now(timezone.utc).date().isoformat(),)
+        ).fetchone()[0]
+        new_today = cur.execute(
+            "SELECT COUNT(*) FROM user_profiles WHERE IFNULL(first_seen, '') >= ?",
+            (datetime.now().date().isoformat(),)
+        ).fetchone()[0]
+
+        # Последние 30 событий: топ-30 каждой живой партиции (по индексу) и слияние
+        recent = []
+        for name in live_partitions(conn):
+            recent.extend(cur.execute(f"""
+                SELECT a.user_id, a.action, a.details, a.timestamp,
+                       u.first_name, u.username, u.platform
+                FROM {name} a
+                LEFT JOIN user_profiles u ON a.user_id = u.user_id
+                WHERE a.user_id != 'anonymous'
+                ORDER BY a.timestamp DESC
+                LIMIT 30
+            """).fetchall())
+        actions_data = sorted(recent, key=lambda r: r[3] or "", reverse=True)[:30]
+
+    return {
+        "stats": {
+            "total_users": totals.get("users", 0),
+            "total_actions": totals.get("actions", 0),
+            "total_errors": totals.get("errors", 0),
+            "active_today": active_today,
+            "new_today": new_today
+        },
+        "popular_actions": popular_actions,
+        "hourly_activity": hourly,
+        "users": users_data,
+        "recent_activity": actions_data
+    }
+
+
+def get_user_profiles_page(sort: str = "last_seen", order: str = "desc", after=None, limit: int = 50,
+                           q: str = "", platform: str = "", only_ids=None, exclude_ids=None):
+    """
+    Страница профилей с keyset-пагинацией по (ключ сортировки, user_id).
+    after — (значение ключа, user_id) последней строки предыдущей страницы.
+    q — подстрока имени/username или префикс ID; platform — платформа или группа mobile/desktop;
+    only_ids / exclude_ids — фильтр по статусу (онлайн-ID из трекера присутствия).
+    Возвращает (rows, next_after | None).
+    """
+    if sort not in USER_SORTS:
+        raise ValueError(f"unknown sort: {sort}")
+    expr = USER_SORTS[sort]
+    direction, cmp = ("ASC", ">") if order == "asc" else ("DESC", "<")
+
+    where, params = [], []
+    if q:
+        # LIKE в SQLite регистронезависим только для ASCII — имена сравниваем через casefold()
+        q = q.strip().lstrip("@").casefold()
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("(casefold(first_name) LIKE ? ESCAPE '\\' OR username LIKE ? ESCAPE '\\' "
+                     "OR user_id LIKE ? ESCAPE '\\')")
+        params += [like, like, like[1:]]
+    if platform:
+        group = PLATFORM_GROUPS.get(platform, (platform,))
+        where.append(f"platform IN ({','.join('?' * len(group))})")
+        params += list(group)
+    if only_ids is not None:
+        only_ids = list(only_ids)
+        if not only_ids:
+            return [], None
+        where.append(f"user_id IN ({','.join('?' * len(only_ids))})")
+        params += only_ids
+    if exclude_ids:
+        exclude_ids = list(exclude_ids)
+        where.append(f"user_id NOT IN ({','.join('?' * len(exclude_ids))})")
+        params += exclude_ids
+    if after is not None:
+        # Развёрнуто из (expr, user_id) < (?, ?): так SQLite ищет по индексу диапазоном, а не сканирует
+        where.append(f"{expr} {cmp}= ? AND ({expr} {cmp} ? OR user_id {cmp} ?)")
+        params += [after[0], after[0], after[1]]
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    with get_analytics_conn() as conn:
+        conn.create_function("casefold", 1, lambda v: v.casefold() if isinstance(v, str) else v,
+                             deterministic=True)
+        rows = conn.execute(f"""
+            SELECT user_id, first_name, username, last_seen, platform,
+                   total_actions, first_seen, last_action, {expr}
+            FROM user_profiles
+            {where_sql}
+            ORDER BY {expr} {direction}, user_id {direction}
+            LIMIT ?
+        """, (*params, limit + 1)).fetchall()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1][8], rows[-1][0])
+    return [r[:8] for r in rows], next_after
+
+
+def get_recently_seen(seconds: int):
+    """
+    Профили, активные за последние seconds секунд (индекс по last_seen):
+    (user_id, last_seen, platform, last_action). Для прогрева трекера присутствия.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+    with get_analytics_conn() as conn:
+        return conn.execute("""
+            SELECT user_id, last_seen, platform, last_action
+            FROM user_profiles
+            WHERE last_seen > ?
+        """, (since[:19],)).fetchall()
+
+
+def clear_analytics_data():
+    """
+    Очистка всей статистики (analytics/errors/user_profiles + партиции + роллапы).
+    Архивные файлы и их счётчики (analytics_archived_*) не трогаются.
+    """
+    with get_analytics_conn() as conn:
+        for name in live_partitions(conn):
+            if name == LEGACY_PARTITION:
+                conn.execute(f"DELETE FROM {name}")
+            else:
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+                conn.execute("DELETE FROM analytics_partitions WHERE name = ?", (name,))
+        conn.execute("DELETE FROM errors")
+        conn.execute("DELETE FROM user_profiles")
+        rebuild_rollups(conn)
+    with _partitions_lock:
+        _known_partitions.clear()
+
+
+def get_broadcast_recipients():
+    """
+    (user_id, first_name, username) для рассылки, свежие сверху.
+    """
+    with get_analytics_conn() as conn:
+        return conn.execute("""
+            SELECT user_id, first_name, username
+            FROM user_profiles
+            WHERE user_id != 'anonymous'
+            ORDER BY last_seen DESC
+        """).fetchall()
+
+
+if __name__ == "__main__":
+    # python database_analytics.py rebuild-rollups          — пересобрать счётчики по истории
+    # python database_analytics.py archive                  — выгрузить месяцы старше ретеншна
+    # python database_analytics.py partitions               — реестр партиций
+    # python database_analytics.py export FILE [SINCE]      — все живые события в gzip NDJSON
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command in ("rebuild-rollups", "archive", "partitions", "export"):
+        init_analytics_db()
+    if command == "rebuild-rollups":
+        print(f"✅ Роллапы пересобраны: {rebuild_rollups()}")
+    elif command == "archive":
+        for item in archive_expired_partitions():
+            print(f"📦 {item['partition']} {item['month']}: {item['rows']} → {item['path']}")
+    elif command == "partitions":
+        for item in get_partitions():
+            print(item)
+    elif command == "export" and len(sys.argv) > 2:
+        count = 0
+        with gzip.open(sys.argv[2], "wt", encoding="utf-8") as f:
+            for event in iter_events(since=sys.argv[3] if len(sys.argv) > 3 else None):
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"✅ Выгружено событий: {count}")
+    else:
+        print("Использование: python database_analytics.py rebuild-rollups | archive | partitions | export FILE [SINCE]")
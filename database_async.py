@@ -0,0 +1,28 @@
+import os
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# =====================================================
+# ⏳ ASYNC-ДОСТУП К БД (ограниченный пул потоков)
+# =====================================================
+# async-эндпоинты не должны вызывать sqlite3 прямо в event loop:
+# один медленный запрос (дашборд) останавливает весь воркер uvicorn.
+# Все синхронные функции database*.py вызываются через run_db() —
+# в отдельном пуле потоков фиксированного размера. Соединения SQLite
+# берутся из database_pool и привязаны к потокам этого пула.
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Выполнить синхронную функцию БД в пуле потоков и дождаться результата."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    """Дождаться текущих запросов и остановить пул (shutdown приложения)."""
+    _executor.shutdown(wait=True)
@@ -1,9 +1,15 @@
 import sqlite3
 import json
+import threading
 from pathlib import Path
-from contextlib import contextmanager
 from datetime import datetime
 
+from database_pool import pooled_connection
+from search_fts import (
+    MIN_QUERY, FUZZY_MIN_SIMILARITY, normalize_query, fts_phrase, fts_fuzzy, similarity, prefix_hit,
+    build_module_names,
+)
+
 
 
 # =====================================================
@@ -13,18 +19,8 @@ BF_DB_PATH = Path("/opt/ndloadouts_storage/bf_challenges.db")
 BF_DB_PATH.parent.mkdir(exist_ok=True)
 
 
-@contextmanager
 def get_bf_conn(row_mode: bool = False):
-    conn = sqlite3.connect(BF_DB_PATH)
-    if row_mode:
-        conn.row_factory = sqlite3.Row
-    try:
-        conn.execute("PRAGMA foreign_keys = ON")
-        conn.execute("PRAGMA journal_mode = WAL")
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+    return pooled_connection(BF_DB_PATH, row_mode)
 
 
 def init_bf_db():
@@ -205,9 +201,8 @@ def get_challenge_goal(challenge_id: int) -> int:
 DB_PATH = Path("/opt/ndloadouts/builds_bf.db")
 
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Контекст пула: commit при выходе (явные conn.commit() ниже безвредны)
+    return pooled_connection(DB_PATH, row_mode=True)
 
 def init_bf_builds_table():
     with get_connection() as conn:
@@ -244,6 +239,25 @@ def init_bf_builds_table():
             UNIQUE (weapon_type, category, en)
         )
         """)
+        init_bf_modules_fts(conn)
+        init_bf_modules_revisions(conn)
+
+        # Журнал изменений сборок (ревизия каталога для ETag / ?since=)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS bf_build_changes (
+            revision INTEGER PRIMARY KEY AUTOINCREMENT,
+            build_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT
+        )
+        """)
+        conn.execute("""
+        INSERT INTO bf_build_changes (build_id, deleted, changed_at)
+        SELECT id, 0, ? FROM bf_builds
+        WHERE NOT EXISTS (SELECT 1 FROM bf_build_changes)
+        ORDER BY id
+        """, (datetime.now().isoformat(),))
+        init_bf_builds_fts(conn)
         conn.commit()
 
 
@@ -294,6 +308,185 @@ def get_bf_modules_by_type(weapon_type):
         return data
 
 
+# Кеш готового JSON словарей по типу (GET /api/bf/modules/{weapon_type}).
+# Общие модули 'shv' входят в словарь каждого типа, поэтому их правка
+# сбрасывает весь кеш. Валидность — по ревизиям bf_modules_revisions
+# (триггеры на bf_modules), так что записи других воркеров тоже видны.
+BF_SHARED_MODULES_TYPE = "shv"
+_bf_modules_lock = threading.Lock()
+_bf_modules_generation = 0     # растёт при каждой записи в bf_modules этого процесса
+_bf_modules_json = {}          # weapon_type -> (ревизия типа + shv, bytes)
+
+
+def init_bf_modules_revisions(conn):
+    """Ревизии словаря BF по типу (счётчик изменений строк bf_modules)."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS bf_modules_revisions (
+        weapon_type TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    bump = """INSERT INTO bf_modules_revisions (weapon_type, revision) VALUES ({row}.weapon_type, 1)
+        ON CONFLICT(weapon_type) DO UPDATE SET revision = revision + 1;"""
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS bf_modules_rev_ai AFTER INSERT ON bf_modules BEGIN
+        {bump.format(row="new")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS bf_modules_rev_ad AFTER DELETE ON bf_modules BEGIN
+        {bump.format(row="old")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS bf_modules_rev_au AFTER UPDATE ON bf_modules BEGIN
+        {bump.format(row="old")}
+        {bump.format(row="new")}
+    END
+    """)
+
+
+def _bf_modules_revision(weapon_type) -> int:
+    """Ревизия словаря типа вместе с общими модулями shv."""
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT COALESCE(SUM(revision), 0) FROM bf_modules_revisions WHERE weapon_type IN (?, ?)",
+            (weapon_type, BF_SHARED_MODULES_TYPE)
+        ).fetchone()[0]
+
+
+def invalidate_bf_modules_cache(weapon_type=None):
+    global _bf_modules_generation
+    with _bf_modules_lock:
+        _bf_modules_generation += 1
+        if weapon_type is None or weapon_type == BF_SHARED_MODULES_TYPE:
+            _bf_modules_json.clear()
+        else:
+            _bf_modules_json.pop(weapon_type, None)
+
+
+def bf_modules_generation() -> int:
+    """Общая ревизия словаря BF: растёт при любой записи в bf_modules из любого процесса."""
+    with get_connection() as conn:
+        return conn.execute("SELECT COALESCE(SUM(revision), 0) FROM bf_modules_revisions").fetchone()[0]
+
+
+def get_bf_modules_json(weapon_type) -> bytes:
+    """get_bf_modules_by_type(weapon_type) в виде готового JSON (bytes)."""
+    revision = _bf_modules_revision(weapon_type)
+    with _bf_modules_lock:
+        cached = _bf_modules_json.get(weapon_type)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        generation = _bf_modules_generation
+
+    payload = json.dumps(
+        get_bf_modules_by_type(weapon_type), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+    with _bf_modules_lock:
+        if generation == _bf_modules_generation:
+            _bf_modules_json[weapon_type] = (revision, payload)
+    return payload
+
+
+# Поиск модулей BF: FTS5 trigram по en (см. search_fts), синхронизация триггерами.
+# Поиск по типу включает общие модули 'shv' — как и словарь типа.
+def init_bf_modules_fts(conn):
+    try:
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'bf_modules_fts'"
+        ).fetchone() is None
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bf_modules_fts USING fts5(
+                en, content='bf_modules', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ bf_modules_fts недоступна: {e}")
+        return
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS bf_modules_fts_ai AFTER INSERT ON bf_modules BEGIN
+            INSERT INTO bf_modules_fts(rowid, en) VALUES (new.id, new.en);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS bf_modules_fts_ad AFTER DELETE ON bf_modules BEGIN
+            INSERT INTO bf_modules_fts(bf_modules_fts, rowid, en) VALUES ('delete', old.id, old.en);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS bf_modules_fts_au AFTER UPDATE OF en ON bf_modules BEGIN
+            INSERT INTO bf_modules_fts(bf_modules_fts, rowid, en) VALUES ('delete', old.id, old.en);
+            INSERT INTO bf_modules_fts(rowid, en) VALUES (new.id, new.en);
+        END
+    """)
+    if created:
+        conn.execute("INSERT INTO bf_modules_fts(bf_modules_fts) VALUES ('rebuild')")
+
+
+def bf_modules_search(query: str, weapon_type: str | None = None, limit: int = 50):
+    """
+    Поиск модулей BF по en: начало слова, затем bm25; без точных совпадений — нечёткие.
+    Каждая запись: {id, weapon_type, category, en, pos, match: prefix|exact|fuzzy}.
+    """
+    query = normalize_query(query)
+    if not query:
+        return []
+    type_filter = "AND m.weapon_type IN (?, ?)" if weapon_type else ""
+    type_params = (weapon_type, BF_SHARED_MODULES_TYPE) if weapon_type else ()
+    columns = "m.id, m.weapon_type, m.category, m.en, m.pos"
+
+    with get_connection() as conn:
+        if len(query) < MIN_QUERY:
+            rows = conn.execute(f"""
+                SELECT {columns} FROM bf_modules m
+                WHERE (m.en LIKE ? OR m.en LIKE ?) {type_filter}
+                ORDER BY m.category, m.pos, m.en
+                LIMIT ?
+            """, (f"{query}%", f"% {query}%", *type_params, limit)).fetchall()
+            return [{**dict(r), "match": "prefix"} for r in rows]
+        try:
+            rows = conn.execute(f"""
+                SELECT {columns} FROM bf_modules_fts f
+                JOIN bf_modules m ON m.id = f.rowid
+                WHERE bf_modules_fts MATCH ? {type_filter}
+                ORDER BY bm25(bf_modules_fts)
+                LIMIT ?
+            """, (fts_phrase(query), *type_params, limit * 3)).fetchall()
+        except sqlite3.OperationalError:
+            rows = conn.execute(f"""
+                SELECT {columns} FROM bf_modules m
+                WHERE m.en LIKE ? {type_filter}
+                ORDER BY m.category, m.pos, m.en
+                LIMIT ?
+            """, (f"%{query}%", *type_params, limit)).fetchall()
+            return [{**dict(r), "match": "exact"} for r in rows]
+
+        results = [dict(r) for r in rows]
+        for r in results:
+            r["match"] = "prefix" if prefix_hit(query, r["en"]) else "exact"
+        results.sort(key=lambda r: r["match"] != "prefix")
+        results = results[:limit]
+
+        if not results:
+            # Точных совпадений нет — вероятно опечатка: ищем по общим тройкам
+            candidates = conn.execute(f"""
+                SELECT {columns} FROM bf_modules_fts f
+                JOIN bf_modules m ON m.id = f.rowid
+                WHERE bf_modules_fts MATCH ? {type_filter}
+                ORDER BY bm25(bf_modules_fts)
+                LIMIT ?
+            """, (fts_fuzzy(query), *type_params, limit * 4)).fetchall()
+            fuzzy = []
+            for r in candidates:
+                score = similarity(query, r["en"])
+                if score >= FUZZY_MIN_SIMILARITY:
+                    fuzzy.append((score, {**dict(r), "match": "fuzzy"}))
+            fuzzy.sort(key=lambda item: -item[0])
+            results = [r for _, r in fuzzy[:limit]]
+    return results
+
 
 def add_bf_module(data):
     with get_connection() as conn:
@@ -307,54 +500,160 @@ def add_bf_module(data):
             int(data.get("pos", 0))
         ))
         conn.commit()
+    invalidate_bf_modules_cache(data.get("weapon_type"))
 
 
 def delete_bf_module(module_id):
     with get_connection() as conn:
+        row = conn.execute("SELECT weapon_type FROM bf_modules WHERE id = ?", (module_id,)).fetchone()
         conn.execute("DELETE FROM bf_modules WHERE id = ?", (module_id,))
         conn.commit()
+    if row:
+        invalidate_bf_modules_cache(row["weapon_type"])
+
+def bf_modules_bulk_upsert(weapon_type, rows, replace=False, dry_run=False) -> dict:
+    """
+    Импорт модулей BF-типа одной транзакцией: rows — [(category, en, pos)].
+    UPSERT по (weapon_type, category, en) через executemany; replace / dry_run —
+    как у database.modules_bulk_upsert. Возвращает diff {added, updated, unchanged, removed}.
+    """
+    weapon_type = (weapon_type or "").strip()
+    incoming = {}
+    for category, en, pos in rows:
+        key = ((category or "").strip(), (en or "").strip())
+        if key[0] and key[1]:
+            incoming[key] = int(pos or 0)
+
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {
+            (r["category"], r["en"]): r["pos"] for r in conn.execute(
+                "SELECT category, en, pos FROM bf_modules WHERE weapon_type = ?", (weapon_type,)
+            )
+        }
+        diff = {"added": [], "updated": [], "unchanged": [], "removed": []}
+        for key, pos in incoming.items():
+            if key not in existing:
+                diff["added"].append(key)
+            elif existing[key] != pos:
+                diff["updated"].append(key)
+            else:
+                diff["unchanged"].append(key)
+        if replace:
+            diff["removed"] = [key for key in existing if key not in incoming]
+        changed = diff["added"] or diff["updated"] or diff["removed"]
+        if not dry_run and changed:
+            conn.executemany("""
+                INSERT INTO bf_modules (weapon_type, category, en, pos)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(weapon_type, category, en) DO UPDATE SET pos = excluded.pos
+            """, [(weapon_type, *key, incoming[key]) for key in diff["added"] + diff["updated"]])
+            conn.executemany(
+                "DELETE FROM bf_modules WHERE weapon_type = ? AND category = ? AND en = ?",
+                [(weapon_type, *key) for key in diff["removed"]]
+            )
+        conn.commit()
+    if not dry_run and changed:
+        invalidate_bf_modules_cache(weapon_type)
+    return {name: [list(key) for key in keys] for name, keys in diff.items()}
+
+
+def bf_modules_export(weapon_type) -> dict:
+    """Модули BF-типа в формате data/modules-shv.json: {category: [en, ...]} (без общих 'shv')."""
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT category, en FROM bf_modules WHERE weapon_type = ? ORDER BY pos, id", (weapon_type,)
+        ).fetchall()
+        order = [r[0] for r in conn.execute(
+            "SELECT category FROM bf_modules WHERE weapon_type = ? GROUP BY category ORDER BY MIN(id)",
+            (weapon_type,)
+        )]
+    data = {category: [] for category in order}
+    for r in rows:
+        data[r["category"]].append(r["en"])
+    return data
+
+
+def _bf_build_from_row(r):
+    b = dict(r)
+
+    # --- categories ---
+    try:
+        if isinstance(b["categories"], str):
+            b["categories"] = json.loads(b["categories"])
+    except Exception:
+        try:
+            b["categories"] = eval(b["categories"])
+        except Exception:
+            b["categories"] = []
+
+    # --- tabs ---
+    try:
+        if isinstance(b["tabs"], str):
+            b["tabs"] = json.loads(b["tabs"])
+            # иногда items внутри вкладок тоже как строка
+            for t in b["tabs"]:
+                if isinstance(t.get("items"), str):
+                    t["items"] = json.loads(t["items"])
+    except Exception:
+        try:
+            b["tabs"] = eval(b["tabs"])
+        except Exception:
+            b["tabs"] = []
+
+    return b
 
-import json
 
 def get_all_bf_builds():
     with get_connection() as conn:
         rows = conn.execute("SELECT * FROM bf_builds ORDER BY id DESC").fetchall()
-        builds = []
-        for r in rows:
-            b = dict(r)
-
-            # --- categories ---
-            try:
-                if isinstance(b["categories"], str):
-                    b["categories"] = json.loads(b["categories"])
-            except Exception:
-                try:
-                    b["categories"] = eval(b["categories"])
-                except Exception:
-                    b["categories"] = []
-
-            # --- tabs ---
-            try:
-                if isinstance(b["tabs"], str):
-                    b["tabs"] = json.loads(b["tabs"])
-                    # иногда items внутри вкладок тоже как строка
-                    for t in b["tabs"]:
-                        if isinstance(t.get("items"), str):
-                            t["items"] = json.loads(t["items"])
-            except Exception:
-                try:
-                    b["tabs"] = eval(b["tabs"])
-                except Exception:
-                    b["tabs"] = []
-
-            builds.append(b)
-        return builds
+        return [_bf_build_from_row(r) for r in rows]
+
+
+# =====================================================
+# Ревизия каталога BF-сборок / дельта
+# =====================================================
+def _record_bf_build_change(conn, build_id, deleted=False):
+    conn.execute(
+        "INSERT INTO bf_build_changes (build_id, deleted, changed_at) VALUES (?, ?, ?)",
+        (int(build_id), 1 if deleted else 0, datetime.now().isoformat())
+    )
+
+
+def get_bf_builds_revision() -> int:
+    # Без кеша в процессе: MAX по первичному ключу дёшев, а журнал общий
+    # для всех воркеров — ETag не отстаёт от записей соседнего процесса.
+    with get_connection() as conn:
+        return int(conn.execute("SELECT COALESCE(MAX(revision), 0) FROM bf_build_changes").fetchone()[0])
+
+
+def get_bf_builds_changes(since: int, mode: str = "all"):
+    """
+    Дельта BF-каталога после ревизии since: {revision, upserted, deleted}.
+    Сборка, сменившая режим (mp/br), для чужого режима попадает в deleted.
+    """
+    with get_connection() as conn:
+        revision = conn.execute("SELECT COALESCE(MAX(revision), 0) FROM bf_build_changes").fetchone()[0]
+        changed_ids = [r[0] for r in conn.execute(
+            "SELECT DISTINCT build_id FROM bf_build_changes WHERE revision > ?", (int(since),)
+        )]
+        rows = []
+        if changed_ids:
+            placeholders = ",".join("?" * len(changed_ids))
+            rows = conn.execute(f"SELECT * FROM bf_builds WHERE id IN ({placeholders})", changed_ids).fetchall()
+
+    upserted = [_bf_build_from_row(r) for r in rows]
+    if mode != "all":
+        upserted = [b for b in upserted if (b.get("mode") or "mp") == mode]
+    alive = {b["id"] for b in upserted}
+    deleted = [b_id for b_id in changed_ids if b_id not in alive]
+    return {"revision": int(revision), "upserted": upserted, "deleted": deleted}
 
 
 
 def add_bf_build(data):
     with get_connection() as conn:
-        conn.execute("""
+        cur = conn.execute("""
             INSERT INTO bf_builds (title, weapon_type, top1, top2, top3, date, tabs, categories, mode)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
@@ -368,6 +667,8 @@ def add_bf_build(data):
             str(data.get("categories")),
             data.get("mode", "mp")  # ✅ default mp
         ))
+        _record_bf_build_change(conn, cur.lastrowid)
+        _reindex_bf_builds(conn, "id = ?", (cur.lastrowid,))
         conn.commit()
 
 def update_bf_build(build_id, data):
@@ -388,12 +689,106 @@ def update_bf_build(build_id, data):
             data.get("mode", "mp"),  # ✅ сохраняем режим
             build_id
         ))
+        _record_bf_build_change(conn, build_id)
+        _reindex_bf_builds(conn, "id = ?", (build_id,))
         conn.commit()
 
 def delete_bf_build(build_id):
     with get_connection() as conn:
         conn.execute("DELETE FROM bf_builds WHERE id = ?", (build_id,))
+        _record_bf_build_change(conn, build_id, deleted=True)
+        _unindex_bf_build(conn, build_id)
         conn.commit()
 
 
+# =====================================================
+# 🔎 Поиск BF-сборок (FTS5 trigram: название, тип, модули)
+# =====================================================
+# bf_builds_fts — обычная FTS-таблица, rowid = bf_builds.id; текст модулей
+# берётся из top1..3 и tabs (items + universal), поэтому индекс обновляют
+# add/update/delete_bf_build в той же транзакции, а не триггеры.
+BF_BUILDS_SEARCH_WEIGHTS = (10.0, 1.0, 2.0)   # bm25: title, weapon_type, modules
+
+
+def init_bf_builds_fts(conn):
+    try:
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'bf_builds_fts'"
+        ).fetchone() is None
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bf_builds_fts USING fts5(
+                title, weapon_type, modules, tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ bf_builds_fts недоступна: {e}")
+        return
+    if created:
+        _reindex_bf_builds(conn)
+
+
+def _reindex_bf_builds(conn, where="", params=()):
+    rows = conn.execute(f"SELECT * FROM bf_builds {'WHERE ' + where if where else ''}", params).fetchall()
+    docs = []
+    for r in rows:
+        b = _bf_build_from_row(r)
+        docs.append((
+            b["id"],
+            normalize_query(b.get("title") or ""),
+            normalize_query(b.get("weapon_type") or ""),
+            "; ".join(build_module_names(b)),
+        ))
+    try:
+        conn.executemany("DELETE FROM bf_builds_fts WHERE rowid = ?", [(d[0],) for d in docs])
+        conn.executemany("INSERT INTO bf_builds_fts(rowid, title, weapon_type, modules) VALUES (?, ?, ?, ?)", docs)
+    except sqlite3.OperationalError:
+        pass   # без FTS5 поиск идёт LIKE по названию
+
+
+def _unindex_bf_build(conn, build_id):
+    try:
+        conn.execute("DELETE FROM bf_builds_fts WHERE rowid = ?", (build_id,))
+    except sqlite3.OperationalError:
+        pass
+
+
+def bf_builds_search(query: str, mode: str = "all", weapon_type: str | None = None,
+                     limit: int = 20, offset: int = 0):
+    """
+    (всего найдено, страница BF-сборок) по названию, типу и модулям.
+    bm25 с весом названия выше модулей, затем новые выше; запросы < 3 символов — LIKE по началу слова.
+    """
+    query = normalize_query(query)
+    if not query:
+        return 0, []
+    filters, filter_params = [], []
+    if mode != "all":
+        filters.append("COALESCE(b.mode, 'mp') = ?")
+        filter_params.append(mode)
+    if weapon_type:
+        filters.append("b.weapon_type = ?")
+        filter_params.append(weapon_type)
+
+    if len(query) < MIN_QUERY:
+        match = "(f.title LIKE ? OR f.title LIKE ? OR f.modules LIKE ? OR f.modules LIKE ?)"
+        match_params = [f"{query}%", f"% {query}%", f"{query}%", f"% {query}%"]
+        order = "b.id DESC"
+    else:
+        match = "bf_builds_fts MATCH ?"
+        match_params = [fts_phrase(query)]
+        order = f"bm25(bf_builds_fts, {', '.join(map(str, BF_BUILDS_SEARCH_WEIGHTS))}), b.id DESC"
 
+    with get_connection() as conn:
+        try:
+            base = f"FROM bf_builds_fts f JOIN bf_builds b ON b.id = f.rowid WHERE {' AND '.join([match] + filters)}"
+            params = (*match_params, *filter_params)
+            total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        except sqlite3.OperationalError:
+            base = f"FROM bf_builds b WHERE {' AND '.join(['b.title LIKE ?'] + filters)}"
+            params = (f"%{query}%", *filter_params)
+            order = "b.id DESC"
+            total = conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT b.* {base} ORDER BY {order} LIMIT ? OFFSET ?", (*params, limit, offset)
+        ).fetchall() if total > offset else []
+    return int(total), [_bf_build_from_row(r) for r in rows]
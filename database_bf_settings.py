@@ -1,26 +1,17 @@
 import sqlite3
 import json
 from pathlib import Path
-from contextlib import contextmanager
+
+from database_pool import pooled_connection
 
 # === Путь к БД ===
 BF_DB_PATH = Path("/opt/ndloadouts/builds_bf.db")
 BF_DB_PATH.parent.mkdir(exist_ok=True)
 
 
-@contextmanager
 def get_bf_conn(row_mode: bool = False):
-    """Контекстный менеджер для соединения с БД Battlefield."""
-    conn = sqlite3.connect(BF_DB_PATH)
-    if row_mode:
-        conn.row_factory = sqlite3.Row
-    try:
-        conn.execute("PRAGMA foreign_keys = ON")
-        conn.execute("PRAGMA journal_mode = WAL")
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+    """Контекстный менеджер для соединения с БД Battlefield (из общего пула)."""
+    return pooled_connection(BF_DB_PATH, row_mode)
 
 
 def init_bf_settings_table():
@@ -0,0 +1,234 @@
+import time
+from datetime import datetime, timezone
+
+from database_analytics import get_analytics_conn
+
+# =====================================================
+# 📢 РАССЫЛКИ: ЗАДАНИЯ И ПОЛУЧАТЕЛИ (analytics.db)
+# =====================================================
+# Задание (broadcast_jobs) + строка на каждого получателя (broadcast_recipients).
+# Статусы получателя: pending -> sending -> sent / failed (или cancelled).
+# Перед запросом к Telegram строка переводится в sending и коммитится, поэтому
+# после падения процесса «sending» означает «доставка неизвестна»: такие строки
+# помечаются failed и НЕ отправляются повторно.
+# Заданием владеет один раннер (lease_owner/lease_until, продлевается на каждом
+# результате и heartbeat-ом раннера, пока порция в отправке — в том числе во время
+# ожиданий retry_after/бэкоффа): второй воркер или перезапущенный процесс
+# подхватывает задание только после истечения аренды.
+
+BROADCAST_LEASE_SECONDS = 30
+BROADCAST_HEARTBEAT_SECONDS = BROADCAST_LEASE_SECONDS / 3
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def init_broadcast_db():
+    with get_analytics_conn() as conn:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',   -- pending / running / done / cancelled
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_by TEXT,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            lease_owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0
+        )""")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+            chat_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',   -- pending / sending / sent / failed / cancelled
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (job_id, chat_id)
+        ) WITHOUT ROWID""")
+        conn.execute("CREATE INDEX IF NOT EXISTS broadcast_recipients_status ON broadcast_recipients(job_id, status)")
+
+
+def create_broadcast_job(message: str, chat_ids, created_by: str = None) -> dict:
+    """Новое задание; повторяющиеся chat_id схлопываются (одно сообщение на получателя)."""
+    chat_ids = list(dict.fromkeys(str(c).strip() for c in chat_ids if str(c).strip()))
+    now = _now_iso()
+    with get_analytics_conn() as conn:
+        cur = conn.execute(
+            "INSERT INTO broadcast_jobs (message, status, total, created_by, created_at) VALUES (?, 'pending', ?, ?, ?)",
+            (message, len(chat_ids), created_by, now)
+        )
+        job_id = cur.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients (job_id, chat_id, updated_at) VALUES (?, ?, ?)",
+            [(job_id, chat_id, now) for chat_id in chat_ids]
+        )
+    return {"id": job_id, "total": len(chat_ids)}
+
+
+def claim_next_job(owner: str, lease: float = BROADCAST_LEASE_SECONDS):
+    """
+    Взять в работу старейшее незавершённое задание, чья аренда свободна или истекла.
+    Если задание перехвачено (у другого владельца или после release) — его строки
+    в sending помечаются failed.
+    Возвращает {id, message} или None.
+    """
+    now = time.time()
+    with get_analytics_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""
+            SELECT id, message, lease_owner FROM broadcast_jobs
+            WHERE status IN ('pending', 'running')
+              AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?)
+            ORDER BY id
+            LIMIT 1
+        """, (owner, now)).fetchone()
+        if row is None:
+            return None
+        job_id, message, prev_owner = row
+
+        # В sending у чужого/отпущенного задания остаются только прерванные отправки
+        if prev_owner != owner:
+            lost = conn.execute("""
+                UPDATE broadcast_recipients
+                SET status = 'failed', error = 'interrupted: delivery state unknown', updated_at = ?
+                WHERE job_id = ? AND status = 'sending'
+            """, (_now_iso(), job_id)).rowcount
+            if lost:
+                conn.execute("UPDATE broadcast_jobs SET failed = failed + ? WHERE id = ?", (lost, job_id))
+
+        conn.execute("""
+            UPDATE broadcast_jobs
+            SET status = 'running', lease_owner = ?, lease_until = ?, started_at = COALESCE(started_at, ?)
+            WHERE id = ?
+        """, (owner, now + lease, _now_iso(), job_id))
+    return {"id": job_id, "message": message}
+
+
+def claim_recipients(job_id: int, owner: str, limit: int, lease: float = BROADCAST_LEASE_SECONDS) -> list:
+    """
+    Следующая порция получателей: pending -> sending (коммит до отправки).
+    Пустой список — задание кончилось, отменено или аренда потеряна.
+    """
+    with get_analytics_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        job = conn.execute(
+            "SELECT status, lease_owner FROM broadcast_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if not job or job[0] != "running" or job[1] != owner:
+            return []
+        chat_ids = [r[0] for r in conn.execute(
+            "SELECT chat_id FROM broadcast_recipients WHERE job_id = ? AND status = 'pending' LIMIT ?",
+            (job_id, limit)
+        ).fetchall()]
+        if chat_ids:
+            now = _now_iso()
+            conn.executemany("""
+                UPDATE broadcast_recipients SET status = 'sending', attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ? AND chat_id = ? AND status = 'pending'
+            """, [(now, job_id, chat_id) for chat_id in chat_ids])
+            conn.execute("UPDATE broadcast_jobs SET lease_until = ? WHERE id = ?", (time.time() + lease, job_id))
+    return chat_ids
+
+
+def record_broadcast_result(job_id: int, owner: str, chat_id: str, ok: bool, error: str = "",
+                            lease: float = BROADCAST_LEASE_SECONDS):
+    """Итог отправки одному получателю + счётчики задания + продление аренды."""
+    with get_analytics_conn() as conn:
+        updated = conn.execute("""
+            UPDATE broadcast_recipients SET status = ?, error = ?, updated_at = ?
+            WHERE job_id = ? AND chat_id = ? AND status = 'sending'
+        """, ("sent" if ok else "failed", error or None, _now_iso(), job_id, str(chat_id))).rowcount
+        if updated:
+            column = "sent" if ok else "failed"
+            conn.execute(f"UPDATE broadcast_jobs SET {column} = {column} + 1 WHERE id = ?", (job_id,))
+        conn.execute(
+            "UPDATE broadcast_jobs SET lease_until = ? WHERE id = ? AND lease_owner = ?",
+            (time.time() + lease, job_id, owner)
+        )
+
+
+def renew_lease(job_id: int, owner: str, lease: float = BROADCAST_LEASE_SECONDS) -> bool:
+    """Продлить аренду задания; False — задание уже не наше (перехвачено/отменено)."""
+    with get_analytics_conn() as conn:
+        return conn.execute(
+            "UPDATE broadcast_jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (time.time() + lease, job_id, owner)
+        ).rowcount > 0
+
+
+def release_job(job_id: int, owner: str):
+    """
+    Отпустить задание: done, если получателей не осталось; иначе аренда снимается,
+    и задание продолжит следующий раннер (остановка процесса/деплой).
+    """
+    with get_analytics_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        left = conn.execute(
+            "SELECT COUNT(*) FROM broadcast_recipients WHERE job_id = ? AND status IN ('pending', 'sending')",
+            (job_id,)
+        ).fetchone()[0]
+        if left == 0:
+            conn.execute("""
+                UPDATE broadcast_jobs SET status = 'done', finished_at = ?, lease_owner = NULL, lease_until = 0
+                WHERE id = ? AND status = 'running' AND lease_owner = ?
+            """, (_now_iso(), job_id, owner))
+        else:
+            conn.execute(
+                "UPDATE broadcast_jobs SET lease_owner = NULL, lease_until = 0 WHERE id = ? AND lease_owner = ?",
+                (job_id, owner)
+            )
+
+
+def cancel_broadcast_job(job_id: int) -> bool:
+    """Отмена: неотправленные получатели -> cancelled; уже отправляемые допишет раннер."""
+    with get_analytics_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        updated = conn.execute("""
+            UPDATE broadcast_jobs SET status = 'cancelled', finished_at = ?
+            WHERE id = ? AND status IN ('pending', 'running')
+        """, (_now_iso(), job_id)).rowcount
+        if updated:
+            conn.execute("""
+                UPDATE broadcast_recipients SET status = 'cancelled', updated_at = ?
+                WHERE job_id = ? AND status = 'pending'
+            """, (_now_iso(), job_id))
+    return bool(updated)
+
+
+def get_broadcast_job(job_id: int, errors_limit: int = 20):
+    """Прогресс задания: счётчики по статусам + последние ошибки."""
+    with get_analytics_conn(row_mode=True) as conn:
+        job = conn.execute("""
+            SELECT id, status, total, sent, failed, created_by, created_at, started_at, finished_at
+            FROM broadcast_jobs WHERE id = ?
+        """, (job_id,)).fetchone()
+        if job is None:
+            return None
+        result = dict(job)
+        by_status = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        result["pending"] = by_status.get("pending", 0)
+        result["sending"] = by_status.get("sending", 0)
+        result["cancelled"] = by_status.get("cancelled", 0)
+        result["errors"] = [dict(r) for r in conn.execute("""
+            SELECT chat_id, error, updated_at FROM broadcast_recipients
+            WHERE job_id = ? AND status = 'failed'
+            ORDER BY updated_at DESC
+            LIMIT ?
+        """, (job_id, errors_limit)).fetchall()]
+    return result
+
+
+def list_broadcast_jobs(limit: int = 20) -> list:
+    with get_analytics_conn(row_mode=True) as conn:
+        return [dict(r) for r in conn.execute("""
+            SELECT id, status, total, sent, failed, created_at, finished_at, substr(message, 1, 100) AS preview
+            FROM broadcast_jobs ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()]
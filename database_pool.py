@@ -0,0 +1,134 @@
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+# =====================================================
+# 🔌 ПУЛ SQLite-СОЕДИНЕНИЙ (по одному на поток и файл БД)
+# =====================================================
+# Соединение открывается один раз на пару (поток, файл) и переиспользуется:
+# PRAGMA применяются только при открытии, а не на каждый запрос.
+# Все модули БД (builds.db, bf_challenges.db, builds_bf.db,
+# version_history.db, analytics.db) берут соединения отсюда.
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",       # ~16 МБ страничного кеша на соединение
+    "PRAGMA mmap_size = 268435456",     # 256 МБ memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry = {}   # (thread_ident, path) -> sqlite3.Connection
+_generation = 0  # растёт в close_all: соединения потоков старого поколения закрыты
+_stats = {"opened": 0, "reused": 0, "closed": 0}
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # check_same_thread=False нужен только чтобы закрыть соединение умершего потока;
+    # само соединение используется лишь своим потоком.
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for pragma in PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.DatabaseError:
+            pass
+    return conn
+
+
+def _sweep_dead_threads():
+    """Закрывает соединения потоков, которые уже завершились (вызывается под _registry_lock)."""
+    alive = {t.ident for t in threading.enumerate()}
+    for key in [k for k in _registry if k[0] not in alive]:
+        try:
+            _registry.pop(key).close()
+        except sqlite3.Error:
+            pass
+        _stats["closed"] += 1
+
+
+def get_connection(path) -> sqlite3.Connection:
+    """Соединение текущего потока с файлом path (открывается при первом обращении)."""
+    path = str(path)
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _generation:
+        # Первое обращение потока или пул закрыт close_all: старые соединения уже закрыты
+        conns = _local.conns = {}
+        _local.depth = {}
+        _local.generation = _generation
+
+    conn = conns.get(path)
+    if conn is not None:
+        with _registry_lock:
+            _stats["reused"] += 1
+        return conn
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = _open(path)
+    conns[path] = conn
+    _local.depth[path] = 0
+    with _registry_lock:
+        _sweep_dead_threads()
+        _registry[(threading.get_ident(), path)] = conn
+        _stats["opened"] += 1
+    return conn
+
+
+@contextmanager
+def pooled_connection(path, row_mode: bool = False):
+    """
+    Контекст как у прежних get_conn: commit при выходе, rollback при ошибке.
+    Вложенные контексты на тот же файл делят транзакцию внешнего.
+    """
+    conn = get_connection(path)
+    key = str(path)
+    depth = _local.depth   # словарь поколения, которому принадлежит conn
+    prev_factory = conn.row_factory
+    conn.row_factory = sqlite3.Row if row_mode else None
+    depth[key] += 1
+    outermost = depth[key] == 1
+    try:
+        yield conn
+        if outermost:
+            conn.commit()
+    except BaseException:
+        if outermost:
+            conn.rollback()
+        raise
+    finally:
+        depth[key] -= 1
+        conn.row_factory = prev_factory
+
+
+def close_all():
+    """
+    Закрыть все соединения пула (shutdown). Новое поколение пула: потоки,
+    державшие закрытые соединения, при следующем обращении откроют новые.
+    """
+    global _generation
+    with _registry_lock:
+        _generation += 1
+        for conn in _registry.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            _stats["closed"] += 1
+        _registry.clear()
+
+
+def pool_stats() -> dict:
+    """Статистика пула: открыто/переиспользовано/закрыто и живые соединения по файлам."""
+    with _registry_lock:
+        per_db = {}
+        for _, path in _registry:
+            per_db[path] = per_db.get(path, 0) + 1
+        return {
+            **_stats,
+            "open_connections": len(_registry),
+            "per_db": per_db,
+        }
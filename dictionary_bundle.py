@@ -0,0 +1,91 @@
+import gzip
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+from database import get_modules_json, modules_generation
+from database_bf import get_bf_modules_json, bf_modules_generation
+
+# =====================================================
+# 📚 СЛОВАРЬ ОДНИМ ОТВЕТОМ (GET /api/dictionary)
+# =====================================================
+# Типы оружия + сгруппированные модули каждого типа для Warzone и BF:
+#   {"revision": "...", "wz": {"types": [...], "modules": {type: {category: [...]}}},
+#                       "bf": {"types": [...], "modules": {...}}}
+# Вместо /api/types + N запросов /api/modules/{type} клиент делает один
+# запрос и хранит ответ в localStorage, проверяя его через If-None-Match.
+# Бандл склеивается из готовых JSON-байт кешей модулей (database /
+# database_bf) без повторной сериализации. revision — хеш содержимого:
+# он одинаков во всех воркерах и меняется при любой правке модулей или типов.
+# Готовый бандл кешируется по ключу (ревизии словарей WZ/BF из БД, mtime
+# файлов типов): ревизии поднимают триггеры на таблицах модулей, поэтому
+# правка из любого воркера uvicorn сбрасывает бандл во всех процессах,
+# а ревалидация (304) не пересобирает и не хеширует тело.
+# gzip считается один раз на ревизию.
+
+WZ_TYPES_FILE = Path("data/types.json")
+BF_TYPES_FILE = Path("data/types-bf.json")
+
+_lock = threading.Lock()
+_types_cache = {}        # path -> (mtime_ns, list типов, bytes)
+_gzip_cache = (None, None)   # (revision, gzip bytes) последней сжатой ревизии
+_bundle_cache = (None, None, None)   # (ключ, revision, bytes) последнего бандла
+
+
+def _load_types(path: Path):
+    """Типы из JSON-файла (перечитывается только при смене mtime)."""
+    mtime = path.stat().st_mtime_ns
+    cached = _types_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+    types = json.loads(path.read_text(encoding="utf-8"))
+    payload = json.dumps(types, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with _lock:
+        _types_cache[path] = (mtime, types, payload)
+    return types, payload
+
+
+def _section(types_file: Path, modules_json) -> bytes:
+    types, types_payload = _load_types(types_file)
+    modules = b",".join(
+        json.dumps(t["key"], ensure_ascii=False).encode("utf-8") + b":" + modules_json(t["key"])
+        for t in types if t.get("key")
+    )
+    return b'{"types":' + types_payload + b',"modules":{' + modules + b"}}"
+
+
+def _bundle_key() -> tuple:
+    """Ключ валидности бандла: общий для всех процессов (БД + файлы типов)."""
+    return (modules_generation(), bf_modules_generation(),
+            WZ_TYPES_FILE.stat().st_mtime_ns, BF_TYPES_FILE.stat().st_mtime_ns)
+
+
+def get_dictionary_bundle() -> tuple[str, bytes]:
+    """(revision, JSON bytes) текущего словаря."""
+    global _bundle_cache
+    # Ключ берём до сборки: запись во время сборки сменит ревизию,
+    # и следующий запрос пересоберёт бандл
+    key = _bundle_key()
+    cached_key, revision, payload = _bundle_cache
+    if cached_key == key:
+        return revision, payload
+
+    body = b'"wz":' + _section(WZ_TYPES_FILE, get_modules_json) + b',"bf":' + _section(BF_TYPES_FILE, get_bf_modules_json)
+    revision = hashlib.sha256(body).hexdigest()[:16]
+    payload = b'{"revision":"' + revision.encode() + b'",' + body + b"}"
+    with _lock:
+        _bundle_cache = (key, revision, payload)
+    return revision, payload
+
+
+def gzip_dictionary_bundle(revision: str, payload: bytes) -> bytes:
+    """gzip бандла; для той же ревизии — из кеша."""
+    global _gzip_cache
+    cached_revision, cached = _gzip_cache
+    if cached_revision == revision:
+        return cached
+    compressed = gzip.compress(payload, compresslevel=6, mtime=0)
+    with _lock:
+        _gzip_cache = (revision, compressed)
+    return compressed
@@ -9,27 +9,27 @@
 # -------------------------------
 import os
 import json
+import base64
 import hmac
 import hashlib
 import sqlite3
 import asyncio
+import zlib
 import subprocess
-from pathlib import Path
 from typing import List
-from urllib.parse import parse_qs, unquote
 from datetime import datetime, timezone, timedelta
 import requests
-from dotenv import load_dotenv, set_key, dotenv_values
+from dotenv import load_dotenv
 
 # -------------------------------
 # ⚙️ FASTAPI IMPORTS
 # -------------------------------
 from fastapi import (
     FastAPI, Request, Body, BackgroundTasks,
-    HTTPException, Query, APIRouter
+    HTTPException, Query, APIRouter, Depends
 )
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -37,9 +37,9 @@ from fastapi.templating import Jinja2Templates
 # 📦 LOCAL MODULES (Warzone DB / Versions DB)
 # -------------------------------
 from database import (
-    init_db, get_all_builds, add_build, delete_build_by_id, get_all_users,
-    save_user, update_build_by_id, modules_grouped_by_category,
-    module_add_or_update, module_update, module_delete,
+    init_db, get_builds_snapshot, get_builds_changes, add_build, delete_build_by_id, get_users,
+    save_user, update_build_by_id, get_modules_json, modules_search, builds_search,
+    module_add_or_update, module_update, module_delete, modules_delete_category,
 )
 
 # -------------------------------
@@ -48,13 +48,17 @@ from database import (
 from database_bf import (
     init_bf_builds_table,
     get_all_bf_builds,
+    get_bf_builds_revision,
+    get_bf_builds_changes,
     add_bf_build,
     update_bf_build,
     delete_bf_build,
     get_bf_weapon_types,
     add_bf_weapon_type,
     delete_bf_weapon_type,
-    get_bf_modules_by_type,
+    get_bf_modules_json,
+    bf_modules_search,
+    bf_builds_search,
     add_bf_module,
     delete_bf_module,
     init_bf_db, get_bf_conn,
@@ -68,19 +72,39 @@ from database_bf_settings import (
 )
 
 
+from database_pool import pool_stats, close_all as close_db_pool
+from database_async import run_db, shutdown_db_executor
+from analytics_writer import analytics_writer, write_events_batch
+from presence import presence
+from admin_roles import roles
+from telegram_auth import init_data_auth
+from static_assets import assets, pick_encoding, ASSET_CACHE_CONTROL
+from modules_io import (
+    import_modules, import_data_file, export_modules, check_target as check_modules_target,
+    DATA_DIR as MODULES_DATA_DIR,
+)
+from dictionary_bundle import get_dictionary_bundle, gzip_dictionary_bundle
+from broadcast_runner import broadcast_runner
+from database_broadcast import (
+    init_broadcast_db, create_broadcast_job, get_broadcast_job, cancel_broadcast_job, list_broadcast_jobs,
+)
+from analytics_stream import analytics_hub, sse_message, ANALYTICS_STREAM_PING
+from database_analytics import (
+    init_analytics_db, get_dashboard_data, archive_expired_partitions, get_recently_seen,
+    get_user_profiles_page, USER_SORTS,
+    clear_analytics_data, get_broadcast_recipients,
+)
+
 from database_versions import (
     init_versions_table,
     add_version, get_versions, update_version, delete_version, set_version_status
 )
 
-from fastapi import Depends
-
 # =====================================================
 # 🌍 GLOBAL CONFIG
 # =====================================================
 load_dotenv()
 
-ANALYTICS_DB = Path("/opt/ndloadouts_storage/analytics.db")
 WEBAPP_URL = os.getenv("WEBAPP_URL")
 GITHUB_SECRET = os.getenv("WEBHOOK_SECRET", "")
 
@@ -102,48 +126,94 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/data", StaticFiles(directory="data"), name="data")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = assets.url   # {{ asset_url('app.js') }} -> /assets/<digest>/app.js
 
 # =====================================================
 # 🧰 UTILS
 # =====================================================
 def extract_user_roles(init_data_str: str):
     """
-    Извлекает user_id и роли из Telegram initData.
-    Возвращает: (user_id, is_admin, is_super_admin)
+    Извлекает user_id и роли из Telegram initData (подпись проверяется, см. telegram_auth).
+    Возвращает: (user_id, is_admin, is_super_admin); для неподлинного initData — (None, False, False).
     """
-    try:
-        if not init_data_str:
-            return None, False, False
+    user = init_data_auth.verify(init_data_str or "")
+    if not user:
+        return None, False, False
 
-        parsed = parse_qs(init_data_str)
-        user_data = parsed.get("user", [None])[0]
-        if not user_data:
-            return None, False, False
+    user_id = str(user.get("id"))
+    is_admin, is_super_admin = roles.roles(user_id)
+    return user_id, is_admin, is_super_admin
 
-        user_json = json.loads(unquote(user_data))
-        user_id = str(user_json.get("id"))
 
-        env_vars = dotenv_values("/opt/ndloadouts/.env")
-        admin_ids = set(x.strip() for x in env_vars.get("ADMIN_IDS", "").split(",") if x.strip())
-        admin_dop = set(x.strip() for x in env_vars.get("ADMIN_DOP", "").split(",") if x.strip())
+async def request_init_data(request: Request) -> str:
+    """
+    initData запроса: заголовок X-Telegram-Init-Data, ?initData= или поле initData JSON-тела.
+    """
+    init_data = request.headers.get("x-telegram-init-data") or request.query_params.get("initData")
+    if init_data:
+        return init_data
+    if request.method in ("POST", "PUT", "PATCH", "DELETE"):
+        try:
+            body = await request.json()   # тело кэшируется в Request, эндпоинт прочитает его снова
+        except Exception:
+            return ""
+        if isinstance(body, dict):
+            return str(body.get("initData") or "")
+    return ""
 
-        is_super_admin = user_id in admin_ids
-        is_admin = is_super_admin or user_id in admin_dop
 
-        return user_id, is_admin, is_super_admin
-    except Exception as e:
-        print(f"[extract_user_roles ERROR] {e}")
-        return None, False, False
+async def telegram_user(init_data: str = Depends(request_init_data)):
+    """
+    Зависимость: (user_id, is_admin, is_super_admin) из проверенного initData.
+    """
+    return extract_user_roles(init_data)
 
 
-def ensure_admin_from_init(init_data_str: str):
+def require_admin(user: tuple = Depends(telegram_user)) -> str:
     """
-    Бросает 403, если пользователь не админ.
+    Зависимость для админских эндпоинтов: 403, если пользователь не админ. Возвращает user_id.
     """
-    uid, is_admin, _ = extract_user_roles(init_data_str or "")
+    user_id, is_admin, _ = user
     if not is_admin:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-    return uid
+    return user_id
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Проверяет If-None-Match запроса против ETag (поддерживает списки, * и W/).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def catalog_response(request: Request, revision: int, etag: str, content: bytes | None):
+    """
+    Ответ каталога с ETag по ревизии: 304, если клиент уже видел эту ревизию.
+    content=None допустим только когда заранее известно, что будет 304.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Catalog-Revision": str(revision)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def catalog_delta_response(since: int, delta: dict):
+    """
+    Ответ на ?since=<revision>. Если клиент впереди сервера (БД пересоздана),
+    в upserted уже лежит полный список — помечаем ответ флагом reset.
+    """
+    headers = {"Cache-Control": "no-store", "X-Catalog-Revision": str(delta["revision"])}
+    if since > delta["revision"]:
+        delta["deleted"] = []
+        delta["reset"] = True
+    else:
+        delta["reset"] = False
+    return JSONResponse(delta, headers=headers)
 
 
 def prettify_time(ts: str):
@@ -161,50 +231,18 @@ def prettify_time(ts: str):
 # =====================================================
 # 🔐 STARTUP (инициализация таблиц/БД)
 # =====================================================
-def init_analytics_db():
+def seed_presence():
     """
-    Создание таблиц аналитики/профилей пользователей.
+    Прогрев трекера присутствия после рестарта: кто был активен в пределах окна онлайна.
     """
-    try:
-        ANALYTICS_DB.parent.mkdir(parents=True, exist_ok=True)
-        conn = sqlite3.connect(ANALYTICS_DB)
-        cur = conn.cursor()
-
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS analytics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            action TEXT,
-            details TEXT,
-            timestamp TEXT
-        )""")
-
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS errors (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            error TEXT,
-            details TEXT,
-            timestamp TEXT
-        )""")
-
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS user_profiles (
-            user_id TEXT PRIMARY KEY,
-            first_name TEXT,
-            username TEXT,
-            last_seen TEXT,
-            platform TEXT,
-            total_actions INTEGER DEFAULT 0,
-            first_seen TEXT,
-            last_action TEXT
-        )""")
-
-        conn.commit()
-        conn.close()
-        print("✅ Analytics DB initialized")
-    except Exception as e:
-        print(f"❌ Analytics DB error: {e}")
+    for user_id, last_seen, platform, last_action in get_recently_seen(presence.window):
+        try:
+            seen = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
+            if seen.tzinfo is None:
+                seen = seen.replace(tzinfo=timezone.utc)
+        except (AttributeError, ValueError):
+            continue
+        presence.touch(user_id, platform or "unknown", last_action or "", at=seen.timestamp())
 
 
 @app.on_event("startup")
@@ -215,27 +253,107 @@ def startup_all():
     try:
         init_db()
         init_versions_table()
-        init_analytics_db()
+        try:
+            init_analytics_db()
+            init_broadcast_db()
+            seed_presence()
+            print("✅ Analytics DB initialized")
+        except Exception as e:
+            print(f"❌ Analytics DB error: {e}")
 
         init_bf_builds_table()
         init_bf_db()
         init_bf_settings_table()
         ensure_section_column()
 
+        manifest = assets.build()
+        print(f"✅ Static manifest: {len(manifest)} files")
+
         print("✅ Startup init complete")
     except Exception as e:
         print(f"⚠️ Startup init error: {e}")
 
+
+ANALYTICS_ARCHIVE_INTERVAL = int(os.getenv("ANALYTICS_ARCHIVE_INTERVAL", "3600"))  # сек
+_archive_task = None
+
+
+async def analytics_archive_loop():
+    """
+    Периодическая архивация месячных партиций аналитики старше ретеншна.
+    """
+    while True:
+        try:
+            for item in await run_db(archive_expired_partitions):
+                print(f"📦 Analytics archived: {item['partition']} {item['month']} ({item['rows']} rows)")
+        except Exception as e:
+            print(f"❌ Analytics archive error: {e}")
+        await asyncio.sleep(ANALYTICS_ARCHIVE_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    """
+    Фоновые задачи event loop (очередь записи аналитики, рассылки, архивация партиций).
+    """
+    global _archive_task
+    await analytics_writer.start()
+    await broadcast_runner.start()
+    _archive_task = asyncio.create_task(analytics_archive_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_all():
+    """
+    Остановка рассылок (с продолжением после рестарта), досброс очереди аналитики,
+    остановка пула потоков БД и закрытие соединений SQLite.
+    """
+    if _archive_task:
+        _archive_task.cancel()
+    await broadcast_runner.stop()
+    await analytics_writer.stop()
+    shutdown_db_executor()
+    close_db_pool()
+
 # =====================================================
 # 🏠 ROOT + GITHUB WEBHOOK
 # =====================================================
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """
-    Главная страница WebApp (скармливаем fresh version для кеш-бастинга статики).
+    Главная страница WebApp. Статика подключается через asset_url (адрес меняется
+    только вместе с содержимым файла), поэтому сама страница не кэшируется.
     """
-    version = int(datetime.utcnow().timestamp())
-    return templates.TemplateResponse("index.html", {"request": request, "version": version})
+    response = templates.TemplateResponse("index.html", {"request": request})
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.get("/assets/{digest}/{path:path}")
+def static_asset(digest: str, path: str, request: Request):
+    """
+    Файл из static/ по адресу с отпечатком: immutable-кэш, gzip/br по Accept-Encoding.
+    Устаревший digest получает текущую версию файла без долгого кэша.
+    """
+    asset = assets.get(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # br/gzip/исходник — разные байты, поэтому у каждого свой сильный ETag
+    encoding, body = pick_encoding(asset, request.headers.get("accept-encoding"))
+    etag = f'"{asset.digest}-{encoding}"' if encoding else f'"{asset.digest}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": ASSET_CACHE_CONTROL if digest == asset.digest else "no-cache",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+    return FileResponse(asset.file, media_type=asset.media_type, headers=headers)
 
 
 @app.post("/webhook")
@@ -254,24 +372,94 @@ async def webhook(request: Request, background_tasks: BackgroundTasks):
     background_tasks.add_task(subprocess.call, ["/bin/bash", "/opt/ndloadouts/deploy.sh"])
     return {"status": "ok"}
 
+
+@app.get("/api/system/db-pool")
+def api_db_pool_stats(_admin: str = Depends(require_admin)):
+    """
+    Статистика пула SQLite-соединений (только админы).
+    """
+    return pool_stats()
+
 # =====================================================
 # ⚔️ WARZONE — MODULES DICT API
 # =====================================================
+@app.get("/api/modules/search")
+async def api_modules_search(
+    q: str = Query(""),
+    game: str = Query("wz"),
+    weapon_type: str | None = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Поиск модулей по названию (FTS5 trigram: подстрока, ru/en, опечатки).
+    game=wz — weapon_modules (en/ru), game=bf — bf_modules (с общими 'shv').
+    Объявлен до /api/modules/{weapon_type}, иначе "search" примется за тип оружия.
+    """
+    if game not in ("wz", "bf"):
+        raise HTTPException(status_code=400, detail="game: wz или bf")
+    search = bf_modules_search if game == "bf" else modules_search
+    results = await run_db(search, q, weapon_type, limit)
+    return {"query": q, "game": game, "results": results}
+
+
+@app.get("/api/modules/export")
+async def api_modules_export(
+    game: str = Query("wz"),
+    weapon_type: str = Query(...),
+    _admin: str = Depends(require_admin),
+):
+    """
+    Словарь типа в формате data/modules-*.json (только админы).
+    """
+    try:
+        data = await run_db(export_modules, game, weapon_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(data, headers={
+        "Content-Disposition": f'attachment; filename="modules-{weapon_type}.json"'
+    })
+
+
+@app.post("/api/modules/import")
+async def api_modules_import(payload: dict = Body(...), _admin: str = Depends(require_admin)):
+    """
+    Массовый импорт модулей типа одной транзакцией (только админы).
+    body: {game: wz|bf, weapon_type, modules: {category: [...]}, dry_run, replace}.
+    Без modules берётся data/modules-<weapon_type>.json.
+    dry_run — только diff (added/updated/removed), без записи.
+    """
+    game = payload.get("game", "wz")
+    weapon_type = (payload.get("weapon_type") or "").strip()
+    dry_run = bool(payload.get("dry_run"))
+    replace = bool(payload.get("replace"))
+    try:
+        if payload.get("modules") is not None:
+            return await run_db(import_modules, game, weapon_type, payload["modules"], replace, dry_run)
+        check_modules_target(game, weapon_type)   # weapon_type попадает в путь файла
+        path = MODULES_DATA_DIR / f"modules-{weapon_type}.json"
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail=f"Нет файла modules-{weapon_type}.json")
+        return await run_db(import_data_file, path, replace, dry_run, game, weapon_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/api/modules/{weapon_type}")
 def api_modules_list(weapon_type: str):
     """
     Получить словарь модулей по типу оружия, сгруппированный по категориям.
+    Отдаётся готовый JSON из кеша (сбрасывается при правках модулей типа).
     """
-    return modules_grouped_by_category(weapon_type)
+    return Response(content=get_modules_json(weapon_type), media_type="application/json")
 
 
 @app.post("/api/modules")
-async def api_modules_add(payload: dict = Body(...)):
+async def api_modules_add(payload: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Добавление или обновление конкретного модуля (только админы).
     """
-    ensure_admin_from_init(payload.get("initData", ""))
-    module_add_or_update(
+    await run_db(
+        module_add_or_update,
         weapon_type=payload["weapon_type"],
         category=payload["category"],
         en=payload["en"],
@@ -282,12 +470,12 @@ async def api_modules_add(payload: dict = Body(...)):
 
 
 @app.put("/api/modules/{module_id}")
-async def api_modules_update(module_id: int, payload: dict = Body(...)):
+async def api_modules_update(module_id: int, payload: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Обновление полей модуля (только админы).
     """
-    ensure_admin_from_init(payload.get("initData", ""))
-    module_update(
+    await run_db(
+        module_update,
         module_id,
         category=payload.get("category"),
         en=payload.get("en"),
@@ -298,173 +486,116 @@ async def api_modules_update(module_id: int, payload: dict = Body(...)):
 
 
 @app.delete("/api/modules/{module_id}")
-async def api_modules_delete(module_id: int, payload: dict = Body(...)):
+async def api_modules_delete(module_id: int, payload: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Удаление модуля по ID (только админы).
     """
-    ensure_admin_from_init(payload.get("initData", ""))
-    module_delete(module_id)
+    await run_db(module_delete, module_id)
     return {"status": "ok"}
 
 
 @app.delete("/api/modules/{weapon_type}/{category}")
-async def api_modules_delete_category(weapon_type: str, category: str, payload: dict = Body(...)):
+async def api_modules_delete_category(weapon_type: str, category: str, payload: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Удаление ВСЕХ модулей категории для weapon_type (только админы).
-    Это оформленный вариант «сырого» блока из исходника.
     """
-    ensure_admin_from_init(payload.get("initData", ""))
-
-    conn = sqlite3.connect("/opt/ndloadouts_storage/builds.db")
-    cur = conn.cursor()
-
-    # Проверяем наличие категории
-    cur.execute("""
-        SELECT id FROM modules 
-        WHERE weapon_type = ? AND category = ?
-    """, (weapon_type, category))
-    rows = cur.fetchall()
-
-    if not rows:
-        conn.close()
+    deleted = await run_db(modules_delete_category, weapon_type, category)
+    if not deleted:
         raise HTTPException(status_code=404, detail=f"Категория '{category}' не найдена для типа {weapon_type}")
 
-    # Удаляем все модули этой категории
-    cur.execute("""
-        DELETE FROM modules 
-        WHERE weapon_type = ? AND category = ?
-    """, (weapon_type, category))
-    conn.commit()
-    conn.close()
-
     return {"status": "ok", "message": f"Категория '{category}' удалена"}
 
 # =====================================================
 # ⚔️ WARZONE — BUILDS API
 # =====================================================
 @app.get("/api/builds")
-async def api_builds(category: str = Query("all")):
+async def api_builds(request: Request, category: str = Query("all"), since: int | None = Query(None)):
     """
     Получение списка сборок с сортировкой:
     1) top1/top2/top3 приоритет
     2) свежесть даты (по убыванию)
     Фильтрация по категории (если не 'all').
+    ETag = ревизия каталога (304, если не менялся).
+    ?since=<revision> — только изменённые/удалённые сборки после ревизии.
     """
     try:
-        builds = get_all_builds()
-
-        if category != "all":
-            builds = [b for b in builds if category in (b.get("categories") or [])]
-
-        def top_priority(b):
-            if b.get("top1"): return 1
-            if b.get("top2"): return 2
-            if b.get("top3"): return 3
-            return 999
-
-        def date_ts(b):
-            s = (b.get("date") or "").strip()
-            for fmt in ("%d.%m.%Y", "%Y-%m-%d", "%Y.%m.%d"):
-                try:
-                    return datetime.strptime(s, fmt).timestamp()
-                except Exception:
-                    continue
-            return 0
-
-        builds.sort(key=lambda b: (top_priority(b), -date_ts(b)))
-        return JSONResponse(builds)
-
+        if since is not None:
+            delta = await run_db(get_builds_changes, since, category)
+            if since > delta["revision"]:
+                delta["upserted"] = json.loads((await run_db(get_builds_snapshot, category))[1])
+            return catalog_delta_response(since, delta)
+
+        # Снапшот уже отсортирован и сериализован (см. database.get_builds_snapshot)
+        revision, payload = await run_db(get_builds_snapshot, category)
+        return catalog_response(request, revision, f'"wz-{revision}"', payload)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+@app.get("/api/builds/search")
+async def api_builds_search(
+    q: str = Query(""),
+    category: str = Query("all"),
+    weapon_type: str | None = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Поиск сборок по названию, типу оружия и модулям (en/ru) — страницами,
+    по релевантности. Клиенту не нужно скачивать весь каталог ради поиска.
+    """
+    total, items = await run_db(builds_search, q, category, weapon_type, limit, offset)
+    return {"query": q, "total": total, "offset": offset, "limit": limit, "items": items}
+
+
 @app.post("/api/builds")
-async def create_build(request: Request, data: dict = Body(...)):
+async def create_build(request: Request, data: dict = Body(...), user: tuple = Depends(telegram_user)):
     """
     Создание сборки (только админы).
     Обеспечивает уникальность категорий «Новинки» и «Популярное».
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
+    _, is_admin, _ = user
     if not is_admin:
         return JSONResponse({"error": "Недостаточно прав"}, status_code=403)
 
     try:
-        # Снимаем уникальные категории с других сборок
-        conn = sqlite3.connect("/opt/ndloadouts_storage/builds.db")
-        cursor = conn.cursor()
-
-        for unique_cat in ["Новинки", "Популярное"]:
-            if unique_cat in data.get("categories", []):
-                cursor.execute("SELECT id, categories FROM builds")
-                for row in cursor.fetchall():
-                    b_id, cats_raw = row
-                    try:
-                        cats = eval(cats_raw) if isinstance(cats_raw, str) else cats_raw
-                    except:
-                        cats = []
-                    if unique_cat in cats:
-                        cats = [c for c in cats if c != unique_cat]
-                        cursor.execute("UPDATE builds SET categories = ? WHERE id = ?", (str(cats), b_id))
-
-        conn.commit()
-        conn.close()
-
-        # Сохраняем сборку
-        add_build(data)
+        # Уникальные категории снимаются с других сборок в той же транзакции
+        await run_db(add_build, data)
         return JSONResponse({"status": "ok"})
     except Exception as e:
         return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
 
 
 @app.put("/api/builds/{build_id}")
-async def update_build(build_id: str, request: Request):
+async def update_build(build_id: str, request: Request, user: tuple = Depends(telegram_user)):
     """
     Обновление сборки (только админы).
     Также поддерживает уникальность категорий «Новинки» / «Популярное».
     """
-    body = await request.json()
-    _, is_admin, _ = extract_user_roles(body.get("initData", ""))
+    _, is_admin, _ = user
     if not is_admin:
         return JSONResponse({"error": "Недостаточно прав"}, status_code=403)
 
+    body = await request.json()
     try:
-        conn = sqlite3.connect("/opt/ndloadouts_storage/builds.db")
-        cursor = conn.cursor()
-
-        for unique_cat in ["Новинки", "Популярное"]:
-            if unique_cat in body.get("categories", []):
-                cursor.execute("SELECT id, categories FROM builds")
-                for row in cursor.fetchall():
-                    b_id, cats_raw = row
-                    try:
-                        cats = eval(cats_raw) if isinstance(cats_raw, str) else cats_raw
-                    except:
-                        cats = []
-                    if unique_cat in cats and str(b_id) != str(build_id):
-                        cats = [c for c in cats if c != unique_cat]
-                        cursor.execute("UPDATE builds SET categories = ? WHERE id = ?", (str(cats), b_id))
-
-        conn.commit()
-        conn.close()
-
-        update_build_by_id(build_id, body)
+        if not await run_db(update_build_by_id, build_id, body):
+            return JSONResponse({"status": "error", "detail": "Сборка не найдена"}, status_code=404)
         return JSONResponse({"status": "ok"})
     except Exception as e:
         return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
 
 
 @app.delete("/api/builds/{build_id}")
-async def delete_build(build_id: str, request: Request):
+async def delete_build(build_id: str, request: Request, user: tuple = Depends(telegram_user)):
     """
     Удаление сборки (только админы).
     """
-    body = await request.json()
-    _, is_admin, _ = extract_user_roles(body.get("initData", ""))
+    _, is_admin, _ = user
     if not is_admin:
         return JSONResponse({"error": "Недостаточно прав"}, status_code=403)
 
     try:
-        delete_build_by_id(build_id)
+        await run_db(delete_build_by_id, build_id)
         return {"status": "ok"}
     except Exception as e:
         return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
@@ -482,32 +613,44 @@ def get_weapon_types():
     return JSONResponse(types)
 
 
+@app.get("/api/dictionary")
+async def api_dictionary(request: Request):
+    """
+    Типы оружия и модули Warzone + BF одним ответом (см. dictionary_bundle).
+    ETag = ревизия словаря: клиент хранит ответ и перепроверяет его одним запросом (304).
+    """
+    try:
+        revision, payload = await run_db(get_dictionary_bundle)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    etag = f'"dict-{revision}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Catalog-Revision": revision, "Vary": "Accept-Encoding"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        payload = gzip_dictionary_bundle(revision, payload)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
 @app.post("/api/me")
 async def get_me(data: dict = Body(...)):
     """
     Сохранить пользователя в БД и вернуть его роли.
     """
-    init_data = data.get("initData", "")
-    parsed = parse_qs(init_data)
-    user_data = parsed.get("user", [None])[0]
-
-    if not user_data:
+    user_json = init_data_auth.verify(data.get("initData", ""))
+    if not user_json:
         return JSONResponse({"error": "No user info"}, status_code=400)
 
     try:
-        user_json = json.loads(user_data)
         user_id = str(user_json.get("id"))
         first_name = user_json.get("first_name", "")
         username = user_json.get("username", "")
 
-        save_user(user_id, first_name, username)
-
-        env_vars = dotenv_values("/opt/ndloadouts/.env")
-        admin_ids = set(map(str.strip, env_vars.get("ADMIN_IDS", "").split(",")))
-        admin_dop = set(map(str.strip, env_vars.get("ADMIN_DOP", "").split(",")))
+        await run_db(save_user, user_id, first_name, username)
 
-        is_super_admin = user_id in admin_ids
-        is_admin = is_super_admin or user_id in admin_dop
+        is_admin, is_super_admin = roles.roles(user_id)
 
         return JSONResponse({
             "user_id": user_id,
@@ -525,12 +668,11 @@ async def get_admins():
     """
     Список главных и доп. админов с именами из user_profiles.
     """
-    users = get_all_users()
-    admin_ids = set(map(str.strip, os.getenv("ADMIN_IDS", "").split(",")))
-    admin_dop = set(map(str.strip, os.getenv("ADMIN_DOP", "").split(",")))
+    admin_ids, admin_dop = sorted(roles.admin_ids), sorted(roles.admin_dop)
+    users = await run_db(get_users, admin_ids + admin_dop)
 
     def get_name(uid):
-        user = next((u for u in users if str(u["id"]) == uid), None)
+        user = users.get(uid)
         return user["first_name"] if user else "Без имени"
 
     return {
@@ -540,28 +682,21 @@ async def get_admins():
 
 
 @app.post("/api/assign-admin")
-async def assign_admin(data: dict = Body(...)):
+async def assign_admin(data: dict = Body(...), user: tuple = Depends(telegram_user)):
     """
     Назначить доп. админа (только главный админ).
     """
-    requester_id = str(data.get("requesterId", "")).strip()
+    requester_id, _, _ = user   # из проверенного initData, не из тела запроса
     user_id = str(data.get("userId", "")).strip()
 
-    env_path = Path(".env")
-    env_vars = dotenv_values(env_path)
-    admin_ids = set(filter(None, map(str.strip, env_vars.get("ADMIN_IDS", "").split(","))))
-    admin_dop = set(filter(None, map(str.strip, env_vars.get("ADMIN_DOP", "").split(","))))
-
-    if requester_id not in admin_ids:
+    if not requester_id or not roles.is_super_admin(requester_id):
         return JSONResponse({"status": "error", "message": "Недостаточно прав"}, status_code=403)
+    if not user_id:
+        return JSONResponse({"status": "error", "message": "Не указан userId"}, status_code=400)
 
-    if user_id in admin_ids or user_id in admin_dop:
+    if not roles.add_dop(user_id):
         return JSONResponse({"status": "ok", "message": "Пользователь уже админ."})
 
-    admin_dop.add(user_id)
-    new_value = ",".join(sorted(admin_dop))
-    set_key(env_path, "ADMIN_DOP", new_value)
-
     bot_token = os.getenv("TOKEN")
     if bot_token:
         try:
@@ -581,249 +716,403 @@ async def assign_admin(data: dict = Body(...)):
 
 
 @app.post("/api/remove-admin")
-async def remove_admin(data: dict = Body(...)):
+async def remove_admin(data: dict = Body(...), user: tuple = Depends(telegram_user)):
     """
     Удалить доп. админа (только главный админ).
     """
-    requester_id = str(data.get("requesterId", "")).strip()
+    requester_id, _, _ = user   # из проверенного initData, не из тела запроса
     target_id = str(data.get("userId", "")).strip()
 
-    env_path = Path(".env")
-    env_vars = dotenv_values(env_path)
-    admin_ids = set(map(str.strip, env_vars.get("ADMIN_IDS", "").split(",")))
-    admin_dop = set(filter(None, map(str.strip, env_vars.get("ADMIN_DOP", "").split(","))))
-
-    if requester_id not in admin_ids:
+    if not requester_id or not roles.is_super_admin(requester_id):
         return JSONResponse({"status": "error", "message": "Недостаточно прав"}, status_code=403)
-    if target_id not in admin_dop:
+    if not roles.remove_dop(target_id):
         return JSONResponse({"status": "error", "message": "Пользователь не является доп. админом"}, status_code=404)
 
-    admin_dop.remove(target_id)
-    set_key(env_path, "ADMIN_DOP", ",".join(sorted(admin_dop)))
-
     return JSONResponse({"status": "ok", "message": f"Пользователь {target_id} удалён из админов."})
 
 # =====================================================
 # 📊 ANALYTICS (с рассылкой)
 # =====================================================
+ANALYTICS_BATCH_MAX_EVENTS = 500
+ANALYTICS_BATCH_MAX_BYTES = 1024 * 1024   # после распаковки
+
+
+def parse_analytics_event(data):
+    """
+    Проверка и нормализация одного события.
+    Возвращает (событие для analytics_writer | None, статус): ok / skipped (аноним) / invalid: причина.
+    """
+    if not isinstance(data, dict):
+        return None, "invalid: not an object"
+
+    user_id = data.get("user_id", "anonymous")
+    if user_id == "anonymous" or not user_id:
+        return None, "skipped"
+
+    action = data.get("action", "unknown")
+    if not isinstance(action, str) or not action or len(action) > 64:
+        return None, "invalid: action"
+
+    details = data.get("details") or {}
+    if not isinstance(details, dict):
+        return None, "invalid: details"
+
+    timestamp = data.get("timestamp") or datetime.now(timezone.utc).isoformat()
+    if not isinstance(timestamp, str):
+        return None, "invalid: timestamp"
+
+    return {
+        "user_id": str(user_id),
+        "action": action,
+        "details_json": json.dumps(details, ensure_ascii=False) if details else "{}",
+        "timestamp": timestamp,
+        "platform": details.get("platform", "unknown"),
+    }, "ok"
+
+
+def track_presence(event: dict):
+    """Отметка присутствия по принятому событию (session_end — пользователь ушёл)."""
+    if event["action"] == "session_end":
+        presence.leave(event["user_id"])
+    else:
+        presence.touch(event["user_id"], event["platform"], event["action"])
+
+
 @app.post("/api/analytics")
 async def save_analytics(data: dict = Body(...)):
     """
     Быстрое логирование событий аналитики + апдейт профиля пользователя.
+    Событие ставится в write-behind очередь и пишется пачкой (см. analytics_writer).
     """
     try:
-        user_id = data.get("user_id", "anonymous")
-        action = data.get("action", "unknown")
-        details = data.get("details", {})
-        timestamp = data.get("timestamp")
+        event, status = parse_analytics_event(data)
+        if event is None:
+            if status == "skipped":
+                return {"status": "ok"}
+            return JSONResponse({"status": "error", "detail": status}, status_code=400)
+
+        if not analytics_writer.submit(event):
+            # Очередь переполнена — событие отброшено (счётчик dropped в /api/analytics/ingest-stats)
+            return JSONResponse({"status": "dropped"}, status_code=503)
+        track_presence(event)
+        return {"status": "ok"}
+    except Exception as e:
+        print(f"❌ Analytics save error: {e}")
+        return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
 
-        if user_id == "anonymous" or not user_id:
-            return {"status": "ok"}
 
-        details_json = json.dumps(details, ensure_ascii=False) if details else "{}"
-        conn = sqlite3.connect(ANALYTICS_DB)
-        cur = conn.cursor()
+@app.post("/api/analytics/batch")
+async def save_analytics_batch(request: Request):
+    """
+    Пачка событий от клиента (буфер analytics.js / sendBeacon при session_end).
+    Тело — JSON-массив событий, опционально gzip (Content-Encoding: gzip).
+    Валидные события пишутся одной транзакцией; ответ — статус по каждому событию.
+    """
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, ANALYTICS_BATCH_MAX_BYTES + 1)
+        except zlib.error:
+            return JSONResponse({"status": "error", "detail": "bad gzip"}, status_code=400)
+    if len(body) > ANALYTICS_BATCH_MAX_BYTES:
+        return JSONResponse({"status": "error", "detail": "payload too large"}, status_code=413)
 
-        cur.execute(
-            "INSERT INTO analytics (user_id, action, details, timestamp) VALUES (?, ?, ?, ?)",
-            (str(user_id), action, details_json, timestamp)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return JSONResponse({"status": "error", "detail": "invalid json"}, status_code=400)
+    if isinstance(payload, dict):
+        payload = payload.get("events")
+    if not isinstance(payload, list):
+        return JSONResponse({"status": "error", "detail": "expected array of events"}, status_code=400)
+    if len(payload) > ANALYTICS_BATCH_MAX_EVENTS:
+        return JSONResponse(
+            {"status": "error", "detail": f"max {ANALYTICS_BATCH_MAX_EVENTS} events per batch"},
+            status_code=413
         )
 
-        platform = details.get("platform", "unknown")
-        now_iso = datetime.now().isoformat()
+    results, events, positions = [], [], []
+    for i, data in enumerate(payload):
+        event, status = parse_analytics_event(data)
+        results.append(status)
+        if event is not None:
+            events.append(event)
+            positions.append(i)
 
-        # Обновляем профиль (with Telegram-профилем, если есть)
-        user_info = {}
+    if events:
         try:
-            users = get_all_users()
-            user_info = next((u for u in users if str(u["id"]) == str(user_id)), {})
-        except:
-            user_info = {}
-
-        cur.execute("""
-            INSERT INTO user_profiles (user_id, first_name, username, last_seen, platform, total_actions, first_seen, last_action)
-            VALUES (?, ?, ?, ?, ?, 1, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                last_seen = excluded.last_seen,
-                platform = excluded.platform,
-                total_actions = total_actions + 1,
-                last_action = excluded.last_action
-        """, (
-            str(user_id),
-            user_info.get('first_name', ''),
-            user_info.get('username', ''),
-            timestamp,
-            platform,
-            now_iso,
-            action
-        ))
-
-        conn.commit()
-        conn.close()
-        return {"status": "ok"}
-    except Exception as e:
-        print(f"❌ Analytics save error: {e}")
-        return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
+            user_infos = await run_db(write_events_batch, events)
+        except Exception as e:
+            print(f"❌ Analytics batch error: {e}")
+            for i in positions:
+                results[i] = "error"
+            return JSONResponse({"status": "error", "results": results}, status_code=500)
+        for event in events:
+            track_presence(event)
+        analytics_writer.notify(events, user_infos)
+
+    return {
+        "status": "ok",
+        "accepted": len(events),
+        "rejected": sum(1 for r in results if r.startswith("invalid")),
+        "results": results,
+    }
 
 
-@app.get("/api/analytics/dashboard")
-async def get_analytics_dashboard():
+@app.get("/api/analytics/ingest-stats")
+async def get_analytics_ingest_stats():
     """
-    Сводная панель: счетчики, популярные действия, пользователи, последние события.
+    Состояние очереди записи аналитики: принято/записано/отброшено/в очереди.
+    """
+    return {**analytics_writer.stats(), "stream": analytics_hub.stats()}
+
+
+@app.get("/api/analytics/online")
+async def get_analytics_online():
+    """
+    Кто сейчас онлайн (трекер присутствия в памяти, без сканирования профилей).
+    Лёгкий эндпоинт для частого опроса дашбордом.
+    """
+    online = presence.online()
+    users = await run_db(get_users, online.keys()) if online else {}
+    now = datetime.now(timezone.utc).timestamp()
+    items = []
+    for user_id, (seen, platform, action) in sorted(online.items(), key=lambda kv: -kv[1][0]):
+        user = users.get(user_id) or {}
+        items.append({
+            "id": user_id,
+            "first_name": user.get("first_name"),
+            "username": user.get("username"),
+            "platform": platform,
+            "last_action": action,
+            "seconds_ago": int(now - seen)
+        })
+    return {"count": len(items), "window": presence.window, "users": items}
+
+
+def format_user_profile(row, online) -> dict:
     """
+    Строка user_profiles -> карточка пользователя для дашборда/списка.
+    """
+    user_id, first_name, username, last_seen, platform, total_actions, first_seen, last_action = row
+
+    user_display = f"{first_name or 'Пользователь'}"
+    if username:
+        user_display += f" (@{username})"
+    user_display += f" | ID: {user_id}"
+
+    last_action_text = {
+        'session_start': '🟢 Вошел в бот',
+        'view_build': '🔫 Смотрел сборку',
+        'search': '🔍 Искал',
+        'open_screen': '📱 Открыл экран',
+        'click_button': '🖱️ Кликнул',
+        'switch_category': '📂 Сменил категорию'
+    }.get(last_action, last_action)
+
+    return {
+        "id": user_id,
+        "name": user_display,
+        "username": username,
+        "first_name": first_name,
+        "status": "online" if user_id in online else "offline",
+        "platform": platform,
+        "actions_count": total_actions,
+        "last_seen": prettify_time(last_seen),
+        "first_seen": prettify_time(first_seen),
+        "last_action": last_action_text
+    }
+
+
+@app.get("/api/analytics/users")
+async def get_analytics_users(
+    cursor: str = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    q: str = Query(""),
+    platform: str = Query(""),
+    status: str = Query(""),
+    sort: str = Query("last_seen"),
+    order: str = Query("desc"),
+):
+    """
+    Все пользователи постранично (keyset по ключу сортировки + user_id).
+    q — имя/@username/ID; platform — ios/android/... или mobile/desktop;
+    status — online/offline (по трекеру присутствия); sort — last_seen/first_seen/actions.
+    Следующая страница: ?cursor=<next_cursor> с теми же фильтрами.
+    """
+    if sort not in USER_SORTS:
+        return JSONResponse({"error": f"sort: {', '.join(USER_SORTS)}"}, status_code=400)
+
+    after = None
+    if cursor:
+        try:
+            after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(after, list) or len(after) != 2:
+                raise ValueError
+        except ValueError:
+            return JSONResponse({"error": "bad cursor"}, status_code=400)
+
+    online = presence.online()
+    only_ids = online.keys() if status == "online" else None
+    exclude_ids = online.keys() if status == "offline" else None
+
+    rows, next_after = await run_db(
+        get_user_profiles_page, sort=sort, order="asc" if order == "asc" else "desc", after=after,
+        limit=limit, q=q, platform=platform, only_ids=only_ids, exclude_ids=exclude_ids
+    )
+    next_cursor = None
+    if next_after:
+        next_cursor = base64.urlsafe_b64encode(json.dumps(next_after).encode()).decode()
+
+    return {
+        "users": [format_user_profile(row, online) for row in rows],
+        "next_cursor": next_cursor
+    }
+
+
+POPULAR_ACTION_NAMES = {
+    'view_build': '👀 Просмотры сборок',
+    'search': '🔍 Поиски',
+    'open_screen': '📱 Открытия экранов',
+    'switch_category': '📂 Смена категорий',
+    'click_button': '🖱️ Клики'
+}
+
+
+def format_activity(row) -> dict:
+    """
+    (user_id, action, details, timestamp, first_name, username, platform) -> строка ленты активности.
+    """
+    user_id, action, details, timestamp, first_name, username, platform = row
+
+    user_display = f"{first_name or 'Пользователь'}"
+    if username:
+        user_display += f" (@{username})"
+    user_display += f" | ID: {user_id}"
+
+    action_details = ""
     try:
-        conn = sqlite3.connect(ANALYTICS_DB)
-        cur = conn.cursor()
+        details_obj = json.loads(details) if details else {}
+        if action == 'view_build':
+            title = details_obj.get('title', '')
+            weapon = details_obj.get('weapon_name', '')
+            action_details = f"«{title or weapon or 'сборку'}»"
+        elif action == 'search':
+            query = details_obj.get('query', '')
+            action_details = f"«{query}»" if query else ''
+        elif action == 'open_screen':
+            screen = details_obj.get('screen', '')
+            action_details = screen
+        elif action == 'click_button':
+            button = details_obj.get('button', '')
+            action_details = button
+    except:
+        pass
+
+    action_text = {
+        'session_start': '🟢 Вошел в бот',
+        'session_end': '🔴 Вышел из бота',
+        'view_build': f'🔫 Просмотр {action_details}',
+        'search': f'🔍 Поиск {action_details}',
+        'open_screen': f'📱 Открыл {action_details}',
+        'switch_category': f'📂 Сменил категорию {action_details}',
+        'click_button': f'🖱️ Кликнул {action_details}'
+    }.get(action, action)
 
-        cur.execute("SELECT COUNT(*) FROM user_profiles")
-        total_users = cur.fetchone()[0]
+    return {
+        "user": user_display,
+        "user_id": user_id,
+        "username": username,
+        "action": action_text,
+        "platform": "💻" if platform in ["tdesktop", "web"] else "📱",
+        "time": prettify_time(timestamp)
+    }
+
+
+def publish_analytics_batch(events, user_infos):
+    """
+    Записанная пачка -> подписчикам /api/analytics/stream: новые события (свежие сверху,
+    не больше 30 — как лента дашборда), дельты счётчиков и текущий онлайн.
+    """
+    if not analytics_hub.has_subscribers():
+        return
+    by_action = {}
+    for e in events:
+        by_action[e["action"]] = by_action.get(e["action"], 0) + 1
 
-        two_min_ago = (datetime.now() - timedelta(minutes=2)).isoformat()
-        cur.execute("SELECT COUNT(*) FROM user_profiles WHERE last_seen > ?", (two_min_ago,))
-        online_users = cur.fetchone()[0]
+    activity = []
+    for e in reversed(events):
+        if len(activity) == 30:
+            break
+        info = user_infos.get(e["user_id"]) or {}
+        activity.append(format_activity((
+            e["user_id"], e["action"], e["details_json"], e["timestamp"],
+            info.get("first_name"), info.get("username"), e["platform"]
+        )))
 
-        cur.execute("SELECT COUNT(*) FROM analytics")
-        total_actions = cur.fetchone()[0]
+    analytics_hub.publish("events", {
+        "activity": activity,
+        "actions": len(events),
+        "by_action": by_action,
+        "online": presence.count()
+    })
 
-        cur.execute("SELECT COUNT(*) FROM errors")
-        total_errors = cur.fetchone()[0]
 
-        cur.execute("""
-            SELECT action, COUNT(*) as count 
-            FROM analytics 
-            WHERE action NOT IN ('session_start', 'session_end', 'click_button')
-            GROUP BY action 
-            ORDER BY count DESC 
-            LIMIT 8
-        """)
-        popular_actions = cur.fetchall()
+analytics_writer.add_listener(publish_analytics_batch)
 
-        cur.execute("""
-            SELECT 
-                user_id, first_name, username, last_seen, platform, 
-                total_actions, first_seen, last_action
-            FROM user_profiles 
-            ORDER BY last_seen DESC
-        """)
-        users_data = cur.fetchall()
-
-        cur.execute("""
-            SELECT a.user_id, a.action, a.details, a.timestamp,
-                   u.first_name, u.username, u.platform
-            FROM analytics a
-            LEFT JOIN user_profiles u ON a.user_id = u.user_id
-            WHERE a.user_id != 'anonymous'
-            ORDER BY a.timestamp DESC
-            LIMIT 30
-        """)
-        actions_data = cur.fetchall()
-
-        conn.close()
-
-        formatted_popular_actions = []
-        for action, count in popular_actions:
-            action_name = {
-                'view_build': '👀 Просмотры сборок',
-                'search': '🔍 Поиски',
-                'open_screen': '📱 Открытия экранов',
-                'switch_category': '📂 Смена категорий',
-                'click_button': '🖱️ Клики'
-            }.get(action, action)
-            formatted_popular_actions.append({"action": action_name, "count": count})
 
-        formatted_users = []
-        for user_id, first_name, username, last_seen, platform, total_actions, first_seen, last_action in users_data:
-            # Онлайн, если активен последние 2 минуты
-            if last_seen:
+@app.get("/api/analytics/stream")
+async def analytics_stream(request: Request):
+    """
+    SSE-поток для дашборда: event "events" — новые события и дельты счётчиков,
+    event "presence" — число онлайн (при подключении и каждые ANALYTICS_STREAM_PING сек).
+    """
+    async def stream():
+        queue = analytics_hub.subscribe()
+        try:
+            yield sse_message("presence", {"online": presence.count()})
+            while True:
                 try:
-                    last_seen_dt = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
-                    time_diff = datetime.now(timezone.utc) - last_seen_dt
-                    is_online = time_diff.total_seconds() < 120
-                except:
-                    is_online = False
-            else:
-                is_online = False
-
-            user_display = f"{first_name or 'Пользователь'}"
-            if username:
-                user_display += f" (@{username})"
-            user_display += f" | ID: {user_id}"
-
-            last_action_text = {
-                'session_start': '🟢 Вошел в бот',
-                'view_build': '🔫 Смотрел сборку',
-                'search': '🔍 Искал',
-                'open_screen': '📱 Открыл экран',
-                'click_button': '🖱️ Кликнул',
-                'switch_category': '📂 Сменил категорию'
-            }.get(last_action, last_action)
+                    message = await asyncio.wait_for(queue.get(), ANALYTICS_STREAM_PING)
+                except asyncio.TimeoutError:
+                    message = sse_message("presence", {"online": presence.count()})
+                if await request.is_disconnected():
+                    break
+                yield message
+        finally:
+            analytics_hub.unsubscribe(queue)
 
-            formatted_users.append({
-                "id": user_id,
-                "name": user_display,
-                "username": username,
-                "first_name": first_name,
-                "status": "online" if is_online else "offline",
-                "platform": platform,
-                "actions_count": total_actions,
-                "last_seen": prettify_time(last_seen),
-                "first_seen": prettify_time(first_seen),
-                "last_action": last_action_text
-            })
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"   # nginx: не буферизовать поток
+    })
 
-        formatted_actions = []
-        for user_id, action, details, timestamp, first_name, username, platform in actions_data:
-            user_display = f"{first_name or 'Пользователь'}"
-            if username:
-                user_display += f" (@{username})"
-            user_display += f" | ID: {user_id}"
-
-            action_details = ""
-            try:
-                details_obj = json.loads(details) if details else {}
-                if action == 'view_build':
-                    title = details_obj.get('title', '')
-                    weapon = details_obj.get('weapon_name', '')
-                    action_details = f"«{title or weapon or 'сборку'}»"
-                elif action == 'search':
-                    query = details_obj.get('query', '')
-                    action_details = f"«{query}»" if query else ''
-                elif action == 'open_screen':
-                    screen = details_obj.get('screen', '')
-                    action_details = screen
-                elif action == 'click_button':
-                    button = details_obj.get('button', '')
-                    action_details = button
-            except:
-                pass
-
-            action_text = {
-                'session_start': '🟢 Вошел в бот',
-                'session_end': '🔴 Вышел из бота',
-                'view_build': f'🔫 Просмотр {action_details}',
-                'search': f'🔍 Поиск {action_details}',
-                'open_screen': f'📱 Открыл {action_details}',
-                'switch_category': f'📂 Сменил категорию {action_details}',
-                'click_button': f'🖱️ Кликнул {action_details}'
-            }.get(action, action)
-
-            formatted_actions.append({
-                "user": user_display,
-                "user_id": user_id,
-                "username": username,
-                "action": action_text,
-                "platform": "💻" if platform in ["tdesktop", "web"] else "📱",
-                "time": prettify_time(timestamp)
-            })
+
+@app.get("/api/analytics/dashboard")
+async def get_analytics_dashboard():
+    """
+    Сводная панель: счетчики, популярные действия, пользователи, последние события.
+    """
+    try:
+        data = await run_db(get_dashboard_data)
+        popular_actions = data["popular_actions"]
+        users_data = data["users"]
+        actions_data = data["recent_activity"]
+
+        formatted_popular_actions = [
+            {"key": action, "action": POPULAR_ACTION_NAMES.get(action, action), "count": count}
+            for action, count in popular_actions
+        ]
+
+        online = presence.online()
+        formatted_users = [format_user_profile(row, online) for row in users_data]
+
+        formatted_actions = [format_activity(row) for row in actions_data]
 
         return {
-            "stats": {
-                "total_users": total_users,
-                "online_users": online_users,
-                "total_actions": total_actions,
-                "total_errors": total_errors
-            },
+            "stats": {**data["stats"], "online_users": len(online)},
             "popular_actions": formatted_popular_actions,
+            "hourly_activity": [{"hour": hour, "count": count} for hour, count in data["hourly_activity"]],
             "users": formatted_users,
             "recent_activity": formatted_actions
         }
@@ -831,8 +1120,10 @@ async def get_analytics_dashboard():
     except Exception as e:
         print(f"❌ Dashboard error: {e}")
         return {
-            "stats": {"total_users": 0, "online_users": 0, "total_actions": 0, "total_errors": 0},
+            "stats": {"total_users": 0, "online_users": 0, "total_actions": 0, "total_errors": 0,
+                      "active_today": 0, "new_today": 0},
             "popular_actions": [],
+            "hourly_activity": [],
             "users": [],
             "recent_activity": []
         }
@@ -844,13 +1135,7 @@ async def clear_analytics():
     Очистка всей статистики (analytics/errors/user_profiles).
     """
     try:
-        conn = sqlite3.connect(ANALYTICS_DB)
-        cur = conn.cursor()
-        cur.execute("DELETE FROM analytics")
-        cur.execute("DELETE FROM errors")
-        cur.execute("DELETE FROM user_profiles")
-        conn.commit()
-        conn.close()
+        await run_db(clear_analytics_data)
         return {"status": "ok", "message": "Вся статистика очищена"}
     except Exception as e:
         return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
@@ -871,16 +1156,7 @@ async def get_broadcast_users():
     Список пользователей для рассылки (не anonymous).
     """
     try:
-        conn = sqlite3.connect(ANALYTICS_DB)
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT user_id, first_name, username 
-            FROM user_profiles 
-            WHERE user_id != 'anonymous'
-            ORDER BY last_seen DESC
-        """)
-        users = cur.fetchall()
-        conn.close()
+        users = await run_db(get_broadcast_recipients)
 
         formatted_users = []
         for user_id, first_name, username in users:
@@ -897,7 +1173,8 @@ async def get_broadcast_users():
 @app.post("/api/analytics/broadcast")
 async def send_broadcast(data: dict = Body(...)):
     """
-    Отправка рассылки выбранным пользователям через Telegram Bot API.
+    Рассылка выбранным пользователям: ставится фоновым заданием, ответ — сразу (job_id).
+    Прогресс — GET /api/analytics/broadcast/{job_id}.
     """
     try:
         message = data.get("message", "").strip()
@@ -908,47 +1185,52 @@ async def send_broadcast(data: dict = Body(...)):
         if not user_ids:
             return JSONResponse({"error": "Не выбраны пользователи"}, status_code=400)
 
-        bot_token = os.getenv("TOKEN")
-        if not bot_token:
+        if not os.getenv("TOKEN"):
             return JSONResponse({"error": "Токен бота не настроен"}, status_code=500)
 
-        success_count, failed_count = 0, 0
-        results = []
-
-        for target_user_id in user_ids:
-            try:
-                response = requests.post(
-                    f"https://api.telegram.org/bot{bot_token}/sendMessage",
-                    json={
-                        "chat_id": target_user_id,
-                        "text": f"📢 Рассылка от NDHQ:\n\n{message}",
-                        "parse_mode": "HTML"
-                    },
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    success_count += 1
-                    results.append({"user_id": target_user_id, "status": "success"})
-                else:
-                    failed_count += 1
-                    results.append({"user_id": target_user_id, "status": "failed", "error": response.text})
-
-                await asyncio.sleep(0.1)  # anti-spam
-            except Exception as e:
-                failed_count += 1
-                results.append({"user_id": target_user_id, "status": "failed", "error": str(e)})
+        # Задание в БД; отправляет фоновый broadcast_runner (переживает рестарт/деплой)
+        job = await run_db(create_broadcast_job, f"📢 Рассылка от NDHQ:\n\n{message}", user_ids)
+        broadcast_runner.wake()
 
         return {
             "status": "ok",
-            "message": f"Рассылка отправлена: {success_count} успешно, {failed_count} с ошибками",
-            "success_count": success_count,
-            "failed_count": failed_count,
-            "results": results
+            "message": f"Рассылка поставлена в очередь: {job['total']} получателей",
+            "job_id": job["id"],
+            "total": job["total"]
         }
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+
+@app.get("/api/analytics/broadcast/{job_id}")
+async def get_broadcast_status(job_id: int):
+    """
+    Прогресс рассылки: статус, отправлено/ошибки/в очереди, последние ошибки.
+    """
+    job = await run_db(get_broadcast_job, job_id)
+    if job is None:
+        return JSONResponse({"error": "Рассылка не найдена"}, status_code=404)
+    return job
+
+
+@app.post("/api/analytics/broadcast/{job_id}/cancel")
+async def cancel_broadcast(job_id: int):
+    """
+    Отменить рассылку: оставшиеся получатели не получат сообщение.
+    """
+    if not await run_db(cancel_broadcast_job, job_id):
+        return JSONResponse({"error": "Рассылка не найдена или уже завершена"}, status_code=404)
+    return {"status": "ok"}
+
+
+@app.get("/api/analytics/broadcasts")
+async def get_broadcasts():
+    """
+    Последние рассылки (для истории в дашборде).
+    """
+    return {"jobs": await run_db(list_broadcast_jobs)}
+
 # =====================================================
 # 🧾 VERSION HISTORY API
 # =====================================================
@@ -982,15 +1264,11 @@ def api_version_published():
 
 
 @app.get("/api/version/all")
-def api_version_all(request: Request):
+def api_version_all(_admin: str = Depends(require_admin)):
     """
     ✅ Получить все версии (черновики + опубликованные)
     Только для админов
     """
-    init_data = request.query_params.get("initData", "")
-    _, is_admin, _ = extract_user_roles(init_data)
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
 
     versions = get_versions(published_only=False)
     return [
@@ -1009,15 +1287,11 @@ def api_version_all(request: Request):
 
 
 @app.post("/api/version")
-def api_version_add(data: dict = Body(...)):
+def api_version_add(data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     ✅ Добавить новую версию
     status: draft или published
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
     version = data.get("version", "").strip()
     title = data.get("title", "").strip()
     content = data.get("content", "").strip()
@@ -1039,14 +1313,10 @@ def api_version_add(data: dict = Body(...)):
 
 
 @app.put("/api/version/{version_id}")
-def api_version_update(version_id: int, data: dict = Body(...)):
+def api_version_update(version_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     ✏ Обновить существующую версию
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
     version = data.get("version", "").strip()
     title = data.get("title", "").strip()
     content = data.get("content", "").strip()
@@ -1060,40 +1330,28 @@ def api_version_update(version_id: int, data: dict = Body(...)):
 
 
 @app.put("/api/version/{version_id}/publish")
-def api_version_publish(version_id: int, data: dict = Body(...)):
+def api_version_publish(version_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     🚀 Опубликовать версию
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
     set_version_status(version_id, "published")
     return {"status": "ok", "message": "Версия опубликована"}
 
 
 @app.put("/api/version/{version_id}/draft")
-def api_version_draft(version_id: int, data: dict = Body(...)):
+def api_version_draft(version_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     📥 Убрать версию обратно в черновики
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
     set_version_status(version_id, "draft")
     return {"status": "ok", "message": "Версия скрыта (черновик)"}
 
 
 @app.delete("/api/version/{version_id}")
-def api_version_delete(version_id: int, data: dict = Body(...)):
+def api_version_delete(version_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     🗑 Удалить версию (любой админ)
     """
-    _, is_admin, _ = extract_user_roles(data.get("initData", ""))
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Недостаточно прав")
-
     delete_version(version_id)
     return {"status": "ok", "message": "Версия удалена"}
 
@@ -1101,45 +1359,81 @@ def api_version_delete(version_id: int, data: dict = Body(...)):
 # =====================================================
 # 🪖 BATTLEFIELD — BUILDS API
 # =====================================================
-@app.get("/api/bf/builds")
-async def bf_get_builds(mode: str = Query("all")):
+def format_bf_build(b):
     """
-    Получить все BF-сборки (фильтр по mode: 'mp', 'br' или 'all').
-    tabs/categories приводятся к JSON-массивам.
+    Приводит BF-сборку к виду API: tabs/categories — JSON-массивы, mode по умолчанию 'mp'.
     """
-    try:
-        builds = get_all_bf_builds()
+    if isinstance(b, (list, tuple)):
+        keys = ["id", "title", "weapon_type", "top1", "top2", "top3", "date", "tabs", "categories", "mode"]
+        b = dict(zip(keys, b[:len(keys)]))
+
+    if isinstance(b.get("tabs"), str):
+        try:
+            b["tabs"] = json.loads(b["tabs"])
+        except:
+            b["tabs"] = []
 
-        if mode != "all":
-            builds = [b for b in builds if b.get("mode", "mp") == mode]
+    if isinstance(b.get("categories"), str):
+        try:
+            b["categories"] = json.loads(b["categories"])
+        except:
+            b["categories"] = []
 
-        formatted = []
-        for b in builds:
-            if isinstance(b, (list, tuple)):
-                keys = ["id", "title", "weapon_type", "top1", "top2", "top3", "date", "tabs", "categories", "mode"]
-                b = dict(zip(keys, b[:len(keys)]))
+    b["mode"] = b.get("mode", "mp")
+    return b
 
-            if isinstance(b.get("tabs"), str):
-                try:
-                    b["tabs"] = json.loads(b["tabs"])
-                except:
-                    b["tabs"] = []
 
-            if isinstance(b.get("categories"), str):
-                try:
-                    b["categories"] = json.loads(b["categories"])
-                except:
-                    b["categories"] = []
+def list_bf_builds(mode: str):
+    builds = get_all_bf_builds()
+    if mode != "all":
+        builds = [b for b in builds if b.get("mode", "mp") == mode]
+    return [format_bf_build(b) for b in builds]
 
-            b["mode"] = b.get("mode", "mp")
-            formatted.append(b)
 
-        return JSONResponse(formatted)
+@app.get("/api/bf/builds")
+async def bf_get_builds(request: Request, mode: str = Query("all"), since: int | None = Query(None)):
+    """
+    Получить все BF-сборки (фильтр по mode: 'mp', 'br' или 'all').
+    tabs/categories приводятся к JSON-массивам.
+    ETag = ревизия каталога; ?since=<revision> — дельта после ревизии.
+    """
+    try:
+        if since is not None:
+            delta = await run_db(get_bf_builds_changes, since, mode)
+            if since > delta["revision"]:
+                delta["upserted"] = await run_db(list_bf_builds, mode)
+            else:
+                delta["upserted"] = [format_bf_build(b) for b in delta["upserted"]]
+            return catalog_delta_response(since, delta)
+
+        revision = await run_db(get_bf_builds_revision)
+        etag = f'"bf-{revision}"'
+        if etag_matches(request, etag):
+            return catalog_response(request, revision, etag, None)
+        builds = await run_db(list_bf_builds, mode)
+        payload = json.dumps(builds, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return catalog_response(request, revision, etag, payload)
     except Exception as e:
         print(f"BF builds error: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+@app.get("/api/bf/builds/search")
+async def bf_search_builds(
+    q: str = Query(""),
+    mode: str = Query("all"),
+    weapon_type: str | None = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Поиск BF-сборок по названию, типу оружия и модулям — страницами, по релевантности.
+    """
+    total, items = await run_db(bf_builds_search, q, mode, weapon_type, limit, offset)
+    return {"query": q, "total": total, "offset": offset, "limit": limit,
+            "items": [format_bf_build(b) for b in items]}
+
+
 @app.post("/api/bf/builds")
 async def bf_add_build(request: Request):
     """
@@ -1147,7 +1441,7 @@ async def bf_add_build(request: Request):
     """
     data = await request.json()
     try:
-        add_bf_build(data)
+        await run_db(add_bf_build, data)
         return {"status": "ok", "message": "Build added"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1160,7 +1454,7 @@ async def bf_update_build(build_id: int, request: Request):
     """
     data = await request.json()
     try:
-        update_bf_build(build_id, data)
+        await run_db(update_bf_build, build_id, data)
         return {"status": "ok", "message": "Build updated"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1172,7 +1466,7 @@ async def bf_delete_build(build_id: int):
     Удалить BF-сборку по ID.
     """
     try:
-        delete_bf_build(build_id)
+        await run_db(delete_bf_build, build_id)
         return {"status": "ok", "message": "Build deleted"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1186,7 +1480,7 @@ async def bf_get_types():
     Получить список типов BF-оружия.
     """
     try:
-        return get_bf_weapon_types()
+        return await run_db(get_bf_weapon_types)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
@@ -1198,7 +1492,7 @@ async def bf_add_type(request: Request):
     """
     data = await request.json()
     try:
-        add_bf_weapon_type(data)
+        await run_db(add_bf_weapon_type, data)
         return {"status": "ok", "message": "Type added"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1210,7 +1504,7 @@ async def bf_delete_type(type_id: int):
     Удалить тип BF-оружия.
     """
     try:
-        delete_bf_weapon_type(type_id)
+        await run_db(delete_bf_weapon_type, type_id)
         return {"status": "ok", "message": "Type deleted"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1224,7 +1518,8 @@ async def bf_get_modules(weapon_type: str):
     Получить модули BF по типу оружия.
     """
     try:
-        return get_bf_modules_by_type(weapon_type)
+        payload = await run_db(get_bf_modules_json, weapon_type)
+        return Response(content=payload, media_type="application/json")
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
@@ -1239,7 +1534,7 @@ async def bf_add_module(request: Request):
     try:
         if not data.get("weapon_type"):
             data["weapon_type"] = "shv"
-        add_bf_module(data)
+        await run_db(add_bf_module, data)
         return {"status": "ok", "message": "Module added"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1251,7 +1546,7 @@ async def bf_delete_module(module_id: int):
     Удалить модуль BF.
     """
     try:
-        delete_bf_module(module_id)
+        await run_db(delete_bf_module, module_id)
         return {"status": "ok", "message": "Module deleted"}
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1259,22 +1554,6 @@ async def bf_delete_module(module_id: int):
 # =====================================================
 # 🎯 BATTLEFIELD — CHALLENGES (персональный прогресс)
 # =====================================================
-def ensure_bf_admin(request: Request, data: dict | None = None):
-    """
-    Проверка прав BF-админа через initData (как в Warzone).
-    """
-    init_data = ""
-    if data and "initData" in data:
-        init_data = data["initData"]
-    else:
-        init_data = request.query_params.get("initData", "")
-
-    user_id, is_admin, _ = extract_user_roles(init_data or "")
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Access denied")
-    return user_id
-
-
 @app.get("/api/bf/categories")
 def bf_get_categories():
     """
@@ -1284,11 +1563,10 @@ def bf_get_categories():
 
 
 @app.post("/api/bf/categories")
-def bf_add_category_api(data: dict = Body(...), request: Request = None):
+def bf_add_category_api(data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Добавить категорию испытаний (только админ).
     """
-    ensure_bf_admin(request, data)
     name = data.get("name", "").strip()
     if not name:
         raise HTTPException(status_code=400, detail="Name is required")
@@ -1296,11 +1574,10 @@ def bf_add_category_api(data: dict = Body(...), request: Request = None):
 
 
 @app.put("/api/bf/categories/{category_id}")
-def bf_update_category(category_id: int, data: dict = Body(...), request: Request = None):
+def bf_update_category(category_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Переименовать категорию испытаний (только админ).
     """
-    ensure_bf_admin(request, data)
     name = data.get("name", "").strip()
     if not name:
         raise HTTPException(status_code=400, detail="Name required")
@@ -1310,22 +1587,20 @@ def bf_update_category(category_id: int, data: dict = Body(...), request: Reques
 
 
 @app.delete("/api/bf/categories/{category_id}")
-def bf_delete_category_api(category_id: int, request: Request, data: dict | None = None):
+def bf_delete_category_api(category_id: int, _admin: str = Depends(require_admin)):
     """
     Удалить категорию испытаний (только админ).
     """
-    ensure_bf_admin(request, data)
     delete_category(category_id)
     return {"status": "deleted"}
 
 
 @app.post("/api/bf/challenges/list")
-def bf_get_challenges(data: dict = Body(...)):
+def bf_get_challenges(data: dict = Body(...), user: tuple = Depends(telegram_user)):
     """
     Получает список испытаний с прогрессом по user_id из initData.
     """
-    initData = data.get("initData", "")
-    user_id, _, _ = extract_user_roles(initData or "")
+    user_id, _, _ = user
     with get_bf_conn(row_mode=True) as conn:
         rows = conn.execute("""
             SELECT 
@@ -1342,11 +1617,10 @@ def bf_get_challenges(data: dict = Body(...)):
 
 
 @app.post("/api/bf/challenges")
-def bf_add_challenge_api(data: dict = Body(...), request: Request = None):
+def bf_add_challenge_api(data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Добавление испытания (только админ).
     """
-    ensure_bf_admin(request, data)
     if not all(k in data for k in ("title_en", "title_ru", "category_id")):
         raise HTTPException(status_code=400, detail="Missing required fields")
     add_challenge(data)
@@ -1354,33 +1628,30 @@ def bf_add_challenge_api(data: dict = Body(...), request: Request = None):
 
 
 @app.put("/api/bf/challenges/{challenge_id}")
-def bf_update_challenge_api(challenge_id: int, data: dict = Body(...), request: Request = None):
+def bf_update_challenge_api(challenge_id: int, data: dict = Body(...), _admin: str = Depends(require_admin)):
     """
     Обновление испытания (только админ).
     """
-    ensure_bf_admin(request, data)
     update_challenge(challenge_id, data)
     return {"status": "updated"}
 
 
 @app.delete("/api/bf/challenges/{challenge_id}")
-def bf_delete_challenge_api(challenge_id: int, request: Request, data: dict | None = None):
+def bf_delete_challenge_api(challenge_id: int, _admin: str = Depends(require_admin)):
     """
     Удаление испытания (только админ).
     """
-    ensure_bf_admin(request, data)
     delete_challenge(challenge_id)
     return {"status": "deleted"}
 
 
 @app.patch("/api/bf/challenges/{challenge_id}/progress")
-def bf_update_progress(challenge_id: int, data: dict = Body(...)):
+def bf_update_progress(challenge_id: int, data: dict = Body(...), user: tuple = Depends(telegram_user)):
     """
     Обновление прогресса пользователя по испытанию (+/-).
     """
     delta = int(data.get("delta", 0))
-    init_data = data.get("initData", "")
-    user_id, _, _ = extract_user_roles(init_data or "")
+    user_id, _, _ = user
 
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID missing")
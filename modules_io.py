@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+from database import init_db, modules_bulk_upsert, modules_export
+from database_bf import BF_SHARED_MODULES_TYPE, init_bf_builds_table, bf_modules_bulk_upsert, bf_modules_export
+
+# =====================================================
+# 📦 МАССОВЫЙ ИМПОРТ / ЭКСПОРТ СЛОВАРЯ МОДУЛЕЙ
+# =====================================================
+# Формат data/modules-<type>.json: {category: [{ru, en}, ...]} для Warzone
+# и {category: [en, ...]} для BF (modules-shv.json — общие модули BF).
+# pos модуля = его место в списке категории.
+# Импорт типа — одна транзакция (executemany UPSERT + при replace удаление
+# лишних), кеши словаря сбрасываются один раз. dry_run только считает diff.
+#
+#   python modules_io.py import data/modules-assault.json [--type assault] [--game wz] [--dry-run] [--replace]
+#   python modules_io.py seed [--dry-run] [--replace]     # все data/modules-*.json
+#   python modules_io.py export --type assault [--game wz] > modules-assault.json
+
+DATA_DIR = Path("data")
+GAMES = ("wz", "bf")
+TYPES_FILES = {"wz": DATA_DIR / "types.json", "bf": DATA_DIR / "types-bf.json"}
+
+
+def known_types(game: str) -> set:
+    types = {t.get("key") for t in json.loads(TYPES_FILES[game].read_text(encoding="utf-8"))}
+    if game == "bf":
+        types.add(BF_SHARED_MODULES_TYPE)
+    return types
+
+
+def check_target(game: str, weapon_type: str):
+    if game not in GAMES:
+        raise ValueError("game: wz или bf")
+    if weapon_type not in known_types(game):
+        raise ValueError(f"неизвестный тип оружия: {weapon_type}")
+
+
+def data_file_target(path: Path) -> tuple[str, str]:
+    """(game, weapon_type) по имени файла modules-<type>.json."""
+    weapon_type = Path(path).stem.removeprefix("modules-")
+    return ("bf" if weapon_type == BF_SHARED_MODULES_TYPE else "wz"), weapon_type
+
+
+def parse_modules(data, game: str) -> list:
+    """
+    {category: [...]} -> строки для bulk upsert:
+    wz — (category, en, ru, pos), bf — (category, en, pos).
+    Элемент — {ru, en} или строка (en; для wz она же ru).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("ожидается объект {категория: [модули]}")
+    rows = []
+    for category, items in data.items():
+        if not isinstance(items, list):
+            raise ValueError(f"категория '{category}': ожидается список модулей")
+        for pos, item in enumerate(items):
+            if isinstance(item, str):
+                en, ru = item, item
+            elif isinstance(item, dict) and item.get("en"):
+                en, ru = item["en"], item.get("ru") or item["en"]
+            else:
+                raise ValueError(f"категория '{category}', #{pos}: нужен en")
+            rows.append((category, en, pos) if game == "bf" else (category, en, ru, pos))
+    return rows
+
+
+def import_modules(game: str, weapon_type: str, data, replace: bool = False, dry_run: bool = False) -> dict:
+    """
+    Импорт словаря типа. Возвращает отчёт: counts по added/updated/unchanged/removed,
+    сами ключи изменений (без unchanged) и время в мс.
+    """
+    check_target(game, weapon_type)
+    started = time.perf_counter()
+    rows = parse_modules(data, game)
+    upsert = bf_modules_bulk_upsert if game == "bf" else modules_bulk_upsert
+    diff = upsert(weapon_type, rows, replace=replace, dry_run=dry_run)
+    return {
+        "game": game,
+        "weapon_type": weapon_type,
+        "dry_run": dry_run,
+        "replace": replace,
+        "counts": {name: len(keys) for name, keys in diff.items()},
+        "added": diff["added"],
+        "updated": diff["updated"],
+        "removed": diff["removed"],
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def import_data_file(path, replace: bool = False, dry_run: bool = False, game=None, weapon_type=None) -> dict:
+    default_game, default_type = data_file_target(path)
+    check_target(game or default_game, weapon_type or default_type)   # до чтения файла
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return import_modules(game or default_game, weapon_type or default_type, data, replace, dry_run)
+
+
+def seed_from_data(replace: bool = False, dry_run: bool = False) -> list:
+    """Все data/modules-*.json — каждый файл своей транзакцией."""
+    return [import_data_file(path, replace, dry_run) for path in sorted(DATA_DIR.glob("modules-*.json"))]
+
+
+def export_modules(game: str, weapon_type: str) -> dict:
+    if game not in GAMES:
+        raise ValueError("game: wz или bf")
+    return bf_modules_export(weapon_type) if game == "bf" else modules_export(weapon_type)
+
+
+def _print_report(report: dict):
+    counts = " ".join(f"{name}={n}" for name, n in report["counts"].items())
+    mode = " (dry-run)" if report["dry_run"] else ""
+    print(f"{report['game']}/{report['weapon_type']}{mode}: {counts} — {report['ms']} мс", file=sys.stderr)
+    for name in ("added", "updated", "removed"):
+        for category, en in report[name]:
+            print(f"  {name[0].upper()} {category} / {en}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт/экспорт словаря модулей")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="импорт одного файла")
+    p_import.add_argument("file")
+    p_import.add_argument("--game", choices=GAMES)
+    p_import.add_argument("--type", dest="weapon_type")
+
+    p_seed = sub.add_parser("seed", help="импорт всех data/modules-*.json")
+
+    for p in (p_import, p_seed):
+        p.add_argument("--dry-run", action="store_true", help="только показать diff")
+        p.add_argument("--replace", action="store_true", help="удалить модули, которых нет в файле")
+
+    p_export = sub.add_parser("export", help="выгрузить словарь типа в stdout")
+    p_export.add_argument("--game", choices=GAMES, default="wz")
+    p_export.add_argument("--type", dest="weapon_type", required=True)
+
+    args = parser.parse_args()
+    init_db()
+    init_bf_builds_table()
+
+    if args.command == "import":
+        _print_report(import_data_file(args.file, args.replace, args.dry_run, args.game, args.weapon_type))
+    elif args.command == "seed":
+        for report in seed_from_data(args.replace, args.dry_run):
+            _print_report(report)
+    else:
+        json.dump(export_modules(args.game, args.weapon_type), sys.stdout, ensure_ascii=False, indent=2)
+        print()
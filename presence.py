@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+from collections import deque
+
+# =====================================================
+# 🟢 ПРИСУТСТВИЕ ПОЛЬЗОВАТЕЛЕЙ (кто онлайн)
+# =====================================================
+# Приём аналитики отмечает пользователя (touch), дашборд спрашивает
+# «сколько/кто онлайн» — без запросов к user_profiles.
+# Кольцо временных корзин: пользователь попадает в корзину текущих
+# BUCKET секунд; корзины старше окна снимаются с хвоста, и их
+# пользователи удаляются, если после этого не появлялись.
+# touch — амортизированно O(1), count — O(1), online — O(онлайн).
+
+ONLINE_WINDOW = int(os.getenv("ANALYTICS_ONLINE_WINDOW", "120"))   # сек
+BUCKET = 10                                                          # сек
+
+
+class PresenceTracker:
+    def __init__(self, window: int = ONLINE_WINDOW, bucket: int = BUCKET):
+        self.window = window
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._buckets = deque()   # [(номер корзины, {user_id, ...}), ...] от старых к новым
+        self._seen = {}           # user_id -> (время последнего события, platform, action)
+
+    def _expire(self, now: float):
+        oldest = int((now - self.window) // self.bucket)
+        while self._buckets and self._buckets[0][0] < oldest:
+            _, users = self._buckets.popleft()
+            for user_id in users:
+                seen = self._seen.get(user_id)
+                if seen and seen[0] < now - self.window:
+                    del self._seen[user_id]
+
+    def touch(self, user_id: str, platform: str = "unknown", action: str = "", at: float = None):
+        """Пользователь активен (событие аналитики); at — время события (по умолчанию сейчас)."""
+        now = time.time()
+        at = now if at is None else min(at, now)
+        if at < now - self.window:
+            return
+        number = int(at // self.bucket)
+        with self._lock:
+            # Корзина времени события, а не текущая: иначе событие из прошлого
+            # (seed_presence при старте) продлило бы онлайн почти на целое окно.
+            # Корзины упорядочены, обычно нужная — последняя.
+            index = len(self._buckets)
+            while index and self._buckets[index - 1][0] > number:
+                index -= 1
+            if index and self._buckets[index - 1][0] == number:
+                self._buckets[index - 1][1].add(user_id)
+            else:
+                self._buckets.insert(index, (number, {user_id}))
+            prev = self._seen.get(user_id)
+            if prev is None or prev[0] <= at:
+                self._seen[user_id] = (at, platform, action)
+            self._expire(now)
+
+    def leave(self, user_id: str):
+        """Пользователь закрыл приложение (session_end)."""
+        with self._lock:
+            self._seen.pop(user_id, None)
+
+    def count(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._seen)
+
+    def online(self) -> dict:
+        """{user_id: (время последнего события, platform, action)} для всех онлайн."""
+        with self._lock:
+            self._expire(time.time())
+            return dict(self._seen)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._seen.clear()
+
+
+presence = PresenceTracker()
@@ -0,0 +1,81 @@
+import re
+
+# =====================================================
+# 🔎 ОБЩИЕ ПОМОЩНИКИ ПОЛНОТЕКСТОВОГО ПОИСКА (SQLite FTS5, trigram)
+# =====================================================
+# Таблицы *_fts создаются с tokenize='trigram': индекс по всем тройкам
+# символов, поэтому MATCH по фразе работает как регистронезависимый поиск
+# подстроки (в т.ч. по кириллице и с середины слова) — с индексом, а не
+# полным проходом как LIKE '%q%'.
+# Запросы короче 3 символов trigram не ищет — для них вызывающий код
+# использует LIKE по префиксу.
+# Нечёткий поиск (когда точных совпадений нет): OR по тройкам запроса,
+# кандидаты берутся по bm25 и фильтруются по доле общих троек (опечатка
+# в одной букве сохраняет большую часть троек).
+# Индексы сборок (builds_fts / bf_builds_fts) хранят текст уже в casefold:
+# по нему же работает LIKE для коротких запросов (LIKE не сворачивает кириллицу).
+
+MIN_QUERY = 3                 # минимальная длина для trigram
+FUZZY_MIN_SIMILARITY = 0.5    # доля троек запроса, найденных в тексте
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip()).casefold()
+
+
+def fts_phrase(query: str) -> str:
+    """Запрос как одна фраза FTS5 (кавычки экранируются)."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def trigrams(text: str) -> set:
+    text = normalize_query(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fts_fuzzy(query: str) -> str:
+    """OR по всем тройкам запроса."""
+    return " OR ".join(fts_phrase(t) for t in sorted(trigrams(query)))
+
+
+def similarity(query: str, *texts) -> float:
+    """Доля троек запроса, встречающихся хотя бы в одном из текстов."""
+    wanted = trigrams(query)
+    if not wanted:
+        return 0.0
+    have = set()
+    for text in texts:
+        have |= trigrams(text or "")
+    return len(wanted & have) / len(wanted)
+
+
+def prefix_hit(query: str, *texts) -> bool:
+    """Запрос совпадает с началом текста или одного из его слов."""
+    for text in texts:
+        text = normalize_query(text or "")
+        if text.startswith(query) or f" {query}" in text:
+            return True
+    return False
+
+
+def build_module_names(build: dict) -> list:
+    """
+    Названия модулей сборки для индекса: top1..top3 и элементы вкладок
+    (строки items; у BF ещё universal — {name, value}). Без повторов, по порядку.
+    """
+    names = [build.get("top1"), build.get("top2"), build.get("top3")]
+    tabs = build.get("tabs")
+    for tab in tabs if isinstance(tabs, list) else []:
+        if not isinstance(tab, dict):
+            continue
+        items = tab.get("items")
+        names += items if isinstance(items, list) else []
+        universal = tab.get("universal")
+        names += [u.get("name") for u in universal if isinstance(u, dict)] if isinstance(universal, list) else []
+    seen, result = set(), []
+    for name in names:
+        name = normalize_query(str(name)) if name else ""
+        if name and name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
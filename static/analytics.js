@@ -1,5 +1,14 @@
 // static/analytics.js
+// События копятся в буфере и уходят пачкой на /api/analytics/batch:
+// по размеру буфера, по таймеру и при закрытии (sendBeacon — доходит даже при выгрузке страницы).
+const ANALYTICS_BATCH_URL = '/api/analytics/batch';
+const ANALYTICS_MAX_BUFFER = 20;
+const ANALYTICS_FLUSH_MS = 5000;
+
 const Analytics = {
+  buffer: [],
+  flushTimer: null,
+
   trackEvent(action, details = {}) {
     try {
       const user = window.Telegram?.WebApp?.initDataUnsafe?.user;
@@ -8,22 +17,48 @@ const Analytics = {
       // Только реальные пользователи
       if (!user?.id) return;
       
-      // Быстрая отправка без ожидания ответа
-      fetch('/api/analytics', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          user_id: user.id,
-          action: action,
-          details: { ...details, platform },
-          timestamp: new Date().toISOString()
-        })
-      }).catch(() => {}); // Игнорируем ошибки для скорости
+      this.buffer.push({
+        user_id: user.id,
+        action: action,
+        details: { ...details, platform },
+        timestamp: new Date().toISOString()
+      });
+
+      if (action === 'session_end') {
+        this.flush(true);
+      } else if (this.buffer.length >= ANALYTICS_MAX_BUFFER) {
+        this.flush();
+      } else if (!this.flushTimer) {
+        this.flushTimer = setTimeout(() => this.flush(), ANALYTICS_FLUSH_MS);
+      }
     } catch (error) {
       // Игнорируем ошибки трекинга
     }
   },
 
+  flush(beacon = false) {
+    clearTimeout(this.flushTimer);
+    this.flushTimer = null;
+    if (!this.buffer.length) return;
+
+    const events = this.buffer.splice(0, this.buffer.length);
+    const body = JSON.stringify(events);
+
+    // При закрытии — sendBeacon: браузер дошлёт запрос после выгрузки страницы
+    if (beacon && navigator.sendBeacon &&
+        navigator.sendBeacon(ANALYTICS_BATCH_URL, new Blob([body], { type: 'application/json' }))) {
+      return;
+    }
+
+    // Быстрая отправка без ожидания ответа
+    fetch(ANALYTICS_BATCH_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body,
+      keepalive: true
+    }).catch(() => {}); // Игнорируем ошибки для скорости
+  },
+
   trackBuildView(buildData) {
     this.trackEvent('view_build', {
       title: buildData.title,
@@ -67,4 +102,9 @@ if (window.Telegram?.WebApp) {
   });
 }
 
+// Вкладка скрыта (свернули/закрыли) — досылаем буфер, пока страница жива
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'hidden') Analytics.flush(true);
+});
+
 window.Analytics = Analytics;
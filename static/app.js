@@ -330,8 +330,7 @@ document.getElementById('back-from-mod-list')?.addEventListener('click', () => {
 
 // === Загрузка типов оружия ===
 async function loadWeaponTypes() {
-  const res = await fetch('/api/types');
-  const types = await res.json();
+  const types = await Dictionary.types('wz');
 
   types.forEach(type => {
     const opt = document.createElement('option');
@@ -350,8 +349,12 @@ weaponTypeSelect.addEventListener('change', async () => {
 });
 
 async function loadModules(type) {
-  const res = await fetch(`/api/modules/${type}`);
-  const byCategory = await res.json(); // { category: Mod[] }
+  // { category: Mod[] } — из общего словаря; тип не из словаря грузим отдельно
+  let byCategory = await Dictionary.modules('wz', type);
+  if (!byCategory) {
+    const res = await fetch(`/api/modules/${type}`);
+    byCategory = await res.json();
+  }
 
   const byKey = {};
   const flat = [];
@@ -566,8 +569,7 @@ function getCategoryByModule(moduleKey, weaponType) {
 // (загружает список типов оружия и отрисовывает кнопки на экране screen-modules-types)
 async function loadWeaponTypesForModules() {
   try {
-    const res = await fetch('/api/types');
-    const types = await res.json();
+    const types = await Dictionary.types('wz');
     const list = document.getElementById('modules-types-grid');
     list.innerHTML = '';
 
@@ -630,6 +632,7 @@ async function loadModulesForType(weaponType, label) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ initData: tg.initData })
           });
+          Dictionary.invalidate();
           await loadModulesForType(weaponType, label);
         });
     
@@ -660,6 +663,7 @@ async function loadModulesForType(weaponType, label) {
           );
     
           alert(`Категория "${category}" успешно удалена ✅`);
+          Dictionary.invalidate();
           await loadModulesForType(weaponType, label);
     
         } catch (err) {
@@ -708,6 +712,7 @@ document.getElementById('mod-add-btn')?.addEventListener('click', async () => {
 
     // Очищаем поля
     ['mod-category', 'mod-en', 'mod-ru'].forEach(id => document.getElementById(id).value = '');
+    Dictionary.invalidate();
     await loadModules(payload.weapon_type); // обновим modulesByType
     await loadModulesForType(payload.weapon_type, weaponTypeLabels[payload.weapon_type] || payload.weapon_type); // перерисуем визуально
     rebuildModuleSelects(); // обновим выпадашки
@@ -841,7 +846,60 @@ async function loadBuilds(category = 'all') {
     return false;
   }
 
+  // Поиск идёт на сервере (/api/builds/search): страницы по релевантности
+  // с учётом ru-названий модулей. Локальный перебор ниже — запасной путь,
+  // если сервер недоступен.
+  const SEARCH_PAGE_SIZE = 30;
+  let searchTimer = null;
+  let searchSeq = 0;
+
+  async function searchBuildsOnServer(searchValue, shown = []) {
+    const seq = ++searchSeq;
+    const params = new URLSearchParams({
+      q: searchValue,
+      category: categoryFilter.value,
+      limit: SEARCH_PAGE_SIZE,
+      offset: shown.length
+    });
+    if (weaponFilter.value !== 'all') params.set('weapon_type', weaponFilter.value);
+
+    const res = await fetch(`/api/builds/search?${params}`);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const data = await res.json();
+    if (seq !== searchSeq) return;   // ответ на устаревший запрос
+
+    const found = shown.concat(data.items || []);
+    renderUserBuilds(found);
+    if (data.total > found.length) {
+      const more = document.createElement('button');
+      more.type = 'button';
+      more.className = 'btn';
+      more.textContent = `Показать ещё (${data.total - found.length})`;
+      more.addEventListener('click', () => {
+        more.disabled = true;
+        searchBuildsOnServer(searchValue, found).catch(() => { more.disabled = false; });
+      });
+      document.getElementById('builds-list').appendChild(more);
+    }
+  }
+
   function applyUserFilters() {
+    const searchValue = searchInput.value.toLowerCase().trim();
+    clearTimeout(searchTimer);
+    if (!searchValue) {
+      searchSeq++;   // ответы прежних запросов больше не нужны
+      applyLocalFilters();
+      return;
+    }
+    searchTimer = setTimeout(() => {
+      searchBuildsOnServer(searchValue).catch(e => {
+        console.error('Build search error:', e);
+        applyLocalFilters();
+      });
+    }, 200);
+  }
+
+  function applyLocalFilters() {
     const weaponValue = weaponFilter.value;
     const categoryValue = categoryFilter.value;
     const searchValue = searchInput.value.toLowerCase().trim();
@@ -1536,7 +1594,7 @@ document.getElementById('submit-admin-id')?.addEventListener('click', async () =
     const res = await fetch('/api/assign-admin', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ userId, requesterId: window.userInfo?.user_id })
+      body: JSON.stringify({ userId, initData: tg.initData })
     });
 
     const data = await res.json();
@@ -1608,7 +1666,7 @@ async function loadAdminList(requesterId) {
         const res = await fetch('/api/remove-admin', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ userId: id, requesterId })
+          body: JSON.stringify({ userId: id, initData: tg.initData })
         });
 
         const result = await res.json();
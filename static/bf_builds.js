@@ -89,8 +89,7 @@ document.addEventListener("click", (e) => {
    =============================== */
 async function bfLoadWeaponTypes() {
   try {
-    const res = await fetch("/data/types-bf.json");
-    const types = await res.json();
+    const types = await Dictionary.types("bf");
     const select = document.getElementById("bf-weapon-type");
     if (!select) return;
 
@@ -130,8 +129,7 @@ document.getElementById("bf-back-from-mod-list")?.addEventListener("click", () =
 // Загрузка типов оружия для справочника
 async function bfLoadWeaponTypesForModules() {
   try {
-    const res = await fetch("/data/types-bf.json");
-    const types = await res.json();
+    const types = await Dictionary.types("bf");
     const grid = document.getElementById("bf-modules-types-grid");
     grid.innerHTML = "";
 
@@ -181,6 +179,7 @@ async function bfLoadModulesList(weaponType, label) {
              })
            )
          );
+         Dictionary.invalidate();
          await bfLoadModulesList(weaponType, label);
        } catch (err) {
          console.error("Ошибка при удалении категории:", err);
@@ -204,6 +203,7 @@ async function bfLoadModulesList(weaponType, label) {
            headers: { "Content-Type": "application/json" },
            body: JSON.stringify({ initData: tg.initData }),
          });
+         Dictionary.invalidate();
          await bfLoadModulesList(weaponType, label);
        });
        grid.appendChild(card);
@@ -302,6 +302,7 @@ document.getElementById("bf-mod-add-btn")?.addEventListener("click", async () =>
     ["bf-mod-category", "bf-mod-en"].forEach(id => document.getElementById(id).value = "");
     document.getElementById("bf-mod-category-select").value = "";
 
+    Dictionary.invalidate();
     await bfLoadModulesList(payload.weapon_type, bfWeaponTypeLabels[payload.weapon_type]);
     await bfLoadModules(payload.weapon_type);
   } catch (e) {
@@ -318,8 +319,11 @@ async function bfLoadModules(type) {
     // Перед загрузкой очищаем старые данные
     delete bfModulesByType[type];
 
-    const res = await fetch(`/api/bf/modules/${type}`);
-    const byCategory = await res.json();
+    let byCategory = await Dictionary.modules("bf", type);
+    if (!byCategory) {
+      const res = await fetch(`/api/bf/modules/${type}`);
+      byCategory = await res.json();
+    }
     const byKey = {};
     const flat = [];
 
@@ -1322,13 +1326,39 @@ document.querySelectorAll('.js-loadout-toggle').forEach(header => {
 /* ===============================
    🧩 ФИЛЬТРЫ И ПОИСК
    =============================== */
+// Поиск идёт на сервере (/api/bf/builds/search, по релевантности);
+// локальный перебор bfCachedBuilds — запасной путь при ошибке сети.
+const BF_SEARCH_LIMIT = 100;
+let bfSearchTimer = null;
+let bfSearchSeq = 0;
+
 document.getElementById("bf-builds-search")?.addEventListener("input", () => {
-  bfFilterBuilds();
+  clearTimeout(bfSearchTimer);
+  bfSearchTimer = setTimeout(bfFilterBuilds, 200);
 });
 
 
-function bfFilterBuilds() {
-  const q = document.getElementById("bf-builds-search").value.toLowerCase();
+async function bfFilterBuilds() {
+  const q = document.getElementById("bf-builds-search").value.toLowerCase().trim();
+  const seq = ++bfSearchSeq;
+  if (!q) {
+    bfRenderBuilds(bfCachedBuilds);
+    return;
+  }
+  try {
+    const params = new URLSearchParams({ q, mode: currentBFMode, limit: BF_SEARCH_LIMIT });
+    const res = await fetch(`/api/bf/builds/search?${params}`);
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    const data = await res.json();
+    if (seq === bfSearchSeq) bfRenderBuilds(data.items || []);
+  } catch (e) {
+    console.error("BF build search error:", e);
+    if (seq === bfSearchSeq) bfFilterBuildsLocal(q);
+  }
+}
+
+
+function bfFilterBuildsLocal(q) {
   let filtered = bfCachedBuilds.filter((b) => {
     const text =
       (b.title || "") +
@@ -1478,8 +1508,7 @@ async function bfLoadBuildsTable() {
 
 async function bfLoadWeaponTypesForFilter() {
   try {
-    const res = await fetch("/data/types-bf.json");
-    const types = await res.json();
+    const types = await Dictionary.types("bf");
     const select = document.getElementById("bf-edit-type-filter");
     if (!select) return;
 
@@ -0,0 +1,72 @@
+// static/dictionary.js
+// Типы оружия и модули Warzone + BF одним запросом (/api/dictionary).
+// Ответ хранится в localStorage вместе с ETag: при следующем открытии
+// приложения данные берутся сразу из хранилища, а сервер только подтверждает,
+// что ревизия не изменилась (304, почти без трафика).
+// В пределах страницы запрос делается один раз; после правок модулей
+// вызывайте Dictionary.invalidate() — следующий load() перепроверит ревизию.
+const DICTIONARY_URL = '/api/dictionary';
+const DICTIONARY_STORAGE_KEY = 'nd-dictionary-v1';
+
+const Dictionary = {
+  pending: null,
+
+  readStored() {
+    try {
+      return JSON.parse(localStorage.getItem(DICTIONARY_STORAGE_KEY) || 'null');
+    } catch (e) {
+      return null;
+    }
+  },
+
+  store(etag, data) {
+    try {
+      localStorage.setItem(DICTIONARY_STORAGE_KEY, JSON.stringify({ etag, data }));
+    } catch (e) {
+      // хранилище переполнено или недоступно — просто работаем без него
+    }
+  },
+
+  async fetchFresh() {
+    const stored = this.readStored();
+    const headers = stored?.etag ? { 'If-None-Match': stored.etag } : {};
+    try {
+      const res = await fetch(DICTIONARY_URL, { headers, cache: 'no-cache' });
+      if (res.status === 304 && stored) return stored.data;
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const data = await res.json();
+      this.store(res.headers.get('ETag'), data);
+      return data;
+    } catch (e) {
+      console.error('Dictionary load error:', e);
+      if (stored) return stored.data;   // офлайн/ошибка — последняя сохранённая версия
+      throw e;
+    }
+  },
+
+  load() {
+    if (!this.pending) {
+      this.pending = this.fetchFresh().catch(e => {
+        this.pending = null;
+        throw e;
+      });
+    }
+    return this.pending;
+  },
+
+  invalidate() {
+    this.pending = null;
+  },
+
+  // game: 'wz' | 'bf'
+  async types(game) {
+    return (await this.load())[game]?.types || [];
+  },
+
+  // Сгруппированные модули типа; null — типа нет в словаре
+  async modules(game, type) {
+    return (await this.load())[game]?.modules?.[type] || null;
+  }
+};
+
+window.Dictionary = Dictionary;
@@ -0,0 +1,125 @@
+import sys
+import gzip
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:   # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+# =====================================================
+# 🧷 СТАТИКА С ОТПЕЧАТКАМИ (content hash) + immutable-кэш
+# =====================================================
+# При старте обходим static/ и считаем sha256 каждого файла. Шаблоны берут
+# адрес через asset_url('app.js') -> /assets/<digest>/app.js. Пока файл
+# не изменился, адрес тот же, и браузер/WebView берёт его из кэша без
+# запроса (Cache-Control: immutable на год). После деплоя меняется только
+# адрес изменённых файлов.
+# Текстовые файлы сжимаются один раз при сборке манифеста (gzip и, если
+# установлен пакет brotli, br) и отдаются по Accept-Encoding.
+# Запрос со старым digest (HTML из старой версии) получает текущий файл
+# без долгого кэша.
+
+STATIC_DIR = Path("static")
+ASSETS_PREFIX = "/assets"
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESSIBLE = {".js", ".css", ".svg", ".json", ".html", ".txt", ".map"}
+COMPRESS_MIN_SIZE = 512   # байт: меньше — сжатие не окупается
+
+
+class Asset:
+    __slots__ = ("path", "file", "digest", "media_type", "size", "gzip", "br")
+
+    def __init__(self, path: str, file: Path, digest: str, media_type: str, size: int):
+        self.path = path
+        self.file = file
+        self.digest = digest
+        self.media_type = media_type
+        self.size = size
+        self.gzip = None
+        self.br = None
+
+
+class AssetManifest:
+    def __init__(self, root: Path = STATIC_DIR, prefix: str = ASSETS_PREFIX):
+        self.root = Path(root)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._assets = None   # путь относительно static/ -> Asset
+
+    def build(self) -> dict:
+        """Пересчитать отпечатки и сжатые варианты всех файлов static/."""
+        assets = {}
+        for file in sorted(self.root.rglob("*")):
+            if not file.is_file() or file.name.startswith("."):
+                continue
+            data = file.read_bytes()
+            path = file.relative_to(self.root).as_posix()
+            media_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+            asset = Asset(path, file, hashlib.sha256(data).hexdigest()[:12], media_type, len(data))
+            if file.suffix.lower() in COMPRESSIBLE and len(data) >= COMPRESS_MIN_SIZE:
+                asset.gzip = gzip.compress(data, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    asset.br = brotli.compress(data, quality=11)
+            assets[path] = asset
+        with self._lock:
+            self._assets = assets
+        return assets
+
+    def _manifest(self) -> dict:
+        assets = self._assets
+        if assets is None:
+            with self._lock:
+                assets = self._assets
+            if assets is None:
+                assets = self.build()
+        return assets
+
+    def get(self, path: str):
+        return self._manifest().get(path.lstrip("/"))
+
+    def url(self, path: str) -> str:
+        """Адрес файла из static/ с отпечатком; неизвестный файл — обычный /static/-адрес."""
+        path = path.lstrip("/").removeprefix("static/")
+        asset = self._manifest().get(path)
+        if asset is None:
+            return f"/static/{path}"
+        return f"{self.prefix}/{asset.digest}/{path}"
+
+    def stats(self) -> dict:
+        assets = self._manifest()
+        return {
+            "files": len(assets),
+            "bytes": sum(a.size for a in assets.values()),
+            "gzip_bytes": sum(len(a.gzip) for a in assets.values() if a.gzip),
+            "br_bytes": sum(len(a.br) for a in assets.values() if a.br),
+            "brotli": brotli is not None,
+        }
+
+
+def pick_encoding(asset: Asset, accept_encoding: str):
+    """(кодировка, тело) по Accept-Encoding; (None, None) — отдавать файл как есть."""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if asset.br is not None and "br" in accepted:
+        return "br", asset.br
+    if asset.gzip is not None and "gzip" in accepted:
+        return "gzip", asset.gzip
+    return None, None
+
+
+assets = AssetManifest()
+
+
+if __name__ == "__main__":
+    # python static_assets.py — показать манифест и экономию на сжатии
+    for asset in assets.build().values():
+        sizes = [f"{asset.size}"]
+        if asset.gzip:
+            sizes.append(f"gz {len(asset.gzip)}")
+        if asset.br:
+            sizes.append(f"br {len(asset.br)}")
+        print(f"{assets.url(asset.path):60} {' / '.join(sizes)}")
+    print(assets.stats(), file=sys.stderr)
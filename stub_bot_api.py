@@ -0,0 +1,122 @@
+# =====================================================
+# 🧪 ЛОКАЛЬНАЯ ЗАГЛУШКА TELEGRAM BOT API (для проверки рассылок)
+# =====================================================
+# Отвечает на POST /bot<token>/sendMessage как Telegram:
+#   - больше --limit сообщений за секунду -> 429 с parameters.retry_after
+#   - с вероятностью --fail-rate -> 502 (временная ошибка)
+#   - chat_id из --blocked -> 403 "bot was blocked by the user"
+#
+#   python stub_bot_api.py --port 8081 --limit 30 --fail-rate 0.05 --blocked 13,666
+#   TELEGRAM_API_BASE=http://127.0.0.1:8081 uvicorn main:app
+#
+# В конце (Ctrl+C или kill) печатает, сколько сообщений доставлено каждому chat_id:
+# больше одного — повторная доставка.
+
+import sys
+import json
+import signal
+import time
+import random
+import argparse
+import threading
+from collections import Counter, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubState:
+    def __init__(self, limit: int, fail_rate: float, blocked: set, latency: float):
+        self.limit = limit
+        self.fail_rate = fail_rate
+        self.blocked = blocked
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.window = deque()          # время принятых запросов за последнюю секунду
+        self.delivered = Counter()     # chat_id -> сколько раз доставлено
+        self.stats = Counter()
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                payload = {}
+            if not self.path.endswith("/sendMessage"):
+                return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            if state.latency:
+                time.sleep(state.latency)
+
+            chat_id = str(payload.get("chat_id", ""))
+            with state.lock:
+                now = time.monotonic()
+                while state.window and state.window[0] < now - 1:
+                    state.window.popleft()
+                if len(state.window) >= state.limit:
+                    state.stats["429"] += 1
+                    return self._reply(429, {
+                        "ok": False, "error_code": 429,
+                        "description": "Too Many Requests: retry after 1",
+                        "parameters": {"retry_after": 1}
+                    })
+                state.window.append(now)
+
+                if random.random() < state.fail_rate:
+                    state.stats["502"] += 1
+                    return self._reply(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+                if chat_id in state.blocked:
+                    state.stats["403"] += 1
+                    return self._reply(403, {"ok": False, "error_code": 403,
+                                             "description": "Forbidden: bot was blocked by the user"})
+                state.delivered[chat_id] += 1
+                state.stats["200"] += 1
+
+            self._reply(200, {"ok": True, "result": {"message_id": state.stats["200"],
+                                                     "chat": {"id": chat_id}, "text": payload.get("text")}})
+
+    return Handler
+
+
+def _interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--limit", type=int, default=30, help="сообщений в секунду до 429")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 502")
+    parser.add_argument("--blocked", default="", help="chat_id через запятую -> 403")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    args = parser.parse_args(argv)
+
+    state = StubState(args.limit, args.fail_rate, set(filter(None, args.blocked.split(","))), args.latency)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+    print(f"🧪 Stub Bot API: http://127.0.0.1:{args.port}", flush=True)
+    # Итог печатается и по Ctrl+C, и по kill (SIGTERM), в т.ч. при запуске в фоне
+    signal.signal(signal.SIGINT, _interrupt)
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        duplicates = {k: v for k, v in state.delivered.items() if v > 1}
+        print(f"\nответы: {dict(state.stats)}; получателей: {len(state.delivered)}; повторных доставок: {len(duplicates)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
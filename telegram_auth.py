@@ -0,0 +1,129 @@
+import os
+import hmac
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+# =====================================================
+# 🔏 ПРОВЕРКА TELEGRAM WEBAPP initData (HMAC-SHA256)
+# =====================================================
+# https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+#   secret_key = HMAC_SHA256(key="WebAppData", msg=bot_token)
+#   hash       = hex(HMAC_SHA256(key=secret_key, msg=data_check_string))
+# data_check_string — все поля, кроме hash, «key=value», отсортированы по ключу, через \n.
+# initData старше INIT_DATA_MAX_AGE (auth_date) не принимается.
+#
+# Проверенный initData кэшируется по его hash (LRU + TTL): повторные запросы
+# той же сессии не разбирают строку и не считают HMAC — только сравнение строк.
+# Неудачные проверки не кэшируются.
+# INIT_DATA_VERIFY=0 отключает проверку подписи (локальный запуск без токена бота).
+
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))       # сек
+INIT_DATA_CACHE_TTL = int(os.getenv("INIT_DATA_CACHE_TTL", "300"))     # сек
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "5000"))
+INIT_DATA_VERIFY = os.getenv("INIT_DATA_VERIFY", "1") != "0"
+
+
+class InitDataVerifier:
+    def __init__(self, bot_token: str = None, max_age: int = INIT_DATA_MAX_AGE,
+                 ttl: int = INIT_DATA_CACHE_TTL, size: int = INIT_DATA_CACHE_SIZE,
+                 verify: bool = INIT_DATA_VERIFY):
+        self.max_age = max_age
+        self.ttl = ttl
+        self.size = size
+        self.verify_signature = verify
+        self._bot_token = bot_token
+        self._secret = None
+        self._secret_token = None
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # hash -> (initData, user, годен до)
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+    def _secret_key(self):
+        # Токен берётся при первой проверке: .env грузится после импорта модулей
+        token = self._bot_token or os.getenv("TOKEN")
+        if not token:
+            return None
+        if token != self._secret_token:
+            self._secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+            self._secret_token = token
+        return self._secret
+
+    def _check(self, init_data: str):
+        """Разбор + проверка подписи и возраста. Возвращает (hash, user, auth_date) или None."""
+        fields = dict(parse_qsl(init_data, keep_blank_values=True))
+        received_hash = fields.pop("hash", "")
+        if not received_hash or "user" not in fields:
+            return None
+
+        if self.verify_signature:
+            secret = self._secret_key()
+            if secret is None:
+                print("[initData] TOKEN не задан — проверка подписи невозможна")
+                return None
+            data_check_string = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+            expected = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, received_hash):
+                return None
+
+        try:
+            auth_date = int(fields.get("auth_date", 0))
+            user = json.loads(fields["user"])
+        except ValueError:
+            return None
+        if not isinstance(user, dict) or not user.get("id"):
+            return None
+        if self.max_age and time.time() - auth_date > self.max_age:
+            return None
+        return received_hash, user, auth_date
+
+    def verify(self, init_data: str):
+        """
+        Пользователь Telegram (dict из поля user) для подлинного initData, иначе None.
+        """
+        if not init_data or "hash=" not in init_data:
+            return None
+        now = time.time()
+
+        # Быстрый путь: тот же initData уже проверен
+        received_hash = None
+        for part in init_data.split("&"):
+            if part.startswith("hash="):
+                received_hash = part[5:]
+                break
+        with self._lock:
+            cached = self._cache.get(received_hash)
+            if cached and cached[2] > now and hmac.compare_digest(cached[0], init_data):
+                self._cache.move_to_end(received_hash)
+                self._stats["hits"] += 1
+                return cached[1]
+
+        checked = self._check(init_data)
+        with self._lock:
+            if checked is None:
+                self._stats["rejected"] += 1
+                return None
+            self._stats["misses"] += 1
+            received_hash, user, auth_date = checked
+            expires = now + self.ttl
+            if self.max_age:
+                expires = min(expires, auth_date + self.max_age)
+            self._cache[received_hash] = (init_data, user, expires)
+            self._cache.move_to_end(received_hash)
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return user
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "cached": len(self._cache)}
+
+
+init_data_auth = InitDataVerifier()
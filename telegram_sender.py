@@ -0,0 +1,156 @@
+import os
+import time
+import random
+import asyncio
+from dataclasses import dataclass
+
+import httpx
+
+# =====================================================
+# 📨 ОТПРАВКА СООБЩЕНИЙ В TELEGRAM (async, с лимитом скорости)
+# =====================================================
+# Один httpx.AsyncClient с пулом соединений на всю рассылку.
+# Token bucket держит скорость ниже лимита Telegram (~30 сообщений/сек на бота).
+# 429 -> ждём parameters.retry_after (пауза общая для всех отправок бота);
+# сетевые ошибки и 5xx -> повтор с экспоненциальной задержкой;
+# 400/403 (чат не найден, бот заблокирован) -> ошибка без повторов.
+# TELEGRAM_API_BASE позволяет направить отправку в локальную заглушку Bot API
+# (см. stub_bot_api.py).
+
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))             # сообщений/сек
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", "5"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))  # одновременных запросов
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))   # для сетевых ошибок/5xx
+BROADCAST_MAX_FLOOD_WAITS = 5                                          # для 429
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Flood control: никто не отправляет ближайшие seconds секунд."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class SendResult:
+    chat_id: str
+    ok: bool
+    error: str = ""
+    attempts: int = 0
+
+
+class TelegramSender:
+    """
+    async with TelegramSender(token) as sender:
+        result = await sender.send_message(chat_id, text)
+    """
+
+    def __init__(self, token: str, api_base: str = TELEGRAM_API_BASE, rate: float = BROADCAST_RATE,
+                 burst: int = BROADCAST_BURST, concurrency: int = BROADCAST_CONCURRENCY,
+                 max_retries: int = BROADCAST_MAX_RETRIES, timeout: float = 10.0):
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._client = None
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+        self._client = None
+
+    async def send_message(self, chat_id, text: str, parse_mode: str = "HTML") -> SendResult:
+        result = SendResult(chat_id=str(chat_id), ok=False)
+        failures = flood_waits = 0
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+
+        while True:
+            await self.bucket.acquire()
+            result.attempts += 1
+            try:
+                response = await self._client.post(self.url, json=payload)
+            except httpx.TransportError as e:
+                result.error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    result.ok, result.error = True, ""
+                    return result
+                result.error = response.text[:500]
+
+                if response.status_code == 429:
+                    flood_waits += 1
+                    if flood_waits > BROADCAST_MAX_FLOOD_WAITS:
+                        return result
+                    try:
+                        retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+                    except ValueError:
+                        retry_after = float(response.headers.get("Retry-After", 1))
+                    self.bucket.pause(retry_after)
+                    continue
+
+                if response.status_code < 500:
+                    return result   # 400/403: повтор не поможет
+
+            failures += 1
+            if failures > self.max_retries:
+                return result
+            await asyncio.sleep(min(30.0, 0.5 * 2 ** (failures - 1)) * (0.5 + random.random()))
+
+    async def send_many(self, chat_ids, text: str, on_result=None, parse_mode: str = "HTML"):
+        """
+        Отправка списку чатов воркерами (не больше concurrency запросов одновременно).
+        on_result(SendResult) — синхронный или async колбэк на каждый результат.
+        Возвращает (успешно, с ошибками).
+        """
+        queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+        counts = {"ok": 0, "failed": 0}
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self.send_message(chat_id, text, parse_mode)
+                counts["ok" if result.ok else "failed"] += 1
+                if on_result:
+                    ret = on_result(result)
+                    if asyncio.iscoroutine(ret):
+                        await ret
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()) or 1)))
+        return counts["ok"], counts["failed"]
@@ -0,0 +1,41 @@
+import time
+import asyncio
+
+import httpx
+
+import database
+import database_pool
+from database_async import run_db
+
+# Медленный запрос к БД не должен задерживать остальные запросы воркера:
+# run_db уводит его в пул потоков, event loop продолжает обслуживать других.
+
+SLOW_SECONDS = 1.0
+FAST_LIMIT = 0.25   # с большим запасом: без пула быстрый запрос ждал бы SLOW_SECONDS
+
+
+def test_fast_request_not_delayed_by_slow_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "builds.db")
+    import main
+    main.init_db()
+
+    async def scenario():
+        slow = asyncio.create_task(run_db(time.sleep, SLOW_SECONDS))
+        await asyncio.sleep(0.05)   # медленный «запрос» уже занял поток пула
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            started = time.perf_counter()
+            response = await client.get("/api/modules/search", params={"q": "ab"})
+            fast_elapsed = time.perf_counter() - started
+        slow_running = not slow.done()
+        await slow
+        return response, fast_elapsed, slow_running
+
+    try:
+        response, fast_elapsed, slow_running = asyncio.run(scenario())
+    finally:
+        database_pool.close_all()
+
+    assert response.status_code == 200
+    assert slow_running, "медленный запрос закончился раньше быстрого — тест ничего не проверил"
+    assert fast_elapsed < FAST_LIMIT, f"быстрый запрос ждал {fast_elapsed:.3f} с"